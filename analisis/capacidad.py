@@ -0,0 +1,369 @@
+# -*- coding: utf-8 -*-
+"""
+Planificación de capacidad: cuánta memoria necesita cada carga.
+
+Las celdas de la matriz corren todas con maxmemory 100mb, así que las de
+500k/1M miden sobre todo desalojo. Este script carga el dataset de una carga
+de a tramos crecientes (--tramos, en entradas) en un Redis sin maxmemory y
+en cada tramo toma:
+  - used_memory, used_memory_dataset y used_memory_overhead de INFO memory
+    (como deltas respecto de la base vacía)
+  - MEMORY USAGE y OBJECT ENCODING de cada estructura: las de una sola clave
+    (ZSET del ranking, la cola, el stream) enteras con SAMPLES 0; las de una
+    clave por entrada (HASH de artículos y tickets, buckets, índices) sobre
+    una muestra de --muestras claves, extrapolada a todas
+
+Estructuras de cada carga:
+  ranking  articulos (HASH article:hn:* o buckets) y ranking (ZSET ranking_articles)
+  queue    tickets (HASH ticket:tkt:*) y cola (LIST tickets_queue o ZSET tickets_pq)
+  stream   stream (user_activity_stream) e indices (actividad:*, con --indexado)
+
+Con los tramos ajusta bytes = overhead + bytes_por_entrada * entradas por
+estructura y encoding (cada encoding es un régimen con su propia recta: un
+ZSET chico es listpack y uno grande skiplist), y used_memory total sobre los
+tramos del último régimen. Con eso proyecta, para cada tamaño objetivo
+(--objetivos, por defecto los datasets de la matriz), el maxmemory necesario
+(más --margen para fragmentación y buffers) y a partir de cuántas entradas
+empieza el desalojo (u OOM con noeviction) con el --maxmemory de la matriz.
+
+Escribe una fila por tramo en out_csv y la previsión en {out_csv}_prevision.csv.
+Vacía la base con FLUSHDB: usar una instancia de prueba.
+
+Uso:
+  python analisis/capacidad.py ranking ranking/hacker_news.csv capacidad.csv
+  python analisis/capacidad.py ranking ranking/hacker_news.csv capacidad.csv --layout bucket
+  python analisis/capacidad.py queue queue/customer_support_tickets.csv capacidad.csv
+  python analisis/capacidad.py stream "userActivity/*.json.gz" capacidad.csv --indexado
+"""
+
+import argparse
+import os
+import sys
+from datetime import datetime
+
+import redis
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from comun import conexion, estadistica
+from comun.conexion import texto
+from comun.resultados import escribir_fila
+from comun.scripts import RAIZ, importar_script
+
+sys.path.append(os.path.join(RAIZ, "ranking"))
+sys.path.append(os.path.join(RAIZ, "userActivity"))
+sys.path.append(os.path.join(RAIZ, "orquestador"))
+import almacenamiento
+import indices
+import ingesta
+from matriz import DATASETS, POLITICAS
+
+# Unidades de redis.conf: k/m/g son potencias de 1000, kb/mb/gb de 1024
+UNIDADES = {"": 1, "b": 1, "k": 1000, "kb": 1024, "m": 1000 ** 2, "mb": 1024 ** 2,
+            "g": 1000 ** 3, "gb": 1024 ** 3}
+
+
+def a_bytes(valor):
+    """'100mb' -> 104857600."""
+    v = str(valor).strip().lower()
+    numero = v.rstrip("kmgb")
+    return int(float(numero) * UNIDADES[v[len(numero):]])
+
+
+def mb(n):
+    return f"{n / 1024 ** 2:.1f}"
+
+
+def configuracion(args):
+    """Columnas que distinguen corridas de una misma carga."""
+    if args.carga == "ranking":
+        return {"layout": args.layout,
+                "tam_bucket": args.tam_bucket if args.layout == "bucket" else ""}
+    if args.carga == "queue":
+        return {"cola": args.cola}
+    return {"indexado": "si" if args.indexado else "no"}
+
+
+def fuente(args, r):
+    """(entradas, escribir): generador de las entradas del dataset en el orden
+    de los benchmarks y la función que encola una entrada en un pipeline con
+    los mismos comandos que usa la carga del benchmark."""
+    n = max(args.tramos)
+    if args.carga == "ranking":
+        ranking = importar_script("ranking/test_redis.py", "ranking_test_redis")
+        if args.layout == "bucket":
+            almacenamiento.configurar_listpack(r, args.tam_bucket)
+        almacenamiento.guardar_layout(r, args.layout, args.tam_bucket)
+
+        def escribir(pipe, entrada):
+            article_id, pts, campos = entrada
+            pipe.zadd("ranking_articles", {article_id: pts})
+            almacenamiento.escribir(pipe, article_id, campos, args.layout, args.tam_bucket)
+
+        return ranking.generar_articulos(ranking.preparar_articulos(args.datos), n), escribir
+
+    if args.carga == "queue":
+        cola = importar_script("queue/test_redis.py", "queue_test_redis")
+
+        def tickets():
+            for primer_n, filas in cola.cargar_tickets(args.datos, n):
+                for i, fila in enumerate(filas):
+                    yield f"tkt:{primer_n + i}", fila
+
+        def escribir(pipe, entrada):
+            cola.encolar_ticket(pipe, *entrada, args.cola)
+
+        return tickets(), escribir
+
+    ids = indices.IdsPorFecha() if args.indexado else None
+    tablas = ingesta.preparar_cache(ingesta.resolver_archivos(args.datos),
+                                    os.cpu_count() or 1, n)
+
+    def eventos():
+        for chunk in ingesta.chunks_cache(tablas):
+            yield from chunk
+
+    def escribir(pipe, entrada):
+        indices.encolar(pipe, *entrada, ids)
+
+    return eventos(), escribir
+
+
+def estructuras(args):
+    """[(nombre, clave o patrón, es_patron)] de la carga."""
+    if args.carga == "ranking":
+        return [("articulos", almacenamiento.patron_claves(args.layout), True),
+                ("ranking", "ranking_articles", False)]
+    if args.carga == "queue":
+        cola = importar_script("queue/test_redis.py", "queue_test_redis")
+        return [("tickets", "ticket:*", True),
+                ("cola", cola.COLA_PRIORIDAD if args.cola == "prioridad" else cola.COLA, False)]
+    res = [("stream", indices.STREAM, False)]
+    if args.indexado:
+        res.append(("indices", indices.PATRON, True))
+    return res
+
+
+def medir_estructura(r, clave, es_patron, muestras=200):
+    """(claves, bytes, encoding) de una estructura. Con patrón, los bytes son
+    el promedio de MEMORY USAGE de las primeras `muestras` claves del SCAN
+    (en orden de hash, o sea al azar) por la cantidad de claves, y el
+    encoding el más común de la muestra. Las claves temporales de las
+    consultas (actividad:tmp:*) no se cuentan."""
+    if not es_patron:
+        if not r.exists(clave):
+            return 0, 0, ""
+        return 1, r.memory_usage(clave, samples=0) or 0, texto(r.object("encoding", clave))
+    total, cursor, muestra = 0, 0, []
+    while True:
+        cursor, claves = r.scan(cursor, match=clave, count=10000)
+        claves = [c for c in claves if not texto(c).startswith(indices.PREFIJO_TMP)]
+        total += len(claves)
+        muestra += claves[:muestras - len(muestra)]
+        if cursor == 0:
+            break
+    if not muestra:
+        return 0, 0, ""
+    pipe = r.pipeline(transaction=False)
+    for c in muestra:
+        pipe.memory_usage(c, samples=0)
+        pipe.object("encoding", c)
+    res = pipe.execute()
+    tamanios = [t or 0 for t in res[::2]]
+    conteo = {}
+    for e in res[1::2]:
+        conteo[texto(e)] = conteo.get(texto(e), 0) + 1
+    return total, round(sum(tamanios) / len(tamanios) * total), max(conteo, key=conteo.get)
+
+
+def medir_tramo(r, n, base, estructs, muestras):
+    info = r.info("memory")
+    fila = {
+        "entradas": n,
+        "used_memory": info["used_memory"],
+        "memoria_carga": info["used_memory"] - base["used_memory"],
+        "dataset_bytes": info["used_memory_dataset"] - base["used_memory_dataset"],
+        "overhead_bytes": info["used_memory_overhead"] - base["used_memory_overhead"],
+        "rss_bytes": info["used_memory_rss"],
+        "claves": r.dbsize(),
+    }
+    for nombre, clave, es_patron in estructs:
+        claves, bytes_, encoding = medir_estructura(r, clave, es_patron, muestras)
+        fila[f"{nombre}_claves"] = claves
+        fila[f"{nombre}_bytes"] = bytes_
+        fila[f"{nombre}_encoding"] = encoding
+        fila[f"{nombre}_bytes_entrada"] = f"{bytes_ / n:.1f}"
+    return fila
+
+
+def cargar_tramos(r, args, estructs):
+    """Carga las entradas de a lotes en un pipeline y mide al llegar a cada
+    tramo. Devuelve las filas medidas (si el dataset se termina antes del
+    último tramo, el último punto es lo que se llegó a cargar)."""
+    entradas, escribir = fuente(args, r)
+    base = r.info("memory")
+    tramos = sorted(set(args.tramos))
+    pipe = r.pipeline(transaction=False)
+    puntos, n, pendientes = [], 0, 0
+
+    def enviar():
+        errores = [x for x in pipe.execute(raise_on_error=False)
+                   if isinstance(x, redis.RedisError)]
+        if errores:
+            print(f"ERROR al cargar ({len(errores)} comandos del lote):", errores[0])
+
+    def medir():
+        fila = medir_tramo(r, n, base, estructs, args.muestras)
+        puntos.append(fila)
+        print(f"{n:>10} entradas: used_memory +{mb(fila['memoria_carga'])} MB "
+              f"({fila['memoria_carga'] / n:.1f} B/entrada) | "
+              + " | ".join(f"{e} {fila[f'{e}_encoding']} {fila[f'{e}_bytes_entrada']} B"
+                           for e, _, _ in estructs))
+
+    for entrada in entradas:
+        escribir(pipe, entrada)
+        n += 1
+        pendientes += 1
+        if pendientes >= args.lote or n == tramos[len(puntos)]:
+            enviar()
+            pendientes = 0
+        if n == tramos[len(puntos)]:
+            medir()
+            if len(puntos) == len(tramos):
+                break
+    if pendientes:
+        enviar()
+    if n and (not puntos or puntos[-1]["entradas"] != n):
+        print(f"WARNING: el dataset se terminó en {n} entradas, antes del tramo {tramos[len(puntos)]}")
+        medir()
+    return puntos
+
+
+def ajustar(puntos, estructs):
+    """Rectas bytes = overhead + bytes_por_entrada * entradas por estructura y
+    encoding, más las del total sobre los tramos del último régimen (todas
+    las estructuras con el encoding del último tramo). Devuelve
+    (rectas, {estructura: recta del último régimen}, {métrica: recta total})."""
+    rectas, finales = [], {}
+    for nombre, _, _ in estructs:
+        grupos = {}
+        for p in puntos:
+            if p[f"{nombre}_encoding"]:
+                grupos.setdefault(p[f"{nombre}_encoding"], []).append(p)
+        for encoding, ps in grupos.items():
+            a, b, r2 = estadistica.ajuste_lineal([p["entradas"] for p in ps],
+                                                 [p[f"{nombre}_bytes"] for p in ps])
+            recta = {"estructura": nombre, "encoding": encoding, "tramos": len(ps),
+                     "desde": ps[0]["entradas"], "hasta": ps[-1]["entradas"],
+                     "overhead": a, "por_entrada": b, "r2": r2}
+            rectas.append(recta)
+            if encoding == puntos[-1][f"{nombre}_encoding"]:
+                finales[nombre] = recta
+
+    regimen = [p for p in puntos
+               if all(p[f"{e}_encoding"] == puntos[-1][f"{e}_encoding"] for e, _, _ in estructs)]
+    totales = {}
+    for metrica in ("used_memory", "dataset_bytes", "overhead_bytes"):
+        a, b, r2 = estadistica.ajuste_lineal([p["entradas"] for p in regimen],
+                                             [p[metrica] for p in regimen])
+        totales[metrica] = {"estructura": metrica, "encoding": "", "tramos": len(regimen),
+                            "desde": regimen[0]["entradas"], "hasta": regimen[-1]["entradas"],
+                            "overhead": a, "por_entrada": b, "r2": r2}
+    return rectas, finales, totales
+
+
+def prever(recta, n):
+    return recta["overhead"] + recta["por_entrada"] * n
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Curvas de bytes por entrada y maxmemory necesario por carga")
+    parser.add_argument("carga", choices=["ranking", "queue", "stream"])
+    parser.add_argument("datos", help="CSV de la carga (ranking/queue) o archivos .json.gz (stream)")
+    parser.add_argument("out_csv", help="CSV con una fila por tramo")
+    parser.add_argument("--tramos", default="1000,10000,25000,50000,100000,200000",
+                        help="cantidades de entradas en las que se mide, separadas por coma")
+    parser.add_argument("--objetivos", default=",".join(str(n) for n in DATASETS.values()),
+                        help="tamaños de dataset para los que se proyecta el maxmemory")
+    parser.add_argument("--maxmemory", default=dict(POLITICAS["noeviction"])["maxmemory"],
+                        help="maxmemory de la matriz, para estimar dónde empieza el desalojo")
+    parser.add_argument("--margen", type=float, default=0.1,
+                        help="fracción que se suma a used_memory para fragmentación y buffers")
+    parser.add_argument("--muestras", type=int, default=200,
+                        help="claves muestreadas con MEMORY USAGE en las estructuras de "
+                             "una clave por entrada")
+    parser.add_argument("--lote", type=int, default=1000, help="comandos por pipeline")
+    parser.add_argument("--layout", choices=["hash", "bucket"], default="hash",
+                        help="(ranking) layout de los artículos")
+    parser.add_argument("--tam-bucket", type=int, default=16,
+                        help="(ranking) artículos por bucket con --layout bucket")
+    parser.add_argument("--cola", choices=["lista", "prioridad"], default="lista",
+                        help="(queue) LIST o ZSET de prioridad")
+    parser.add_argument("--indexado", action="store_true",
+                        help="(stream) ids por fecha e índices secundarios")
+    conexion.agregar_argumentos(parser)
+    args = parser.parse_args()
+    args.tramos = [int(x) for x in args.tramos.split(",")]
+    objetivos = [int(x) for x in args.objetivos.split(",")]
+    maxmemory = a_bytes(args.maxmemory)
+
+    r = conexion.control(conexion.conectar(conexion.opciones(args)))
+    print(f"Conexión: {conexion.describir(r)}")
+    estructs = estructuras(args)
+    config = configuracion(args)
+    fecha = datetime.now().isoformat(timespec="seconds")
+
+    r.flushdb()
+    previo = r.config_get("maxmemory")["maxmemory"]
+    r.config_set("maxmemory", 0)
+    try:
+        puntos = cargar_tramos(r, args, estructs)
+    finally:
+        r.config_set("maxmemory", previo)
+    if not puntos:
+        sys.exit("No se cargó ninguna entrada")
+    for p in puntos:
+        escribir_fila(args.out_csv, {"fecha": fecha, "carga": args.carga, **config, **p})
+
+    rectas, finales, totales = ajustar(puntos, estructs)
+    print("\n=== Ajustes bytes = overhead + bytes_por_entrada * entradas ===")
+    for recta in rectas + list(totales.values()):
+        print(f"{recta['estructura']:<15} {recta['encoding']:<10} "
+              f"[{recta['desde']}..{recta['hasta']}, {recta['tramos']} tramos] "
+              f"overhead {recta['overhead']:>12.0f} B, {recta['por_entrada']:>8.1f} B/entrada, "
+              f"r2 {recta['r2']:.4f}")
+
+    total = totales["used_memory"]
+    desalojo = ((maxmemory - total["overhead"]) / total["por_entrada"]
+                if total["por_entrada"] > 0 else float("inf"))
+    print(f"\nCon maxmemory {args.maxmemory} ({maxmemory} B) el desalojo (u OOM con "
+          f"noeviction) empieza cerca de {desalojo:.0f} entradas")
+    print("=== Previsión ===")
+    prevision = os.path.splitext(args.out_csv)[0] + "_prevision.csv"
+    for objetivo in objetivos:
+        usada = prever(total, objetivo)
+        necesario = usada * (1 + args.margen)
+        extrapolado = objetivo > puntos[-1]["entradas"]
+        print(f"{objetivo:>10} entradas: used_memory {mb(usada)} MB, maxmemory "
+              f"{mb(necesario)} MB (+{args.margen:.0%})"
+              + (" (extrapolado)" if extrapolado else "")
+              + (f" | excede {args.maxmemory}" if usada > maxmemory else ""))
+        escribir_fila(prevision, {
+            "fecha": fecha, "carga": args.carga, **config,
+            "objetivo": objetivo,
+            "used_memory_previsto": round(usada),
+            "maxmemory_necesario": round(necesario),
+            "maxmemory_necesario_mb": mb(necesario),
+            "margen": args.margen,
+            **{f"{e}_bytes": round(prever(recta, objetivo)) for e, recta in finales.items()},
+            **{f"{e}_bytes_entrada": f"{recta['por_entrada']:.1f}" for e, recta in finales.items()},
+            "maxmemory_matriz": maxmemory,
+            "desalojo_desde": round(desalojo) if desalojo != float("inf") else "",
+            "r2": f"{total['r2']:.4f}",
+            "extrapolado": "si" if extrapolado else "no",
+        })
+    print(f"Tramos en {args.out_csv}, previsión en {prevision}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+Compara dos CSV de resultados (o el mismo CSV en dos revisiones de git) y
+marca las regresiones de throughput/latencia estadísticamente significativas
+por celda (modo, politica, dataset).
+
+Las filas de cada celda son las repeticiones (orquestador --repeticiones K);
+la diferencia de medias se prueba con el test t de Welch. Con menos de 2
+repeticiones de un lado no hay test y solo se muestra la diferencia.
+
+Uso:
+  python analisis/comparar.py base.csv nuevo.csv
+  python analisis/comparar.py --git HEAD~1 HEAD queue/resultados.csv --por consumidores
+  python analisis/comparar.py base.csv nuevo.csv --filtro layout=bucket --metricas throughput
+
+Sale con código 1 si encontró alguna regresión significativa.
+"""
+
+import argparse
+import csv
+import io
+import os
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from comun import estadistica
+from comun.scripts import RAIZ
+
+
+def leer_csv(ruta, revision=None):
+    """Filas del CSV en disco o, con `revision`, tal como estaba en ese commit."""
+    if revision is None:
+        with open(ruta, newline="") as f:
+            return list(csv.DictReader(f))
+    relativa = os.path.relpath(os.path.abspath(ruta), RAIZ)
+    texto = subprocess.run(["git", "show", f"{revision}:{relativa}"], cwd=RAIZ,
+                           check=True, capture_output=True, text=True).stdout
+    return list(csv.DictReader(io.StringIO(texto)))
+
+
+def filtrar(filas, filtros):
+    for f in filtros:
+        columna, valor = f.split("=", 1)
+        filas = [fila for fila in filas if fila.get(columna, "") == valor]
+    return filas
+
+
+def comparar(base, nuevo, claves, metricas, alfa):
+    """Lista de dicts con la comparación de cada (celda, métrica) presente en ambos."""
+    grupos_base = estadistica.agrupar(base, claves)
+    grupos_nuevo = estadistica.agrupar(nuevo, claves)
+    res = []
+    for clave, filas_nuevo in grupos_nuevo.items():
+        filas_base = grupos_base.get(clave)
+        if not filas_base:
+            continue
+        for metrica in metricas:
+            a = estadistica.valores(filas_base, metrica)
+            b = estadistica.valores(filas_nuevo, metrica)
+            if not a or not b:
+                continue
+            ma, mb = estadistica.media(a), estadistica.media(b)
+            delta = (mb - ma) / ma * 100 if ma else float("nan")
+            _, _, p = estadistica.welch(a, b)
+            peor = mb < ma if estadistica.mayor_es_mejor(metrica) else mb > ma
+            if p != p:  # nan: sin repeticiones suficientes
+                veredicto = "n<2"
+            elif p < alfa:
+                veredicto = "REGRESIÓN" if peor else "mejora"
+            else:
+                veredicto = ""
+            res.append({"celda": clave, "metrica": metrica, "n_base": len(a),
+                        "n_nuevo": len(b), "base": ma, "nuevo": mb, "delta": delta,
+                        "p": p, "veredicto": veredicto})
+    return res
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compara dos CSV de resultados y marca regresiones significativas")
+    parser.add_argument("base", help="CSV base (o revisión base con --git)")
+    parser.add_argument("nuevo", help="CSV nuevo (o revisión nueva con --git)")
+    parser.add_argument("csv", nargs="?", help="con --git: CSV a comparar entre las dos revisiones")
+    parser.add_argument("--git", action="store_true",
+                        help="base y nuevo son revisiones de git (usar WORKTREE para el archivo en disco)")
+    parser.add_argument("--por", default="",
+                        help="columnas extra que distinguen celdas (ej: consumidores,layout o "
+                             "transporte,resp,parser)")
+    parser.add_argument("--metricas", default="",
+                        help="métricas a comparar (default: throughput, *_ms y tamaños)")
+    parser.add_argument("--filtro", action="append", default=[],
+                        help="columna=valor para quedarse con un subconjunto de filas")
+    parser.add_argument("--alfa", type=float, default=0.05, help="nivel de significación")
+    parser.add_argument("--todas", action="store_true",
+                        help="muestra también las comparaciones sin diferencia significativa")
+    args = parser.parse_args()
+
+    if args.git:
+        if not args.csv:
+            parser.error("con --git hay que indicar el CSV")
+        base = leer_csv(args.csv, args.base)
+        nuevo = leer_csv(args.csv, None if args.nuevo == "WORKTREE" else args.nuevo)
+    else:
+        base, nuevo = leer_csv(args.base), leer_csv(args.nuevo)
+    base, nuevo = filtrar(base, args.filtro), filtrar(nuevo, args.filtro)
+
+    claves = estadistica.DIMENSIONES + [c for c in args.por.split(",") if c]
+    if args.metricas:
+        metricas = args.metricas.split(",")
+    else:
+        columnas = list(nuevo[0]) if nuevo else []
+        metricas = [c for c in columnas if estadistica.es_metrica(c)]
+
+    filas = comparar(base, nuevo, claves, metricas, args.alfa)
+    mostradas = [f for f in filas if args.todas or f["veredicto"] not in ("", "n<2")]
+    print(f"{len(filas)} comparaciones ({'/'.join(claves)} x métrica), alfa = {args.alfa}")
+    for f in mostradas:
+        print(f"{' '.join(f['celda']):<40} {f['metrica']:<16} "
+              f"{f['base']:>12.3f} -> {f['nuevo']:>12.3f} ({f['delta']:+6.1f}%) "
+              f"n={f['n_base']}/{f['n_nuevo']} p={f['p']:.4f} {f['veredicto']}")
+
+    regresiones = [f for f in filas if f["veredicto"] == "REGRESIÓN"]
+    sin_test = sum(f["veredicto"] == "n<2" for f in filas)
+    print(f"Regresiones significativas: {len(regresiones)}"
+          + (f" | {sin_test} comparaciones sin repeticiones suficientes" if sin_test else ""))
+    sys.exit(1 if regresiones else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+"""Código compartido por los benchmarks de queue, ranking y userActivity."""
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+Cache columnar de los datasets ya preprocesados.
+
+Cada celda de la matriz volvía a hacer pd.read_csv, rellenar nulos y expandir
+versiones (o gunzip + json.loads del GH Archive). Acá eso se hace una sola vez
+y el resultado queda en disco en columnas:
+
+  <col>.npy                      columnas numéricas (np.load con mmap)
+  <col>.offsets.npy + <col>.heap columnas de texto: offsets int64 (n+1) y
+                                 los bytes UTF-8 concatenados (mmap)
+  meta.json                      columnas, tipos, filas y datos extra
+
+El directorio se identifica por el sha1 del/los archivo(s) de origen y los
+parámetros del preprocesamiento, así que si cambia el CSV se regenera solo.
+Se abre con mmap: no se copia nada a memoria hasta que se lee una fila.
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from comun.scripts import RAIZ
+
+DIR_CACHE = os.environ.get("BDNR_CACHE", os.path.join(RAIZ, ".cache_datos"))
+
+
+def _sha1_archivo(ruta):
+    """sha1 del contenido, memorizado por (ruta, tamaño, mtime) para no
+    releer archivos grandes en cada celda."""
+    st = os.stat(ruta)
+    firma = [os.path.abspath(ruta), st.st_size, st.st_mtime_ns]
+    memo = os.path.join(DIR_CACHE, "huellas",
+                        hashlib.sha1(firma[0].encode()).hexdigest() + ".json")
+    try:
+        with open(memo) as f:
+            guardada = json.load(f)
+        if guardada["firma"] == firma:
+            return guardada["sha1"]
+    except (OSError, ValueError, KeyError):
+        pass
+
+    h = hashlib.sha1()
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(1 << 20), b""):
+            h.update(bloque)
+    os.makedirs(os.path.dirname(memo), exist_ok=True)
+    tmp = memo + f".{os.getpid()}"
+    with open(tmp, "w") as f:
+        json.dump({"firma": firma, "sha1": h.hexdigest()}, f)
+    os.replace(tmp, memo)
+    return h.hexdigest()
+
+
+def ruta_cache(nombre, rutas, parametros):
+    """Directorio de la cache para estos archivos de origen y parámetros."""
+    h = hashlib.sha1()
+    for ruta in rutas:
+        h.update(_sha1_archivo(ruta).encode())
+    h.update(json.dumps(parametros, sort_keys=True).encode())
+    return os.path.join(DIR_CACHE, f"{nombre}-{h.hexdigest()[:16]}")
+
+
+def guardar(directorio, columnas, meta=None):
+    """Escribe `columnas` (nombre -> lista de str o array numérico). Se arma
+    en un directorio temporal y se renombra, así dos celdas que generan la
+    misma cache a la vez no se pisan."""
+    os.makedirs(DIR_CACHE, exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=DIR_CACHE, prefix=".tmp-")
+    tipos = {}
+    filas = None
+    for nombre, valores in columnas.items():
+        if isinstance(valores, np.ndarray) and valores.dtype.kind in "iuf":
+            np.save(os.path.join(tmp, f"{nombre}.npy"), valores)
+            tipos[nombre] = "num"
+        else:
+            codificados = [str(v).encode("utf-8") for v in valores]
+            offsets = np.zeros(len(codificados) + 1, dtype=np.int64)
+            np.cumsum([len(b) for b in codificados], out=offsets[1:])
+            np.save(os.path.join(tmp, f"{nombre}.offsets.npy"), offsets)
+            with open(os.path.join(tmp, f"{nombre}.heap"), "wb") as f:
+                f.write(b"".join(codificados))
+            tipos[nombre] = "texto"
+        filas = len(valores)
+    with open(os.path.join(tmp, "meta.json"), "w") as f:
+        json.dump({"columnas": tipos, "filas": filas or 0, **(meta or {})}, f)
+    try:
+        os.rename(tmp, directorio)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)  # otro proceso la generó primero
+
+
+def obtener(nombre, rutas, parametros, construir):
+    """TablaColumnar para (rutas, parametros). Si no está en cache llama a
+    construir() -> (columnas, meta) y la guarda."""
+    directorio = ruta_cache(nombre, rutas, parametros)
+    if not os.path.isdir(directorio):
+        t0 = time.time()
+        columnas, meta = construir()
+        guardar(directorio, columnas, meta)
+        print(f"Cache {os.path.basename(directorio)} generada en {time.time() - t0:.1f}s")
+    return TablaColumnar(directorio)
+
+
+class ColumnaTexto:
+    """Columna de strings sobre el heap mapeado en memoria."""
+
+    def __init__(self, offsets, ruta_heap):
+        self.offsets = offsets
+        if os.path.getsize(ruta_heap) == 0:
+            self.heap = b""
+        else:
+            with open(ruta_heap, "rb") as f:
+                self.heap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.heap[self.offsets[i]:self.offsets[i + 1]].decode("utf-8")
+
+    def rebanada(self, inicio, fin):
+        """Lista de str de las filas [inicio, fin)."""
+        off = self.offsets[inicio:fin + 1].tolist()
+        heap = self.heap
+        return [heap[a:b].decode("utf-8") for a, b in zip(off, off[1:])]
+
+
+class TablaColumnar:
+
+    def __init__(self, directorio):
+        self.directorio = directorio
+        with open(os.path.join(directorio, "meta.json")) as f:
+            self.meta = json.load(f)
+        self._columnas = {}
+
+    def __len__(self):
+        return self.meta["filas"]
+
+    def __getitem__(self, nombre):
+        """np.ndarray (mmap) para columnas numéricas, ColumnaTexto para texto."""
+        if nombre not in self._columnas:
+            base = os.path.join(self.directorio, nombre)
+            if self.meta["columnas"][nombre] == "num":
+                col = np.load(base + ".npy", mmap_mode="r")
+            else:
+                col = ColumnaTexto(np.load(base + ".offsets.npy", mmap_mode="r"), base + ".heap")
+            self._columnas[nombre] = col
+        return self._columnas[nombre]
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+Conexión a Redis compartida por los benchmarks.
+
+En lugar de `redis.Redis(host, port, decode_responses=True)` fijo, cada
+script arma el cliente con las opciones de la línea de comandos:
+
+  --transporte tcp|unix    TCP (host/puerto) o socket Unix (--socket)
+  --resp 2|3               versión del protocolo (HELLO 3 al conectar)
+  --parser auto|hiredis|python
+                           parser de respuestas; auto usa hiredis si está instalado
+  --decodificar si|no      respuestas como str o como bytes
+  --conexiones pool|unica  ConnectionPool (se toma y devuelve una conexión por
+                           comando) o una sola conexión fija del cliente
+
+conectar_async() arma el cliente de redis.asyncio con las mismas opciones
+(lo usa el generador open-loop).
+
+Las opciones efectivas (el parser que quedó en uso, no el pedido) van como
+columnas al CSV de resultados, para separar cuánto de la latencia medida es
+del stack del cliente y cuánto de Redis.
+
+Sin decodificar, las respuestas que el benchmark usa para armar claves o
+leer campos pasan por texto() / campo(); el resto queda en bytes. Lo que no
+es parte de la medición (métricas, consultas de verificación) puede usar
+control(r), que decodifica siempre.
+"""
+
+import redis
+import redis.asyncio as aioredis
+from redis.asyncio import connection as aioconexion
+from redis.connection import DefaultParser, _HiredisParser, _RESP2Parser, _RESP3Parser
+from redis.utils import HIREDIS_AVAILABLE
+
+TRANSPORTES = ["tcp", "unix"]
+PARSERS = ["auto", "hiredis", "python"]
+CONEXIONES = ["pool", "unica"]
+
+# Columnas que agrega cada benchmark a su CSV (dimensiones de la matriz)
+COLUMNAS = ["transporte", "resp", "parser", "decodificar", "conexiones"]
+
+
+def agregar_argumentos(parser, pool=True):
+    """Agrega el grupo de opciones de conexión; con `pool` False no agrega
+    --conexiones (el script fija sus propias conexiones)."""
+    grupo = parser.add_argument_group("conexión")
+    grupo.add_argument("--host", default="localhost", help="host de Redis")
+    grupo.add_argument("--puerto", type=int, default=6380, help="puerto de Redis")
+    grupo.add_argument("--transporte", choices=TRANSPORTES, default="tcp",
+                       help="tcp (host/puerto) o unix (--socket)")
+    grupo.add_argument("--socket", default="/tmp/redis.sock",
+                       help="ruta del socket Unix de Redis (con --transporte unix)")
+    grupo.add_argument("--resp", type=int, choices=[2, 3], default=2,
+                       help="versión del protocolo RESP")
+    grupo.add_argument("--parser", choices=PARSERS, default="auto",
+                       help="parser de respuestas (auto: hiredis si está instalado)")
+    grupo.add_argument("--decodificar", choices=["si", "no"], default="si",
+                       help="respuestas decodificadas a str o crudas en bytes")
+    if pool:
+        grupo.add_argument("--conexiones", choices=CONEXIONES, default="pool",
+                           help="pool: ConnectionPool; unica: una conexión fija por cliente")
+
+
+def opciones(args):
+    """dict de opciones (picklable, para pasar a workers) desde los argumentos."""
+    return {
+        "transporte": args.transporte, "host": args.host, "puerto": args.puerto,
+        "socket": args.socket, "resp": args.resp, "parser": args.parser,
+        "decodificar": args.decodificar == "si", "conexiones": args.conexiones,
+    }
+
+
+def clase_parser(parser, resp=2, asincrono=False):
+    if parser == "hiredis":
+        if not HIREDIS_AVAILABLE:
+            raise RuntimeError("se pidió --parser hiredis pero no está instalado (pip install hiredis)")
+        return aioconexion._AsyncHiredisParser if asincrono else _HiredisParser
+    if parser == "python":
+        if asincrono:
+            return aioconexion._AsyncRESP3Parser if resp == 3 else aioconexion._AsyncRESP2Parser
+        return _RESP3Parser if resp == 3 else _RESP2Parser
+    # DefaultParser es hiredis si está; con RESP3 la conexión cambia RESP2 por RESP3
+    return aioconexion.DefaultParser if asincrono else DefaultParser
+
+
+def conectar(opciones, **cambios):
+    """Cliente Redis con `opciones` (pisadas por `cambios`)."""
+    o = {**opciones, **cambios}
+    kwargs = {
+        "protocol": o["resp"],
+        "decode_responses": o["decodificar"],
+        "parser_class": clase_parser(o["parser"], o["resp"]),
+    }
+    if o["transporte"] == "unix":
+        pool = redis.ConnectionPool(connection_class=redis.UnixDomainSocketConnection,
+                                    path=o["socket"], **kwargs)
+    else:
+        pool = redis.ConnectionPool(host=o["host"], port=o["puerto"], **kwargs)
+    return redis.Redis(connection_pool=pool, single_connection_client=o["conexiones"] == "unica")
+
+
+def conectar_async(opciones, **cambios):
+    """Como conectar() pero con un cliente de redis.asyncio."""
+    o = {**opciones, **cambios}
+    kwargs = {
+        "protocol": o["resp"],
+        "decode_responses": o["decodificar"],
+        "parser_class": clase_parser(o["parser"], o["resp"], asincrono=True),
+    }
+    if o["transporte"] == "unix":
+        pool = aioredis.ConnectionPool(connection_class=aioredis.UnixDomainSocketConnection,
+                                       path=o["socket"], **kwargs)
+    else:
+        pool = aioredis.ConnectionPool(host=o["host"], port=o["puerto"], **kwargs)
+    return aioredis.Redis(connection_pool=pool,
+                          single_connection_client=o["conexiones"] == "unica")
+
+
+def opciones_de(r):
+    """Opciones efectivas de un cliente ya creado (el parser resuelto)."""
+    kw = r.connection_pool.connection_kwargs
+    parser = kw.get("parser_class", DefaultParser)
+    return {
+        "transporte": "unix" if kw.get("path") else "tcp",
+        "host": kw.get("host", "localhost"), "puerto": kw.get("port", 6379),
+        "socket": kw.get("path", ""), "resp": int(kw.get("protocol") or 2),
+        "parser": "hiredis" if parser is _HiredisParser else "python",
+        "decodificar": bool(kw.get("decode_responses")),
+        "conexiones": "unica" if r.connection is not None else "pool",
+    }
+
+
+def control(r):
+    """Cliente aparte para lo que no se mide (métricas, verificaciones): mismo
+    transporte que r pero RESP2, respuestas decodificadas y pool."""
+    return conectar(opciones_de(r), resp=2, parser="auto", decodificar=True, conexiones="pool")
+
+
+def columnas(r):
+    o = opciones_de(r)
+    return {
+        "transporte": o["transporte"], "resp": o["resp"], "parser": o["parser"],
+        "decodificar": "si" if o["decodificar"] else "no", "conexiones": o["conexiones"],
+    }
+
+
+def describir(r):
+    o = opciones_de(r)
+    destino = o["socket"] if o["transporte"] == "unix" else f"{o['host']}:{o['puerto']}"
+    return (f"{o['transporte']} {destino}, RESP{o['resp']}, parser {o['parser']}, "
+            f"{'str' if o['decodificar'] else 'bytes'}, {o['conexiones']}")
+
+
+def texto(valor):
+    """bytes -> str (lo demás, incluido None, queda igual)."""
+    return valor.decode() if isinstance(valor, bytes) else valor
+
+
+def campo(datos, nombre):
+    """datos[nombre] como str, con las claves del dict en str o en bytes."""
+    valor = datos.get(nombre)
+    if valor is None:
+        valor = datos.get(nombre.encode())
+    return texto(valor)
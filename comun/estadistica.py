@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+Estadística para los CSV de resultados: media con intervalo de confianza
+(t de Student), test de Welch entre dos grupos de repeticiones y ajuste
+lineal por mínimos cuadrados (para las curvas de memoria de capacidad.py).
+
+Sin scipy: la CDF de la t sale de la beta incompleta regularizada (fracción
+continua de Lentz, como en Numerical Recipes).
+"""
+
+import math
+
+# Columnas que identifican una celda de la matriz
+DIMENSIONES = ["modo", "politica", "dataset"]
+
+# Métricas de tamaño/memoria que se comparan además de latencias y throughput
+METRICAS_EXTRA = ["memory_used", "rdb_bytes", "aof_bytes", "evicted_keys", "hit_ratio"]
+
+
+def es_metrica(columna):
+    return (columna.endswith("_ms") or "throughput" in columna
+            or columna in METRICAS_EXTRA)
+
+
+def mayor_es_mejor(columna):
+    return "throughput" in columna or columna == "hit_ratio"
+
+
+def a_numero(valor):
+    try:
+        return float(valor)
+    except (TypeError, ValueError):
+        return None
+
+
+def valores(filas, columna):
+    """Valores numéricos de `columna` (se saltean vacíos y no numéricos)."""
+    res = [a_numero(f.get(columna)) for f in filas]
+    return [v for v in res if v is not None and not math.isnan(v)]
+
+
+def agrupar(filas, claves):
+    """dict clave (tupla de valores de `claves`) -> filas, en orden de aparición."""
+    grupos = {}
+    for f in filas:
+        grupos.setdefault(tuple(f.get(c, "") for c in claves), []).append(f)
+    return grupos
+
+
+def media(v):
+    return sum(v) / len(v) if v else float("nan")
+
+
+def desvio(v):
+    """Desvío estándar muestral."""
+    if len(v) < 2:
+        return 0.0
+    m = media(v)
+    return math.sqrt(sum((x - m) ** 2 for x in v) / (len(v) - 1))
+
+
+def _fraccion_beta(a, b, x, iteraciones=200, eps=3e-14):
+    qab, qap, qam = a + b, a + 1.0, a - 1.0
+    c, d = 1.0, 1.0 - qab * x / qap
+    d = 1.0 / (d if abs(d) > 1e-300 else 1e-300)
+    h = d
+    for m in range(1, iteraciones + 1):
+        m2 = 2 * m
+        aa = m * (b - m) * x / ((qam + m2) * (a + m2))
+        d = 1.0 + aa * d
+        d = 1.0 / (d if abs(d) > 1e-300 else 1e-300)
+        c = 1.0 + aa / c if abs(c) > 1e-300 else 1e-300
+        h *= d * c
+        aa = -(a + m) * (qab + m) * x / ((a + m2) * (qap + m2))
+        d = 1.0 + aa * d
+        d = 1.0 / (d if abs(d) > 1e-300 else 1e-300)
+        c = 1.0 + aa / c if abs(c) > 1e-300 else 1e-300
+        delta = d * c
+        h *= delta
+        if abs(delta - 1.0) < eps:
+            break
+    return h
+
+
+def beta_incompleta(a, b, x):
+    """I_x(a, b) regularizada."""
+    if x <= 0.0:
+        return 0.0
+    if x >= 1.0:
+        return 1.0
+    ln_bt = (math.lgamma(a + b) - math.lgamma(a) - math.lgamma(b)
+             + a * math.log(x) + b * math.log(1.0 - x))
+    if x < (a + 1.0) / (a + b + 2.0):
+        return math.exp(ln_bt) * _fraccion_beta(a, b, x) / a
+    return 1.0 - math.exp(ln_bt) * _fraccion_beta(b, a, 1.0 - x) / b
+
+
+def t_cdf(t, gl):
+    """P(T <= t) para una t de Student con gl grados de libertad."""
+    cola = 0.5 * beta_incompleta(gl / 2.0, 0.5, gl / (gl + t * t))
+    return 1.0 - cola if t > 0 else cola
+
+
+def t_critico(confianza, gl):
+    """t tal que P(|T| <= t) = confianza (bisección sobre la CDF)."""
+    objetivo = 0.5 + confianza / 2.0
+    lo, hi = 0.0, 1000.0
+    for _ in range(100):
+        mid = (lo + hi) / 2.0
+        if t_cdf(mid, gl) < objetivo:
+            lo = mid
+        else:
+            hi = mid
+    return (lo + hi) / 2.0
+
+
+def intervalo(v, confianza=0.95):
+    """(media, extremo inferior, extremo superior) del IC de la media."""
+    m = media(v)
+    if len(v) < 2:
+        return m, m, m
+    semi = t_critico(confianza, len(v) - 1) * desvio(v) / math.sqrt(len(v))
+    return m, m - semi, m + semi
+
+
+def welch(a, b):
+    """Test t de Welch (varianzas distintas). Devuelve (t, gl, p bilateral);
+    p es nan si algún grupo tiene menos de 2 valores."""
+    if len(a) < 2 or len(b) < 2:
+        return float("nan"), float("nan"), float("nan")
+    va, vb = desvio(a) ** 2 / len(a), desvio(b) ** 2 / len(b)
+    if va + vb == 0:
+        igual = media(a) == media(b)
+        return 0.0 if igual else float("inf"), float("inf"), 1.0 if igual else 0.0
+    t = (media(b) - media(a)) / math.sqrt(va + vb)
+    gl = (va + vb) ** 2 / (va ** 2 / (len(a) - 1) + vb ** 2 / (len(b) - 1))
+    p = 2.0 * (1.0 - t_cdf(abs(t), gl))
+    return t, gl, p
+
+
+def ajuste_lineal(x, y):
+    """Mínimos cuadrados y = a + b*x. Devuelve (a, b, r2); con un solo punto
+    la recta pasa por el origen y r2 es nan."""
+    if not x:
+        return float("nan"), float("nan"), float("nan")
+    mx, my = media(x), media(y)
+    sxx = sum((xi - mx) ** 2 for xi in x)
+    if sxx == 0:
+        return 0.0, my / mx if mx else float("nan"), float("nan")
+    b = sum((xi - mx) * (yi - my) for xi, yi in zip(x, y)) / sxx
+    a = my - b * mx
+    syy = sum((yi - my) ** 2 for yi in y)
+    r2 = 1.0 - sum((yi - a - b * xi) ** 2 for xi, yi in zip(x, y)) / syy if syy else 1.0
+    return a, b, r2
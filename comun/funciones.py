@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+Librería de Redis Functions (Lua) usada por los benchmarks en modo
+`--ejecucion servidor`: hace en un solo round trip lo que el cliente hace
+con varios comandos.
+
+  bdnr_pop_y_leer   RPOP (o ZPOPMIN si la cola es un ZSET de prioridad) de
+                    hasta N ids + HGETALL de cada ticket
+  bdnr_incr_y_top   ZINCRBY (opcional) + ZREVRANGE del top-K + datos de cada
+                    artículo (layout hash o bucket de ranking/almacenamiento.py)
+
+Se carga con FUNCTION LOAD REPLACE (Redis >= 7). En versiones anteriores se
+usa el mismo código con SCRIPT LOAD + EVALSHA. Las claves de los tickets y
+artículos se arman dentro de la función, así que esto es para un Redis
+standalone (en Cluster habría que declararlas en KEYS).
+"""
+
+import redis
+
+LIBRERIA = "bdnr"
+
+_POP_Y_LEER = """
+local function pop_y_leer(keys, args)
+  local n = tonumber(args[1])
+  local prefijo = args[2]
+  local ids = {}
+  if args[3] == 'zset' then
+    local sacados = redis.call('ZPOPMIN', keys[1], n)
+    for i = 1, #sacados, 2 do ids[#ids + 1] = sacados[i] end
+  else
+    for _ = 1, n do
+      local id = redis.call('RPOP', keys[1])
+      if not id then break end
+      ids[#ids + 1] = id
+    end
+  end
+  local res = {}
+  for _, id in ipairs(ids) do
+    res[#res + 1] = id
+    res[#res + 1] = redis.call('HGETALL', prefijo .. id)
+  end
+  return res
+end
+"""
+
+# CAMPOS/CORTOS replican almacenamiento.CAMPOS (nombres de una letra del layout bucket)
+_INCR_Y_TOP = """
+local CAMPOS = {'title', 'author', 'url', 'created_at', 'num_points', 'num_comments'}
+local CORTOS = {title = 't', author = 'a', url = 'u', created_at = 'c',
+                num_points = 'p', num_comments = 'k'}
+
+local function incr_y_top(keys, args)
+  local inc, aid, k = args[1], args[2], tonumber(args[3])
+  local layout, tam = args[4], tonumber(args[5])
+  if aid ~= '' then
+    redis.call('ZINCRBY', keys[1], inc, aid)
+  end
+  local top = redis.call('ZREVRANGE', keys[1], 0, k - 1, 'WITHSCORES')
+  local res = {}
+  for i = 1, #top, 2 do
+    local id = top[i]
+    local datos
+    if layout == 'hash' then
+      datos = redis.call('HGETALL', 'article:' .. id)
+    else
+      local n = tonumber(string.match(id, ':(%d+)$'))
+      local off = n % tam
+      local nombres = {}
+      for j, c in ipairs(CAMPOS) do nombres[j] = off .. ':' .. CORTOS[c] end
+      local valores = redis.call('HMGET', 'article_bucket:' .. math.floor(n / tam),
+                                 unpack(nombres))
+      datos = {}
+      for j, c in ipairs(CAMPOS) do
+        if valores[j] then
+          datos[#datos + 1] = c
+          datos[#datos + 1] = valores[j]
+        end
+      end
+    end
+    res[#res + 1] = {id, top[i + 1], datos}
+  end
+  return res
+end
+"""
+
+# nombre -> (código, función Lua, flags de la función)
+_FUNCIONES = {
+    "bdnr_pop_y_leer": (_POP_Y_LEER, "pop_y_leer", "{'allow-oom'}"),
+    "bdnr_incr_y_top": (_INCR_Y_TOP, "incr_y_top", "{}"),
+}
+
+
+def codigo_libreria():
+    partes = [f"#!lua name={LIBRERIA}"]
+    for nombre, (codigo, funcion, flags) in _FUNCIONES.items():
+        partes.append(codigo)
+        partes.append(f"redis.register_function{{function_name='{nombre}', "
+                      f"callback={funcion}, flags={flags}}}")
+    return "\n".join(partes)
+
+
+def _a_dict(plano):
+    return dict(zip(plano[::2], plano[1::2]))
+
+
+class Funciones:
+    """Carga la librería en `r` y expone sus funciones con resultados ya
+    convertidos a las mismas estructuras que arma el cliente."""
+
+    def __init__(self, r):
+        self.r = r
+        self.shas = {}
+        try:
+            r.function_load(codigo_libreria(), replace=True)
+            self.modo = "function"
+        except redis.ResponseError:
+            # Redis < 7: sin FUNCTION, mismo código como script
+            for nombre, (codigo, funcion, _) in _FUNCIONES.items():
+                self.shas[nombre] = r.script_load(f"{codigo}\nreturn {funcion}(KEYS, ARGV)")
+            self.modo = "eval"
+
+    def llamar(self, nombre, claves, argumentos):
+        if self.modo == "function":
+            return self.r.fcall(nombre, len(claves), *claves, *argumentos)
+        return self.r.evalsha(self.shas[nombre], len(claves), *claves, *argumentos)
+
+    def pop_y_leer(self, cola, n=1, prefijo="ticket:", zset=False):
+        """Lista de (id, dict del hash) de hasta n elementos sacados de `cola`
+        (una LIST, o con zset=True un ZSET del que salen los de menor score)."""
+        res = self.llamar("bdnr_pop_y_leer", [cola], [n, prefijo, "zset" if zset else "list"])
+        return [(res[i], _a_dict(res[i + 1])) for i in range(0, len(res), 2)]
+
+    def incr_y_top(self, zset, k=10, article_id="", incremento=0,
+                   layout="hash", tam_bucket=16):
+        """ZINCRBY opcional y top-k con datos: [((id, score), dict), ...]
+        (el mismo formato que leer_top en ranking/almacenamiento.py)."""
+        res = self.llamar("bdnr_incr_y_top", [zset],
+                          [incremento, article_id, k, layout, tam_bucket])
+        return [((aid, float(score)), _a_dict(datos)) for aid, score, datos in res]
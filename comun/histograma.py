@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+Histograma de latencias estilo HdrHistogram.
+
+Buckets log-lineales sobre nanosegundos (time.perf_counter_ns): cada potencia
+de 2 se parte en 128 sub-buckets, así el error relativo es < 1% y la memoria
+es fija (~4.5k contadores) sin importar cuántas operaciones se registren.
+Se puede combinar con los histogramas de otros hilos/procesos (es picklable).
+"""
+
+import math
+
+PERCENTILES_CSV = [("p50", 50.0), ("p90", 90.0), ("p99", 99.0), ("p999", 99.9)]
+
+
+class Histograma:
+
+    def __init__(self, bits_sub: int = 8, bits_max: int = 40):
+        # bits_max = 40 -> hasta ~18 minutos en ns
+        self.bits_sub = bits_sub
+        self.bits_max = bits_max
+        self.sub = 1 << bits_sub
+        self.mitad = self.sub >> 1
+        self.tope = (1 << bits_max) - 1
+        self.contadores = [0] * (self.sub + (bits_max - bits_sub) * self.mitad)
+        self.total = 0
+        self.suma = 0
+        self.minimo = None
+        self.maximo = 0
+
+    def _indice(self, v: int) -> int:
+        if v < self.sub:
+            return v
+        shift = v.bit_length() - self.bits_sub
+        return self.sub + (shift - 1) * self.mitad + ((v >> shift) - self.mitad)
+
+    def _valor_maximo(self, idx: int) -> int:
+        """Mayor valor que cae en el bucket idx."""
+        if idx < self.sub:
+            return idx
+        k = idx - self.sub
+        shift = k // self.mitad + 1
+        mantisa = k % self.mitad + self.mitad
+        return ((mantisa + 1) << shift) - 1
+
+    def registrar(self, ns: int):
+        v = min(max(int(ns), 0), self.tope)
+        self.contadores[self._indice(v)] += 1
+        self.total += 1
+        self.suma += v
+        if v > self.maximo:
+            self.maximo = v
+        if self.minimo is None or v < self.minimo:
+            self.minimo = v
+
+    def combinar(self, otro: "Histograma"):
+        """Suma los conteos de otro histograma (mismos parámetros) en este."""
+        if (otro.bits_sub, otro.bits_max) != (self.bits_sub, self.bits_max):
+            raise ValueError("No se pueden combinar histogramas con distinta resolución")
+        for i, c in enumerate(otro.contadores):
+            if c:
+                self.contadores[i] += c
+        self.total += otro.total
+        self.suma += otro.suma
+        self.maximo = max(self.maximo, otro.maximo)
+        if otro.minimo is not None:
+            self.minimo = otro.minimo if self.minimo is None else min(self.minimo, otro.minimo)
+        return self
+
+    def percentil(self, p: float) -> int:
+        """Valor (ns) por debajo del cual queda el p% de las muestras."""
+        if self.total == 0:
+            return 0
+        objetivo = max(1, math.ceil(p / 100.0 * self.total))
+        acumulado = 0
+        for i, c in enumerate(self.contadores):
+            acumulado += c
+            if acumulado >= objetivo:
+                return min(self._valor_maximo(i), self.maximo)
+        return self.maximo
+
+    def media(self) -> float:
+        return self.suma / self.total if self.total else 0.0
+
+    def percentil_ms(self, p: float) -> float:
+        return self.percentil(p) / 1e6
+
+    def resumen_ms(self) -> dict:
+        """p50/p90/p99/p99.9/max en ms."""
+        res = {nombre: self.percentil_ms(p) for nombre, p in PERCENTILES_CSV}
+        res["max"] = self.maximo / 1e6
+        return res
+
+    def columnas_csv(self, prefijo: str = "lat") -> dict:
+        """Columnas listas para el CSV de resultados: {prefijo}_p50_ms, ..., {prefijo}_max_ms."""
+        return {f"{prefijo}_{nombre}_ms": f"{valor:.3f}"
+                for nombre, valor in self.resumen_ms().items()}
+
+    def __str__(self):
+        r = self.resumen_ms()
+        return (f"p50 = {r['p50']:.3f} ms | p90 = {r['p90']:.3f} ms | "
+                f"p99 = {r['p99']:.3f} ms | p99.9 = {r['p999']:.3f} ms | "
+                f"max = {r['max']:.3f} ms")
@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+"""
+Instrumentación de Redis compartida por los benchmarks.
+
+- esperar_bgsave / medir_metricas: fuerzan la persistencia al final de la
+  corrida y devuelven memoria, claves desalojadas y tamaño de RDB/AOF.
+- MuestreadorInfo: hilo que toma INFO cada `intervalo` segundos durante toda
+  la corrida y escribe una serie temporal (memoria, forks, fsync demorados,
+  desalojos, ops/s). Si se le pasa el histograma de latencias en vivo, agrega
+  la latencia máxima de cada ventana y al final cuenta cuántos picos de
+  latencia coincidieron con un fork o con un fsync demorado.
+"""
+
+import csv
+import os
+import threading
+import time
+
+import redis
+
+CAMPOS_INFO = [
+    "used_memory", "latest_fork_usec", "total_forks", "aof_delayed_fsync",
+    "evicted_keys", "instantaneous_ops_per_sec", "rdb_bgsave_in_progress",
+    "aof_rewrite_in_progress",
+]
+
+
+def esperar_bgsave(r, timeout=60.0, interval=0.5):
+    """Espera a que finalice un BGSAVE previo y lanza otro para asegurar
+    que haya un snapshot RDB actualizado."""
+    start = time.time()
+    while True:
+        if r.info("persistence").get("rdb_bgsave_in_progress", 0) == 0:
+            break
+        if time.time() - start > timeout:
+            print("WARNING: timeout esperando fin de BGSAVE previo")
+            return False
+        time.sleep(interval)
+
+    r.bgsave()
+
+    while True:
+        if r.info("persistence").get("rdb_bgsave_in_progress", 0) == 0:
+            break
+        if time.time() - start > timeout:
+            print("WARNING: timeout esperando BGSAVE")
+            return False
+        time.sleep(interval)
+    return True
+
+
+def _esperar_rewrite(r, mensaje, timeout=30.0):
+    start = time.time()
+    while r.info("persistence").get("aof_rewrite_in_progress", 0) == 1:
+        if time.time() - start > timeout:
+            print(mensaje)
+            break
+        time.sleep(0.1)
+
+
+def tamanio_persistencia(redis_dir):
+    """Devuelve (bytes del RDB, bytes de AOF) en redis_dir, incluyendo los
+    archivos AOF multipart de appendonlydir/."""
+    rdb_path = os.path.join(redis_dir, "dump.rdb")
+    rdb_size = os.path.getsize(rdb_path) if os.path.exists(rdb_path) else 0
+
+    aof_size = 0
+    main_aof = os.path.join(redis_dir, "appendonly.aof")
+    if os.path.exists(main_aof):
+        aof_size += os.path.getsize(main_aof)
+    append_dir = os.path.join(redis_dir, "appendonlydir")
+    if os.path.isdir(append_dir):
+        for fname in os.listdir(append_dir):
+            if fname.startswith("appendonly.aof"):
+                aof_size += os.path.getsize(os.path.join(append_dir, fname))
+    return rdb_size, aof_size
+
+
+def medir_metricas(r, redis_dir, modo, reescribir_aof=True):
+    """Fuerza persistencia según el modo y devuelve estadísticas de uso de disco/RAM.
+    Con reescribir_aof=False el AOF queda como lo dejó la carga (sin BGREWRITEAOF)."""
+    if modo.startswith("rdb") or modo == "mixto":
+        esperar_bgsave(r)
+    if reescribir_aof and (modo.startswith("aof") or modo == "mixto"):
+        # Consolidar los archivos con un BGREWRITEAOF
+        _esperar_rewrite(r, "WARNING: timeout esperando fin de AOF rewrite previo")
+        r.bgrewriteaof()
+        _esperar_rewrite(r, "WARNING: timeout esperando nuevo AOF rewrite")
+
+    mem = r.info("memory")
+    stats = r.info("stats")
+    # Sin redis_dir (p. ej. nodos de un ranking particionado) no se miden archivos
+    rdb_size, aof_size = tamanio_persistencia(redis_dir) if redis_dir else (0, 0)
+
+    return {
+        "memory_used": mem["used_memory"],
+        "evicted_keys": stats.get("evicted_keys", 0),
+        "rdb_size": rdb_size,
+        "aof_size": aof_size,
+    }
+
+
+def cliente_como(r):
+    """Cliente nuevo (con su propio pool) con la misma configuración de conexión que r."""
+    pool = r.connection_pool
+    return redis.Redis(connection_pool=redis.ConnectionPool(
+        connection_class=pool.connection_class, **pool.connection_kwargs))
+
+
+# CSV temporal de una celda del orquestador: .celda_<nombre de la celda>.csv
+PREFIJO_CELDA = ".celda_"
+
+
+def ruta_serie(out_csv, *partes, carpeta="series_info"):
+    """<carpeta>/<partes>_<fecha>_<pid>.csv al lado del CSV de resultados.
+    Si `out_csv` es el CSV temporal de una celda del orquestador, el nombre de
+    la celda (con la variante de conexión y el rewrite del AOF, que corren en
+    paralelo) va adelante de `partes`. El pid separa corridas que arrancan en
+    el mismo segundo."""
+    directorio = os.path.join(os.path.dirname(os.path.abspath(out_csv)), carpeta)
+    os.makedirs(directorio, exist_ok=True)
+    base = os.path.splitext(os.path.basename(out_csv))[0]
+    if base.startswith(PREFIJO_CELDA):
+        partes = (base[len(PREFIJO_CELDA):],) + partes
+    nombre = ("_".join(str(p) for p in partes) + time.strftime("_%Y%m%dT%H%M%S")
+              + f"_{os.getpid()}.csv")
+    return os.path.join(directorio, nombre)
+
+
+class MuestreadorInfo(threading.Thread):
+    """Muestrea INFO en segundo plano y escribe la serie en `ruta`."""
+
+    def __init__(self, r, ruta, intervalo=0.1):
+        super().__init__(daemon=True)
+        self.r = cliente_como(r)
+        self.ruta = ruta
+        self.intervalo = intervalo
+        self.fase_actual = "inicio"
+        self.hist = None
+        self._previos = None
+        self._detener = threading.Event()
+        self.filas = []
+
+    def fase(self, nombre):
+        """Etiqueta las muestras siguientes (carga, workload, persistencia...)."""
+        self.fase_actual = nombre
+
+    def observar(self, hist):
+        """Histograma de latencias que se está llenando en vivo."""
+        self.hist = hist
+        self._previos = list(hist.contadores)
+
+    def _ventana(self):
+        """(ops, latencia máxima en ms) registradas desde la muestra anterior."""
+        if self.hist is None:
+            return "", ""
+        actuales = list(self.hist.contadores)
+        ops = 0
+        maximo = None
+        for i, (c, p) in enumerate(zip(actuales, self._previos)):
+            if c > p:
+                ops += c - p
+                maximo = i
+        self._previos = actuales
+        if maximo is None:
+            return 0, 0.0
+        return ops, self.hist._valor_maximo(maximo) / 1e6
+
+    def run(self):
+        t0 = time.time()
+        with open(self.ruta, "w", newline="") as f:
+            w = csv.writer(f)
+            w.writerow(["t_s", "fase"] + CAMPOS_INFO + ["ops_ventana", "lat_max_ms"])
+            while not self._detener.is_set():
+                try:
+                    info = self.r.info()
+                except redis.RedisError:
+                    info = {}
+                ops, lat_max = self._ventana()
+                fila = [round(time.time() - t0, 3), self.fase_actual]
+                fila += [info.get(c, "") for c in CAMPOS_INFO] + [ops, lat_max]
+                w.writerow(fila)
+                self.filas.append(fila)
+                self._detener.wait(self.intervalo)
+
+    def detener(self):
+        self._detener.set()
+        self.join()
+
+    def resumen_picos(self, umbral_ms=None):
+        """Cuenta ventanas con latencia máxima > umbral_ms (por defecto 4x el
+        p99 del histograma observado) y cuántas coincidieron con un fork
+        (total_forks cambió o había BGSAVE/rewrite en curso) o con un fsync
+        demorado (aof_delayed_fsync aumentó)."""
+        if self.hist is None or not self.filas:
+            return {"picos": "", "picos_con_fork": "", "picos_con_fsync": ""}
+        if umbral_ms is None:
+            umbral_ms = 4 * self.hist.percentil_ms(99)
+        idx = {c: 2 + i for i, c in enumerate(CAMPOS_INFO)}
+        i_lat = len(self.filas[0]) - 1
+
+        def num(fila, campo):
+            v = fila[idx[campo]]
+            return int(v) if v != "" else 0
+
+        picos = con_fork = con_fsync = 0
+        for prev, fila in zip(self.filas, self.filas[1:]):
+            if fila[i_lat] == "" or fila[i_lat] <= umbral_ms:
+                continue
+            picos += 1
+            if (num(fila, "total_forks") > num(prev, "total_forks")
+                    or num(fila, "rdb_bgsave_in_progress")
+                    or num(fila, "aof_rewrite_in_progress")):
+                con_fork += 1
+            if num(fila, "aof_delayed_fsync") > num(prev, "aof_delayed_fsync"):
+                con_fsync += 1
+        return {"picos": picos, "picos_con_fork": con_fork, "picos_con_fsync": con_fsync}
+
+
+def iniciar_muestreo(r, out_csv, intervalo, *partes):
+    """Arranca un MuestreadorInfo (o devuelve None si intervalo <= 0)."""
+    if intervalo <= 0:
+        return None
+    muestreador = MuestreadorInfo(r, ruta_serie(out_csv, *partes), intervalo)
+    muestreador.fase("carga")
+    muestreador.start()
+    print(f"Muestreando INFO cada {intervalo}s en {muestreador.ruta}")
+    return muestreador
+
+
+def columnas_muestreo(muestreador):
+    """Columnas del CSV de resultados: archivo de la serie y resumen de picos."""
+    if muestreador is None:
+        return {"serie_info": "", "picos": "", "picos_con_fork": "", "picos_con_fsync": ""}
+    return {"serie_info": os.path.relpath(muestreador.ruta), **muestreador.resumen_picos()}
+
+
+def contadores_keyspace(r):
+    """(keyspace_hits, keyspace_misses) acumulados del servidor."""
+    stats = r.info("stats")
+    return stats.get("keyspace_hits", 0), stats.get("keyspace_misses", 0)
+
+
+def columnas_keyspace(inicial, final, descontar=(0, 0)):
+    """Columnas de hits/misses entre dos lecturas de contadores_keyspace,
+    sin contar los lookups propios del benchmark (`descontar`)."""
+    hits = final[0] - inicial[0] - descontar[0]
+    misses = final[1] - inicial[1] - descontar[1]
+    return {
+        "keyspace_hits": hits,
+        "keyspace_misses": misses,
+        "hit_ratio": f"{hits / (hits + misses):.4f}" if hits + misses > 0 else "",
+    }
+
+
+def contar_claves(r, patron, count=10000):
+    """Cantidad de claves que matchean `patron` (SCAN, sin traerlas todas juntas)."""
+    total, cursor = 0, 0
+    while True:
+        cursor, claves = r.scan(cursor, match=patron, count=count)
+        total += len(claves)
+        if cursor == 0:
+            return total
+
+
+def fraccion(parte, total):
+    return f"{parte / total:.4f}" if total else ""
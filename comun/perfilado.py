@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+"""
+Atribución de latencia por comando: cuánto de lo que mide el cliente es
+tiempo del servidor, cuánto es red y cuánto es Python (redis-py, parser,
+el propio benchmark).
+
+Por cada fase (carga, workload, persistencia...):
+  - el cliente `r` se instrumenta: cada execute_command suma su tiempo de
+    pared al comando; cada execute() de pipeline se acumula por composición
+    (cuántos comandos de cada tipo llevaba);
+  - servidor: delta de INFO commandstats (usec por llamada);
+  - red: RTT de un PING crudo por socket (sin redis-py) medido al empezar la
+    fase, por round trip;
+  - cliente = total - servidor - red. En un pipeline, lo que sobra de su
+    tiempo de pared después de restar el servidor (usec por llamada de cada
+    comando) y un RTT se reparte por igual entre los comandos encolados.
+Además se guardan las entradas nuevas del SLOWLOG y los eventos de LATENCY
+(LATEST + HISTORY) de cada fase. Con cprofile/tracemalloc se perfila también
+el proceso Python completo.
+
+Solo se instrumenta el cliente principal; los comandos de otros clientes
+(workers, escritores del pipeline de ingesta) aparecen del lado del servidor
+pero sin tiempo de cliente. Las consultas propias (INFO, SLOWLOG, LATENCY)
+van por un cliente de control aparte, que decodifica aunque el principal no.
+"""
+
+import cProfile
+import csv
+import io
+import os
+import pstats
+import socket
+import time
+import tracemalloc
+
+import redis
+
+from comun import conexion
+from comun.instrumentacion import ruta_serie
+
+# Comandos de la propia instrumentación, que no se muestran en el desglose
+PROPIOS = {"info", "slowlog", "latency", "ping", "config", "command", "client", "hello"}
+
+_PING = b"*1\r\n$4\r\nPING\r\n"
+
+
+def nombre_comando(args):
+    return str(args[0]).split(" ")[0].lower() if args else ""
+
+
+def _commandstats(r):
+    """dict comando -> (calls, usec), con los subcomandos (object|encoding) sumados al comando."""
+    res = {}
+    for clave, valores in r.info("commandstats").items():
+        nombre = clave.removeprefix("cmdstat_").split("|")[0]
+        calls, usec = res.get(nombre, (0, 0))
+        res[nombre] = (calls + valores["calls"], usec + valores["usec"])
+    return res
+
+
+def rtt_crudo(r, muestras=200):
+    """Mediana del round trip de un PING escrito directo al socket (ns)."""
+    kwargs = r.connection_pool.connection_kwargs
+    if kwargs.get("path"):
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        s.connect(kwargs["path"])
+    else:
+        s = socket.create_connection((kwargs.get("host", "localhost"), kwargs.get("port", 6379)))
+        s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    tiempos = []
+    try:
+        if kwargs.get("password"):
+            usuario = kwargs.get("username") or "default"
+            s.sendall(f"AUTH {usuario} {kwargs['password']}\r\n".encode())
+            s.recv(64)
+        for _ in range(muestras):
+            t0 = time.perf_counter_ns()
+            s.sendall(_PING)
+            s.recv(16)
+            tiempos.append(time.perf_counter_ns() - t0)
+    finally:
+        s.close()
+    tiempos.sort()
+    return tiempos[len(tiempos) // 2]
+
+
+class _Fase:
+    def __init__(self, nombre, r):
+        self.nombre = nombre
+        self.rtt_ns = rtt_crudo(r)
+        self.cliente = {}  # comando -> [llamadas, ns de pared, round trips]
+        self.pipelines = {}  # ((comando, cantidad), ...) -> [execute()s, ns de pared]
+        self.stats = _commandstats(r)
+        ultima = r.slowlog_get(1)
+        self.slowlog_id = ultima[0]["id"] if ultima else -1
+        try:
+            r.execute_command("LATENCY", "RESET")
+        except redis.ResponseError:
+            pass
+        self.filas = []
+
+    def sumar(self, comando, ns, rondas=1, llamadas=1):
+        acum = self.cliente.setdefault(comando, [0, 0, 0.0])
+        acum[0] += llamadas
+        acum[1] += ns
+        acum[2] += rondas
+
+    def sumar_pipeline(self, comandos, ns):
+        conteo = {}
+        for c in comandos:
+            conteo[c] = conteo.get(c, 0) + 1
+        acum = self.pipelines.setdefault(tuple(sorted(conteo.items())), [0, 0])
+        acum[0] += 1
+        acum[1] += ns
+
+    def _repartir_pipelines(self, servidor_ns):
+        """Pasa el tiempo de los pipelines a cada comando: su tiempo de
+        servidor, su parte del RTT y su parte del resto (cliente)."""
+        for composicion, (veces, ns) in self.pipelines.items():
+            n = sum(k for _, k in composicion)
+            resto = ns / veces - self.rtt_ns - sum(k * servidor_ns.get(c, 0) for c, k in composicion)
+            for c, k in composicion:
+                por_comando = servidor_ns.get(c, 0) + (self.rtt_ns + resto) / n
+                self.sumar(c, veces * k * por_comando, veces * k / n, veces * k)
+
+    def cerrar(self, r):
+        stats = _commandstats(r)
+        nuevas = [e for e in r.slowlog_get(128) if e["id"] > self.slowlog_id]
+        lentos = {}
+        for e in nuevas:
+            comando = e["command"]
+            comando = comando.decode() if isinstance(comando, bytes) else comando
+            n, maximo = lentos.get(nombre_comando([comando]), (0, 0))
+            lentos[nombre_comando([comando])] = (n + 1, max(maximo, e["duration"]))
+
+        servidor_ns = {}
+        for c, (calls, usec) in stats.items():
+            calls -= self.stats.get(c, (0, 0))[0]
+            usec -= self.stats.get(c, (0, 0))[1]
+            if calls:
+                servidor_ns[c] = usec * 1000 / calls
+        self._repartir_pipelines(servidor_ns)
+
+        comandos = sorted((set(stats) | set(self.cliente)) - PROPIOS)
+        for c in comandos:
+            calls = stats.get(c, (0, 0))[0] - self.stats.get(c, (0, 0))[0]
+            usec = stats.get(c, (0, 0))[1] - self.stats.get(c, (0, 0))[1]
+            llamadas, ns, rondas = self.cliente.get(c, (0, 0, 0.0))
+            if not calls and not llamadas:
+                continue
+            servidor_us = usec / calls if calls else 0.0
+            fila = {"fase": self.nombre, "tipo": "comando", "nombre": c,
+                    "llamadas_servidor": calls, "llamadas_cliente": llamadas,
+                    "servidor_us": f"{servidor_us:.2f}",
+                    "slowlog": lentos.get(c, (0, 0))[0],
+                    "slowlog_max_us": lentos.get(c, (0, 0))[1]}
+            if llamadas:
+                total_us = ns / llamadas / 1000
+                red_us = rondas * self.rtt_ns / llamadas / 1000
+                fila.update({"total_us": f"{total_us:.2f}", "red_us": f"{red_us:.2f}",
+                             "cliente_us": f"{total_us - servidor_us - red_us:.2f}"})
+            self.filas.append(fila)
+
+        try:
+            eventos = r.execute_command("LATENCY", "LATEST")
+        except redis.ResponseError:
+            eventos = []
+        for evento, _, _, maximo_ms in eventos:
+            try:
+                historia = r.execute_command("LATENCY", "HISTORY", evento)
+            except redis.ResponseError:
+                historia = []
+            self.filas.append({"fase": self.nombre, "tipo": "evento", "nombre": evento,
+                               "eventos": len(historia), "evento_max_ms": maximo_ms})
+        return self.filas
+
+
+class Perfilador:
+    """Desglose por fase y comando. Uso:
+        perfil = Perfilador(r, ruta); perfil.fase("carga"); ...; perfil.terminar()"""
+
+    def __init__(self, r, ruta, umbral_latencia_ms=1, cprofile=False, memoria=False):
+        self.r = conexion.control(r)
+        self.ruta = ruta
+        self.actual = None
+        self.filas = []
+        self._instrumentar(r)
+        self._umbral_previo = None
+        try:
+            self._umbral_previo = self.r.config_get("latency-monitor-threshold").get(
+                "latency-monitor-threshold")
+            self.r.config_set("latency-monitor-threshold", umbral_latencia_ms)
+        except redis.ResponseError:
+            print("WARNING: no se pudo activar LATENCY monitor")
+        self.perfil = cProfile.Profile() if cprofile else None
+        self.memoria = memoria
+        if self.perfil:
+            self.perfil.enable()
+        if memoria:
+            tracemalloc.start()
+
+    def _instrumentar(self, r):
+        ejecutar = r.execute_command
+        crear_pipeline = r.pipeline
+        perfilador = self
+
+        def execute_command(*args, **options):
+            t0 = time.perf_counter_ns()
+            try:
+                return ejecutar(*args, **options)
+            finally:
+                if perfilador.actual is not None:
+                    perfilador.actual.sumar(nombre_comando(args), time.perf_counter_ns() - t0)
+
+        def pipeline(*args, **kwargs):
+            pipe = crear_pipeline(*args, **kwargs)
+            ejecutar_pipe = pipe.execute
+
+            def execute(*eargs, **ekwargs):
+                comandos = [nombre_comando(a) for a, _ in pipe.command_stack]
+                t0 = time.perf_counter_ns()
+                try:
+                    return ejecutar_pipe(*eargs, **ekwargs)
+                finally:
+                    if perfilador.actual is not None and comandos:
+                        perfilador.actual.sumar_pipeline(comandos, time.perf_counter_ns() - t0)
+
+            pipe.execute = execute
+            return pipe
+
+        r.execute_command = execute_command
+        r.pipeline = pipeline
+
+    def _cerrar(self):
+        fase, self.actual = self.actual, None
+        if fase is not None:
+            self.filas.extend(fase.cerrar(self.r))
+
+    def fase(self, nombre):
+        """Cierra la fase en curso y empieza `nombre`."""
+        self._cerrar()
+        self.actual = _Fase(nombre, self.r)
+
+    def terminar(self):
+        """Cierra la última fase, escribe el CSV y muestra el desglose."""
+        self._cerrar()
+        if self._umbral_previo is not None:
+            self.r.config_set("latency-monitor-threshold", self._umbral_previo)
+        columnas = ["fase", "tipo", "nombre", "llamadas_servidor", "llamadas_cliente",
+                    "total_us", "servidor_us", "red_us", "cliente_us", "slowlog",
+                    "slowlog_max_us", "eventos", "evento_max_ms"]
+        with open(self.ruta, "w", newline="") as f:
+            w = csv.DictWriter(f, fieldnames=columnas)
+            w.writeheader()
+            w.writerows(self.filas)
+        self.mostrar()
+        if self.perfil:
+            self.perfil.disable()
+            ruta_prof = os.path.splitext(self.ruta)[0] + ".prof"
+            self.perfil.dump_stats(ruta_prof)
+            salida = io.StringIO()
+            pstats.Stats(self.perfil, stream=salida).sort_stats("cumulative").print_stats(15)
+            print(salida.getvalue())
+            print(f"cProfile guardado en {ruta_prof}")
+        if self.memoria:
+            actual, pico = tracemalloc.get_traced_memory()
+            top = tracemalloc.take_snapshot().statistics("lineno")[:10]
+            tracemalloc.stop()
+            print(f"tracemalloc: actual = {actual / 2**20:.1f} MiB | pico = {pico / 2**20:.1f} MiB")
+            for estadistica in top:
+                print(f"  {estadistica}")
+        print(f"Desglose de latencia guardado en {self.ruta}")
+
+    def mostrar(self):
+        fase = None
+        for fila in self.filas:
+            if fila["fase"] != fase:
+                fase = fila["fase"]
+                print(f"--- Fase {fase} ---")
+                print(f"{'comando':<12} {'llamadas':>9} {'total':>9} {'servidor':>9} "
+                      f"{'red':>9} {'cliente':>9} (us/llamada)  slowlog")
+            if fila["tipo"] == "evento":
+                print(f"  evento LATENCY {fila['nombre']}: {fila['eventos']} muestras, "
+                      f"máx {fila['evento_max_ms']} ms")
+                continue
+            print(f"{fila['nombre']:<12} {fila['llamadas_servidor']:>9} "
+                  f"{fila.get('total_us', '-'):>9} {fila['servidor_us']:>9} "
+                  f"{fila.get('red_us', '-'):>9} {fila.get('cliente_us', '-'):>9}  "
+                  f"{fila['slowlog'] or ''}")
+
+
+def iniciar_perfilado(r, out_csv, activo, cprofile=False, memoria=False, *partes):
+    """Perfilador con el CSV en perfiles/ al lado de los resultados (None si no está activo)."""
+    if not (activo or cprofile or memoria):
+        return None
+    perfil = Perfilador(r, ruta_serie(out_csv, *partes, carpeta="perfiles"),
+                        cprofile=cprofile, memoria=memoria)
+    perfil.fase("carga")
+    return perfil
+
+
+def agregar_argumentos(parser):
+    parser.add_argument("--perfilar", action="store_true",
+                        help="desglose de latencia por fase y comando (servidor/red/cliente) "
+                             "con commandstats, SLOWLOG y LATENCY, en perfiles/")
+    parser.add_argument("--cprofile", action="store_true",
+                        help="perfila el proceso Python con cProfile (implica --perfilar)")
+    parser.add_argument("--tracemalloc", action="store_true",
+                        help="mide la memoria del proceso Python con tracemalloc (implica --perfilar)")
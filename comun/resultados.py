@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""
+Escritura de los CSV de resultados (append) que comparten los tres benchmarks.
+"""
+
+import csv
+import os
+
+
+def _asegurar_cabecera(path: str, header: list) -> list:
+    """Si el CSV ya existe con otra cabecera (columnas agregadas en versiones
+    nuevas de los scripts), lo reescribe con la unión de columnas dejando
+    vacías las que faltan en las filas viejas. Devuelve la cabecera a usar."""
+    with open(path, newline="") as f:
+        lector = csv.DictReader(f)
+        cabecera_vieja = lector.fieldnames or []
+        filas = list(lector)
+    nuevas = [c for c in header if c not in cabecera_vieja]
+    if not nuevas:
+        return cabecera_vieja
+    cabecera = cabecera_vieja + nuevas
+    with open(path, "w", newline="") as f:
+        w = csv.DictWriter(f, fieldnames=cabecera)
+        w.writeheader()
+        w.writerows(filas)
+    return cabecera
+
+
+def escribir_fila(path: str, fila: dict):
+    """Agrega una fila (dict columna -> valor) al CSV, creando la cabecera si
+    el archivo no existe."""
+    header = list(fila)
+    existe = os.path.isfile(path)
+    if existe:
+        header = _asegurar_cabecera(path, header)
+    with open(path, "a", newline="") as f:
+        w = csv.DictWriter(f, fieldnames=header, restval="")
+        if not existe:
+            w.writeheader()
+        w.writerow(fila)
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+"""
+Importación de los scripts de benchmark como módulos.
+queue/test_redis.py y ranking/test_redis.py tienen el mismo nombre, así que
+se cargan por ruta y con un nombre de módulo propio.
+"""
+
+import importlib.util
+import os
+import sys
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def importar_script(ruta_relativa: str, nombre: str):
+    """Importa RAIZ/ruta_relativa como el módulo `nombre` (una sola vez).
+    El directorio del script se agrega al path para sus imports hermanos."""
+    if nombre in sys.modules:
+        return sys.modules[nombre]
+    ruta = os.path.join(RAIZ, ruta_relativa)
+    directorio = os.path.dirname(ruta)
+    if directorio not in sys.path:
+        sys.path.append(directorio)
+    spec = importlib.util.spec_from_file_location(nombre, ruta)
+    modulo = importlib.util.module_from_spec(spec)
+    sys.modules[nombre] = modulo
+    spec.loader.exec_module(modulo)
+    return modulo
@@ -0,0 +1,115 @@
+#!/usr/bin/env bash
+#script para medir curvas throughput vs latencia (open-loop) por modo de persistencia y política
+set -euo pipefail
+
+echo "Iniciando pruebas open-loop"
+
+declare -A PERSISTENCE_MODES_CMDS
+PERSISTENCE_MODES_CMDS["rdb"]="cmd1 cmd2"
+PERSISTENCE_MODES_CMDS["aof_everysec"]="cmd3 cmd4 cmd5"
+PERSISTENCE_MODES_CMDS["aof_always"]="cmd6 cmd7 cmd8"
+PERSISTENCE_MODES_CMDS["mixto"]="cmd9 cmd10 cmd11"
+
+declare -a cmd1=("CONFIG" "SET" "save" "60 1")
+declare -a cmd2=("CONFIG" "SET" "appendonly" "no")
+declare -a cmd3=("CONFIG" "SET" "save" "")
+declare -a cmd4=("CONFIG" "SET" "appendonly" "yes")
+declare -a cmd5=("CONFIG" "SET" "appendfsync" "everysec")
+declare -a cmd6=("CONFIG" "SET" "save" "")
+declare -a cmd7=("CONFIG" "SET" "appendonly" "yes")
+declare -a cmd8=("CONFIG" "SET" "appendfsync" "always")
+declare -a cmd9=("CONFIG" "SET" "save" "900 1 300 10 60 10000")
+declare -a cmd10=("CONFIG" "SET" "appendonly" "yes")
+declare -a cmd11=("CONFIG" "SET" "appendfsync" "everysec")
+
+declare -A MEMORY_POLICIES_CMDS
+MEMORY_POLICIES_CMDS["noeviction"]="CONFIG SET maxmemory 100mb; CONFIG SET maxmemory-policy noeviction"
+MEMORY_POLICIES_CMDS["allkeys_lru"]="CONFIG SET maxmemory 100mb; CONFIG SET maxmemory-policy allkeys-lru"
+MEMORY_POLICIES_CMDS["allkeys_lfu"]="CONFIG SET maxmemory 100mb; CONFIG SET maxmemory-policy allkeys-lfu"
+MEMORY_POLICIES_CMDS["allkeys_random"]="CONFIG SET maxmemory 100mb; CONFIG SET maxmemory-policy allkeys-random"
+
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+
+# Cargas a medir y su CSV de origen (vacío = sin precarga)
+declare -A WORKLOAD_DATA
+WORKLOAD_DATA["ranking"]="${RANKING_CSV:-$SCRIPT_DIR/../ranking/hacker_news.csv}"
+WORKLOAD_DATA["queue"]="${QUEUE_CSV:-$SCRIPT_DIR/../queue/customer_support_tickets.csv}"
+WORKLOAD_DATA["stream"]=""
+
+DATASET="${DATASET:-100000}"
+RATES="${RATES:-1000,2000,5000,10000,20000}"
+DURATION="${DURATION:-10}"
+CONNECTIONS="${CONNECTIONS:-16}"
+
+# Conexión del cliente (comun/conexion.py). El contenedor escucha también
+# en un socket Unix dentro del directorio de persistencia (TRANSPORT=unix).
+TRANSPORT="${TRANSPORT:-tcp}"
+RESP="${RESP:-2}"
+PARSER="${PARSER:-auto}"
+DECODE="${DECODE:-si}"
+
+RESULTS_FILE="${RESULTS_FILE:-$SCRIPT_DIR/resultados_open_loop.csv}"
+REDIS_PERSISTENCE_DIR="${REDIS_PERSISTENCE_DIR:-$HOME/redis-data}"
+PYTHON_SCRIPT="$SCRIPT_DIR/test_open_loop.py"
+
+mkdir -p "$REDIS_PERSISTENCE_DIR"
+
+for mode in "${!PERSISTENCE_MODES_CMDS[@]}"; do
+  for policy in "${!MEMORY_POLICIES_CMDS[@]}"; do
+    for workload in "${!WORKLOAD_DATA[@]}"; do
+      echo "----------------------------------------------"
+      echo "Open-loop → $workload | $mode | $policy"
+
+      docker rm -f redis-bdnr-ranking >/dev/null 2>&1 || true
+
+      docker run -d \
+        --name redis-bdnr-ranking \
+        -v "$REDIS_PERSISTENCE_DIR":/data \
+        -p 6380:6379 \
+        redis:7.4 \
+        redis-server --dir /data --dbfilename dump.rdb \
+        --unixsocket /data/redis.sock --unixsocketperm 777
+
+      until docker exec redis-bdnr-ranking redis-cli PING 2>/dev/null | grep -q PONG; do
+        sleep 0.2
+      done
+
+      for cmdVar in ${PERSISTENCE_MODES_CMDS[$mode]}; do
+        declare -n arr="$cmdVar"
+        docker exec redis-bdnr-ranking redis-cli "${arr[@]}"
+      done
+
+      IFS=';' read -ra memcmds <<< "${MEMORY_POLICIES_CMDS[$policy]}"
+      for mcmd in "${memcmds[@]}"; do
+        read -ra parts <<< "$mcmd"
+        docker exec redis-bdnr-ranking redis-cli "${parts[@]}"
+      done
+
+      docker exec redis-bdnr-ranking redis-cli CONFIG RESETSTAT
+      docker exec redis-bdnr-ranking redis-cli FLUSHALL
+
+      extra=()
+      if [[ -n "${WORKLOAD_DATA[$workload]}" ]]; then
+        extra=(--csv-datos "${WORKLOAD_DATA[$workload]}")
+      fi
+
+      python3 "$PYTHON_SCRIPT" \
+        "$workload" \
+        "$mode" \
+        "$policy" \
+        "$DATASET" \
+        "$RESULTS_FILE" \
+        --tasas "$RATES" \
+        --duracion "$DURATION" \
+        --conexiones "$CONNECTIONS" \
+        --transporte "$TRANSPORT" \
+        --socket "$REDIS_PERSISTENCE_DIR/redis.sock" \
+        --resp "$RESP" \
+        --parser "$PARSER" \
+        --decodificar "$DECODE" \
+        "${extra[@]}"
+    done
+  done
+done
+
+echo "Pruebas open-loop completadas. Resultados en $RESULTS_FILE"
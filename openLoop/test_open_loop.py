@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+Generador de carga open-loop con redis.asyncio.
+
+Los otros benchmarks son closed-loop con una conexión: el throughput es 1/RTT
+y nunca se ve la latencia bajo concurrencia real. Acá las operaciones se
+programan a una tasa objetivo (una cada 1/tasa segundos, pase lo que pase)
+y las ejecutan C conexiones concurrentes. La latencia se mide desde el
+instante en que la operación *debía* empezar (corrección de coordinated
+omission), además del tiempo de servicio desde que realmente empezó.
+
+Cargas:
+  ranking  ZINCRBY a un artículo al azar y cada --top-cada ops un top-10
+           (ZREVRANGE + HGETALLs en pipeline)
+  queue    alterna LPUSH de un ticket y RPOP + HGETALL
+  stream   XADD de un evento sintético
+
+Escribe una fila por tasa objetivo: con varias tasas queda la curva
+throughput vs latencia para el modo de persistencia y la política dados.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from datetime import datetime, timezone
+
+import redis
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from comun import conexion
+from comun.conexion import texto
+from comun.histograma import Histograma
+from comun.resultados import escribir_fila
+from comun.scripts import importar_script
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ranking"))
+import almacenamiento
+
+STREAM = "user_activity_stream"
+TIPOS_EVENTO = ["PushEvent", "CreateEvent", "WatchEvent", "IssuesEvent", "PullRequestEvent"]
+
+
+class Carga:
+    """Una operación de la carga por cada request programado."""
+
+    def __init__(self, nombre: str, n_claves: int, top_cada: int = 100,
+                 layout: str = "hash", tam_bucket: int = 16):
+        self.nombre = nombre
+        self.layout = layout
+        self.tam_bucket = tam_bucket
+        self.n_claves = max(1, n_claves)
+        self.top_cada = top_cada
+        self.rng = random.Random()
+
+    async def ejecutar(self, r, i: int):
+        if self.nombre == "ranking":
+            if self.top_cada and i % self.top_cada == self.top_cada - 1:
+                top = await r.zrevrange("ranking_articles", 0, 9)
+                async with r.pipeline(transaction=False) as pipe:
+                    for aid in top:
+                        almacenamiento.encolar_lectura(pipe, aid, self.layout, self.tam_bucket)
+                    await pipe.execute()
+            else:
+                aid = f"hn:{self.rng.randrange(self.n_claves)}"
+                await r.zincrby("ranking_articles", self.rng.randint(1, 5), aid)
+        elif self.nombre == "queue":
+            if i % 2 == 0:
+                await r.lpush("tickets_queue", f"tkt:{self.rng.randrange(self.n_claves)}")
+            else:
+                tid = await r.rpop("tickets_queue")
+                if tid is not None:
+                    await r.hgetall(f"ticket:{texto(tid)}")
+        else:
+            await r.xadd(STREAM, {
+                "user": f"user{self.rng.randrange(self.n_claves)}",
+                "type": self.rng.choice(TIPOS_EVENTO),
+                "timestamp": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            })
+
+
+async def correr_tasa(opciones: dict, carga: Carga, tasa: float,
+                      duracion: float, conexiones: int):
+    """Corre `tasa` ops/s durante `duracion` segundos con `conexiones`
+    clientes (cada uno con una conexión fija, armados con las `opciones` de
+    conexion.py). Las operaciones que fallan (OOM con noeviction, conexión
+    cortada) no entran en los histogramas ni en las completadas: se cuentan
+    aparte. Devuelve (hist corregido, hist de servicio, completadas, errores,
+    segundos)."""
+    clientes = [conexion.conectar_async(opciones, conexiones="unica")
+                for _ in range(conexiones)]
+    for c in clientes:
+        await c.ping()
+
+    cola = asyncio.Queue()
+    corregido = Histograma()
+    servicio = Histograma()
+    total = int(tasa * duracion)
+    intervalo_ns = 1e9 / tasa
+    t0 = time.perf_counter_ns() + 10_000_000
+    fin = [t0]
+    errores = [0]
+
+    async def despachador():
+        for i in range(total):
+            objetivo = t0 + int(i * intervalo_ns)
+            espera = (objetivo - time.perf_counter_ns()) / 1e9
+            if espera > 0:
+                await asyncio.sleep(espera)
+            cola.put_nowait((i, objetivo))
+        for _ in clientes:
+            cola.put_nowait(None)
+
+    async def trabajador(r):
+        while True:
+            item = await cola.get()
+            if item is None:
+                return
+            i, objetivo = item
+            inicio = time.perf_counter_ns()
+            try:
+                await carga.ejecutar(r, i)
+            except redis.RedisError:
+                errores[0] += 1
+            else:
+                ahora = time.perf_counter_ns()
+                corregido.registrar(ahora - objetivo)
+                servicio.registrar(ahora - inicio)
+            fin[0] = max(fin[0], time.perf_counter_ns())
+
+    await asyncio.gather(despachador(), *(trabajador(c) for c in clientes))
+    for c in clientes:
+        # aclose() desde redis-py 5.0.1, close() en versiones anteriores
+        await (c.aclose() if hasattr(c, "aclose") else c.close())
+    return corregido, servicio, corregido.total, errores[0], (fin[0] - t0) / 1e9
+
+
+def precargar(r: redis.Redis, carga: str, path_csv: str, dataset: int):
+    """Carga los datos reales con los loaders de los benchmarks closed-loop."""
+    if carga == "ranking":
+        ranking = importar_script("ranking/test_redis.py", "ranking_test_redis")
+        ranking.cargar_datos(r, path_csv, max_articulos=dataset, modo_carga="pipeline")
+    elif carga == "queue":
+        cola = importar_script("queue/test_redis.py", "queue_test_redis")
+        r.flushdb()
+        cola.insertar_tickets(r, cola.cargar_tickets(path_csv, dataset), time.time())
+    else:
+        r.delete(STREAM)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generador de carga open-loop (redis.asyncio)")
+    parser.add_argument("carga", choices=["ranking", "queue", "stream"])
+    parser.add_argument("modo", help="modo de persistencia (rdb, aof_everysec, aof_always, mixto)")
+    parser.add_argument("politica", help="política de memoria")
+    parser.add_argument("dataset", type=int, help="cantidad de artículos/tickets/usuarios")
+    parser.add_argument("out_csv", help="CSV de resultados")
+    parser.add_argument("--tasas", default="1000,2000,5000,10000,20000",
+                        help="tasas objetivo en ops/s, separadas por coma")
+    parser.add_argument("--duracion", type=float, default=10.0,
+                        help="segundos por tasa")
+    parser.add_argument("--conexiones", type=int, default=16,
+                        help="conexiones concurrentes")
+    parser.add_argument("--top-cada", type=int, default=100,
+                        help="(ranking) un top-10 cada N operaciones")
+    parser.add_argument("--csv-datos", default=None,
+                        help="CSV de origen para precargar ranking/queue con los loaders "
+                             "de los benchmarks (si no, se usan los datos ya cargados)")
+    # --conexiones es la concurrencia: cada cliente tiene su conexión fija
+    conexion.agregar_argumentos(parser, pool=False)
+    args = parser.parse_args()
+
+    opciones = {**conexion.opciones(args), "conexiones": "unica"}
+    r = conexion.conectar(opciones)
+    if args.csv_datos:
+        precargar(r, args.carga, args.csv_datos, args.dataset)
+
+    layout, tam_bucket = ("hash", 1)
+    if args.carga == "ranking":
+        try:
+            layout, tam_bucket = almacenamiento.leer_layout(r)
+        except RuntimeError as e:
+            sys.exit(f"ERROR: {e} (--csv-datos)")
+    carga = Carga(args.carga, args.dataset, args.top_cada, layout, tam_bucket)
+    print("=== Carga open-loop ===")
+    print(f"Carga={args.carga}, Modo={args.modo}, Pol={args.politica}, "
+          f"Dataset={args.dataset}, Conexiones={args.conexiones}")
+    print(f"Conexión: {conexion.describir(r)}")
+    # La columna conexiones del CSV es la concurrencia, no pool/unica
+    columnas = {k: v for k, v in conexion.columnas(r).items() if k != "conexiones"}
+
+    for tasa in (float(t) for t in args.tasas.split(",")):
+        corregido, servicio, completadas, errores, segundos = asyncio.run(
+            correr_tasa(opciones, carga, tasa, args.duracion, args.conexiones))
+        thr = completadas / segundos if segundos > 0 else 0
+        print(f"tasa {tasa:.0f} op/s -> {thr:.1f} op/s"
+              + (f" ({errores} con error)" if errores else "") + f" | corregida: {corregido}")
+        print(f"{'':>22}servicio:  {servicio}")
+
+        mem = r.info("memory")
+        stats = r.info("stats")
+        escribir_fila(args.out_csv, {
+            "fecha": datetime.now().isoformat(),
+            "carga": args.carga, "modo": args.modo, "politica": args.politica,
+            "dataset": args.dataset, "conexiones": args.conexiones,
+            "tasa_objetivo": f"{tasa:.0f}", "throughput": f"{thr:.1f}", "errores": errores,
+            # Si fallaron todas no hay latencias (no 0 ms)
+            **{col: v if completadas else "" for col, v in corregido.columnas_csv("lat").items()},
+            **{col: v if completadas else "" for col, v in servicio.columnas_csv("serv").items()},
+            "memory_used": mem["used_memory"],
+            "evicted_keys": stats.get("evicted_keys", 0),
+            **columnas,
+        })
+
+    print("Resultados añadidos en", args.out_csv)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+Definición única de la matriz de benchmarks (modos de persistencia x políticas
+de memoria x tamaños de dataset x cargas). Es la misma matriz que recorren
+ranking/run_tests.sh, queue/run_tests.sh y userActivity/run_tests_stream.sh,
+expresada como los CONFIG SET que hay que aplicar en cada celda.
+"""
+
+import itertools
+
+MODOS_PERSISTENCIA = {
+    "rdb": [("save", "60 1"), ("appendonly", "no")],
+    "aof_everysec": [("save", ""), ("appendonly", "yes"), ("appendfsync", "everysec")],
+    "aof_always": [("save", ""), ("appendonly", "yes"), ("appendfsync", "always")],
+    "mixto": [("save", "900 1 300 10 60 10000"), ("appendonly", "yes"),
+              ("appendfsync", "everysec")],
+}
+
+POLITICAS = {
+    "noeviction": [("maxmemory", "100mb"), ("maxmemory-policy", "noeviction")],
+    "allkeys_lru": [("maxmemory", "100mb"), ("maxmemory-policy", "allkeys-lru")],
+    "allkeys_lfu": [("maxmemory", "100mb"), ("maxmemory-policy", "allkeys-lfu")],
+    "allkeys_random": [("maxmemory", "100mb"), ("maxmemory-policy", "allkeys-random")],
+}
+
+DATASETS = {"100k": 100_000, "500k": 500_000, "1M": 1_000_000}
+
+# Rutas relativas a la raíz del repo. `datos` es el primer argumento posicional
+# del script; `args` se agrega a todas las celdas de esa carga; `por` son las
+# columnas que, además de modo/politica/dataset, distinguen filas de una misma
+# celda (queue escribe una fila por cantidad de workers) o corridas con
+# distintos `args` (la mezcla y la distribución del ranking, la retención del
+# stream).
+CARGAS = {
+    "ranking": {
+        "script": "ranking/test_redis.py",
+        "datos": "ranking/hacker_news.csv",
+        "resultados": "ranking/resultados.csv",
+        "args": ["--carga", "pipeline"],
+        "por": ["mezcla", "distribucion"],
+    },
+    "queue": {
+        "script": "queue/test_redis.py",
+        "datos": "queue/customer_support_tickets.csv",
+        "resultados": "queue/resultados.csv",
+        "args": [],
+        "por": ["cola", "consumidores"],
+    },
+    "stream": {
+        "script": "userActivity/test_stream.py",
+        "datos": "userActivity",
+        "resultados": "userActivity/resultados_user_activity.csv",
+        "args": [],
+        "por": ["retencion", "retencion_limite", "retencion_exacta", "retencion_aplicacion"],
+    },
+}
+
+
+def celdas(cargas=None, modos=None, politicas=None, datasets=None):
+    """Lista de (carga, modo, politica, etiqueta_dataset), primero los datasets
+    más grandes para que las celdas largas no queden para el final."""
+    cargas = cargas or list(CARGAS)
+    modos = modos or list(MODOS_PERSISTENCIA)
+    politicas = politicas or list(POLITICAS)
+    datasets = datasets or list(DATASETS)
+    todas = list(itertools.product(cargas, modos, politicas, datasets))
+    return sorted(todas, key=lambda c: -DATASETS[c[3]])
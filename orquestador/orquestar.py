@@ -0,0 +1,516 @@
+# -*- coding: utf-8 -*-
+"""
+Orquestador de la matriz de benchmarks.
+
+En lugar de recrear el contenedor de Docker en cada celda y correr todo en
+serie, levanta un pool de redis-server locales (un puerto y un directorio de
+persistencia por instancia) que quedan calientes durante toda la matriz:
+entre celdas se reconfiguran con CONFIG SET, se vacían y se borran sus
+archivos RDB/AOF. Las celdas independientes corren en paralelo, cada una con
+su instancia; en Linux el redis-server y el cliente de cada instancia quedan
+fijados a CPUs propias (taskset) para que las celdas no se pisen.
+
+Cada celda escribe en un CSV temporal que al terminar se agrega (con lock) al
+CSV de resultados de su carga. Con --repeticiones K cada celda se corre K veces
+(intercaladas: primero la repetición 1 de toda la matriz, después la 2...), las
+filas llevan la columna `repeticion` y al final se escribe resumen.csv junto a
+los resultados con media e intervalo de confianza de cada métrica.
+
+Con --recuperacion, después de cada celda se reinicia su redis-server sobre
+el mismo directorio de persistencia y se mide cuánto tarda en volver con los
+datos (recuperacion.csv al lado de los resultados). --aof-rewrite si,no corre
+las celdas con AOF con y sin el BGREWRITEAOF final, para comparar la carga de
+un AOF consolidado contra la del log crudo.
+
+Cada instancia escucha también en un socket Unix, así la conexión del cliente
+es otra dimensión de la matriz: --transportes, --resps, --parsers,
+--decodificar y --conexiones (listas separadas por coma, ver
+comun/conexion.py) se combinan entre sí y con las celdas.
+
+Uso:
+  python orquestador/orquestar.py --cargas ranking,queue --datasets 100k,500k
+  python orquestador/orquestar.py --instancias 4 --args-ranking "--layout bucket"
+  python orquestador/orquestar.py --cargas queue --repeticiones 5
+  python orquestador/orquestar.py --cargas ranking --transportes tcp,unix --resps 2,3
+  python orquestador/orquestar.py --modos aof_everysec,mixto --recuperacion --aof-rewrite si,no
+"""
+
+import argparse
+import csv
+import itertools
+import os
+import queue
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import redis
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from comun import conexion, estadistica
+from comun.instrumentacion import PREFIJO_CELDA, tamanio_persistencia
+from comun.resultados import escribir_fila
+from comun.scripts import RAIZ
+
+from matriz import CARGAS, DATASETS, MODOS_PERSISTENCIA, POLITICAS, celdas
+
+# Parámetros que los benchmarks cambian (listpack, etc.) y que no hay que
+# volver al valor inicial en cada celda porque los fija la propia celda.
+_NO_RESTAURAR = {"save", "appendonly", "appendfsync", "maxmemory", "maxmemory-policy"}
+
+
+def fijar_cpus(cmd, cpus):
+    """`cmd` con el prefijo `taskset -c` que lo fija a `cpus` (sin efecto si no
+    hay taskset). No se usa preexec_fn: los procesos se lanzan desde los hilos
+    del pool y preexec_fn no es seguro con hilos."""
+    if not cpus or not shutil.which("taskset"):
+        return cmd
+    return ["taskset", "-c", ",".join(map(str, cpus))] + cmd
+
+
+class InstanciaRedis:
+    """Un redis-server local que se reutiliza entre celdas."""
+
+    def __init__(self, binario, puerto, directorio, cpus=None):
+        self.binario = binario
+        self.puerto = puerto
+        self.directorio = directorio
+        self.cpus = cpus
+        # En /tmp y no en el directorio de datos: la ruta de un socket Unix no puede pasar de ~100 bytes
+        self.socket = os.path.join(tempfile.gettempdir(), f"bdnr-redis-{puerto}.sock")
+        self.proceso = None
+        self.config_inicial = {}
+
+    def cliente(self):
+        return redis.Redis(host="127.0.0.1", port=self.puerto, decode_responses=True)
+
+    def _lanzar(self, config=()):
+        """Arranca el proceso; `config` son pares (parámetro, valor) que pisan
+        la configuración base."""
+        log = open(os.path.join(self.directorio, "redis-server.log"), "ab")
+        args = [self.binario, "--port", str(self.puerto), "--bind", "127.0.0.1",
+                "--unixsocket", self.socket, "--unixsocketperm", "700",
+                "--dir", self.directorio, "--dbfilename", "dump.rdb",
+                "--save", "", "--appendonly", "no"]
+        for clave, valor in config:
+            args += [f"--{clave}", valor]
+        self.proceso = subprocess.Popen(fijar_cpus(args, self.cpus), stdout=log,
+                                        stderr=subprocess.STDOUT)
+
+    def iniciar(self, timeout=10.0):
+        os.makedirs(self.directorio, exist_ok=True)
+        self.limpiar_archivos()
+        self._lanzar()
+        r = self.cliente()
+        inicio = time.time()
+        while True:
+            try:
+                r.ping()
+                break
+            except redis.ConnectionError:
+                if self.proceso.poll() is not None or time.time() - inicio > timeout:
+                    raise RuntimeError(f"no arrancó redis-server en el puerto {self.puerto}")
+                time.sleep(0.05)
+        self.config_inicial = r.config_get("*")
+
+    def medir_recuperacion(self, timeout=600.0, intervalo=0.01):
+        """Apaga la instancia (SHUTDOWN NOSAVE: quedan los archivos que dejó la
+        celda), la vuelve a levantar con la configuración que tenía la celda y
+        mide los tiempos desde el arranque del proceso:
+          t_conexion_s:  acepta conexiones (INFO responde, todavía cargando)
+          t_mitad_s:     loading_loaded_perc llega al 50%
+          t_listo_s:     terminó la carga y atiende comandos (time-to-ready)
+          t_completo_s:  listo y con todas las claves que había antes del
+                         reinicio (vacío si se perdieron datos)
+        Redis no atiende comandos mientras carga, así que si no se perdió nada
+        t_completo_s coincide con t_listo_s."""
+        r = self.cliente()
+        claves = r.dbsize()
+        memoria = r.info("memory")["used_memory"]
+        actual = r.config_get("*")
+        config = [(k, v) for k, v in actual.items() if self.config_inicial.get(k) != v]
+        rdb, aof = tamanio_persistencia(self.directorio)
+        self.detener(timeout)
+
+        t0 = time.perf_counter()
+        self._lanzar(config)
+        r = self.cliente()
+        t_conexion = t_mitad = t_listo = None
+        while True:
+            ahora = time.perf_counter() - t0
+            if self.proceso.poll() is not None or ahora > timeout:
+                raise RuntimeError(f"redis-server no volvió a estar listo en el puerto {self.puerto}")
+            try:
+                info = r.info("persistence")
+            except redis.ConnectionError:
+                # Todavía no escucha (o rechaza hasta la handshake mientras carga)
+                time.sleep(intervalo)
+                continue
+            if t_conexion is None:
+                t_conexion = ahora
+            if info.get("loading"):
+                if t_mitad is None and float(info.get("loading_loaded_perc", 0)) >= 50:
+                    t_mitad = ahora
+                time.sleep(intervalo)
+                continue
+            try:
+                r.ping()
+            except redis.ConnectionError:
+                time.sleep(intervalo)
+                continue
+            t_listo = ahora
+            break
+        recuperadas = r.dbsize()
+
+        def seg(t):
+            return f"{t:.3f}" if t is not None else ""
+
+        return {
+            "claves": claves, "claves_recuperadas": recuperadas,
+            "memoria_antes": memoria, "memoria_despues": r.info("memory")["used_memory"],
+            "rdb_bytes": rdb, "aof_bytes": aof,
+            "t_conexion_s": seg(t_conexion),
+            "t_mitad_s": seg(t_mitad if t_mitad is not None else t_listo),
+            "t_listo_s": seg(t_listo),
+            "t_completo_s": seg(t_listo if recuperadas >= claves else None),
+        }
+
+    def limpiar_archivos(self):
+        for nombre in ("dump.rdb", "appendonly.aof"):
+            ruta = os.path.join(self.directorio, nombre)
+            if os.path.exists(ruta):
+                os.remove(ruta)
+        shutil.rmtree(os.path.join(self.directorio, "appendonlydir"), ignore_errors=True)
+
+    def _esperar_persistencia(self, r, timeout=60.0):
+        inicio = time.time()
+        while time.time() - inicio < timeout:
+            info = r.info("persistence")
+            if not info.get("rdb_bgsave_in_progress") and not info.get("aof_rewrite_in_progress"):
+                return
+            time.sleep(0.1)
+
+    def preparar(self, modo, politica, reescribir_aof=True):
+        """Deja la instancia vacía, sin archivos de persistencia y con la
+        configuración de la celda, sin reiniciar el proceso. Sin
+        reescribir_aof se desactiva también el rewrite automático."""
+        r = self.cliente()
+        r.config_set("appendonly", "no")
+        r.config_set("save", "")
+        self._esperar_persistencia(r)
+        r.flushall()
+        r.script_flush()
+        try:
+            r.function_flush()
+        except redis.ResponseError:
+            pass  # Redis < 7 no tiene FUNCTION
+        self.limpiar_archivos()
+
+        # Volver a la configuración de arranque lo que haya cambiado otra celda
+        actual = r.config_get("*")
+        for clave, valor in self.config_inicial.items():
+            if clave in _NO_RESTAURAR or actual.get(clave) == valor:
+                continue
+            try:
+                r.config_set(clave, valor)
+            except redis.ResponseError:
+                pass  # parámetros que no se pueden cambiar en caliente
+
+        for clave, valor in MODOS_PERSISTENCIA[modo] + POLITICAS[politica]:
+            r.config_set(clave, valor)
+        if not reescribir_aof:
+            r.config_set("auto-aof-rewrite-percentage", 0)
+        self._esperar_persistencia(r)
+        r.config_resetstat()
+
+    def reponer(self):
+        """Después de una celda: si el redis-server quedó caído o no responde
+        (reinicio de recuperación fallido, cliente que lo tiró) lo vuelve a
+        levantar. Devuelve False si no arranca."""
+        if self.proceso is not None and self.proceso.poll() is None:
+            try:
+                self.cliente().ping()
+                return True
+            except redis.RedisError:
+                pass
+        self.detener()
+        try:
+            self.iniciar()
+        except RuntimeError:
+            return False
+        return True
+
+    def detener(self, timeout=10):
+        if self.proceso is None:
+            return
+        try:
+            self.cliente().shutdown(nosave=True)
+        except redis.RedisError:
+            pass  # la conexión se corta al apagar
+        try:
+            self.proceso.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            self.proceso.kill()
+        self.proceso = None
+
+
+def repartir_cpus(n_instancias, cpus_por_celda):
+    """Para cada instancia: (cpus del redis-server, cpus del cliente)."""
+    if not hasattr(os, "sched_getaffinity"):
+        return [(None, None)] * n_instancias
+    cpus = sorted(os.sched_getaffinity(0))
+    res = []
+    for i in range(n_instancias):
+        propias = [cpus[(i * cpus_por_celda + j) % len(cpus)] for j in range(cpus_por_celda)]
+        servidor = {propias[0]}
+        cliente = set(propias[1:]) or servidor
+        res.append((servidor, cliente))
+    return res
+
+
+def variantes_conexion(transportes, resps, parsers, decodificar, conexiones):
+    """Lista de dicts opción -> valor con todas las combinaciones pedidas."""
+    listas = [transportes, resps, parsers, decodificar, conexiones]
+    return [dict(zip(conexion.COLUMNAS, valores)) for valores in itertools.product(*listas)]
+
+
+def etiqueta_variante(variante):
+    return "-".join(str(v) for v in variante.values())
+
+
+def usa_aof(modo):
+    return any(clave == "appendonly" and valor == "yes" for clave, valor in MODOS_PERSISTENCIA[modo])
+
+
+def correr_celda(celda, instancia, cpus_cliente, args_extra, rutas_datos, lock, log_dir,
+                 repeticion=1, variante=None, reescribir_aof=True, recuperacion=False):
+    """Corre una celda (con la variante de conexión dada) y agrega sus filas
+    a los resultados; con `recuperacion` después reinicia la instancia y agrega
+    la fila de recuperacion.csv. Devuelve las filas."""
+    carga, modo, politica, etiqueta = celda
+    conf = CARGAS[carga]
+    nombre = f"{carga}_{modo}_{politica}_{etiqueta}_r{repeticion}"
+    if variante:
+        nombre += "_" + etiqueta_variante(variante)
+    if not reescribir_aof:
+        nombre += "_sinrewrite"
+    resultados = os.path.join(RAIZ, conf["resultados"])
+    # El CSV temporal va al lado del definitivo: así las series de INFO
+    # (series_info/) quedan junto a los resultados de la carga.
+    temporal = os.path.join(os.path.dirname(resultados), f"{PREFIJO_CELDA}{nombre}.csv")
+    if os.path.exists(temporal):
+        os.remove(temporal)
+
+    instancia.preparar(modo, politica, reescribir_aof)
+    cmd = [sys.executable, os.path.join(RAIZ, conf["script"]), rutas_datos[carga],
+           modo, politica, str(DATASETS[etiqueta]), instancia.directorio, temporal,
+           "--host", "127.0.0.1", "--puerto", str(instancia.puerto), "--socket", instancia.socket]
+    for opcion, valor in (variante or {}).items():
+        cmd += [f"--{opcion}", str(valor)]
+    if not reescribir_aof:
+        cmd.append("--sin-rewrite-aof")
+    cmd += conf["args"] + args_extra.get(carga, [])
+
+    inicio = time.time()
+    with open(os.path.join(log_dir, nombre + ".log"), "w") as log:
+        log.write(" ".join(shlex.quote(c) for c in cmd) + "\n")
+        log.flush()
+        proc = subprocess.run(fijar_cpus(cmd, cpus_cliente), stdout=log,
+                              stderr=subprocess.STDOUT, cwd=RAIZ)
+    duracion = time.time() - inicio
+
+    leidas = []
+    if os.path.exists(temporal):
+        with open(temporal, newline="") as f:
+            leidas = list(csv.DictReader(f))
+        with lock:
+            for fila in leidas:
+                fila["repeticion"] = repeticion
+                escribir_fila(resultados, fila)
+        os.remove(temporal)
+    estado = "ok" if proc.returncode == 0 else f"ERROR ({proc.returncode})"
+    print(f"[{instancia.puerto}] {nombre}: {estado}, {len(leidas)} filas en {duracion:.1f}s")
+    if proc.returncode != 0:
+        return None
+
+    if recuperacion:
+        res = instancia.medir_recuperacion()
+        with lock:
+            escribir_fila(os.path.join(os.path.dirname(resultados), "recuperacion.csv"), {
+                "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"), "carga": carga, "modo": modo,
+                "politica": politica, "dataset": DATASETS[etiqueta], "repeticion": repeticion,
+                **(variante or {}), "aof_rewrite": "si" if reescribir_aof else "no", **res,
+            })
+        print(f"[{instancia.puerto}] {nombre}: recuperación de {res['claves_recuperadas']}/"
+              f"{res['claves']} claves, listo en {res['t_listo_s']}s")
+    return leidas
+
+
+def resumir(carga, filas, confianza):
+    """Media e IC de cada métrica por celda (+ columnas `por` de la carga);
+    se agrega a resumen.csv al lado de los resultados de la carga."""
+    claves = (estadistica.DIMENSIONES + CARGAS[carga].get("por", []) + conexion.COLUMNAS
+              + ["aof_rewrite"])
+    destino = os.path.join(os.path.dirname(os.path.join(RAIZ, CARGAS[carga]["resultados"])),
+                           "resumen.csv")
+    fecha = time.strftime("%Y-%m-%dT%H:%M:%S")
+    for clave, grupo in estadistica.agrupar(filas, claves).items():
+        metricas = [c for c in grupo[0] if estadistica.es_metrica(c)]
+        partes = []
+        for metrica in metricas:
+            v = estadistica.valores(grupo, metrica)
+            if not v:
+                continue
+            m, inf, sup = estadistica.intervalo(v, confianza)
+            escribir_fila(destino, {
+                "fecha": fecha, "carga": carga, **dict(zip(claves, clave)),
+                "metrica": metrica, "n": len(v), "media": f"{m:.3f}",
+                "ic_inf": f"{inf:.3f}", "ic_sup": f"{sup:.3f}", "confianza": confianza,
+            })
+            if metrica in ("throughput", "lat_p99_ms"):
+                partes.append(f"{metrica} = {m:.3f} [{inf:.3f}, {sup:.3f}]")
+        print(f"  {carga} {' '.join(str(c) for c in clave)}: {' | '.join(partes)}")
+    print(f"Resumen de {carga} en {destino}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Corre la matriz de benchmarks en paralelo sobre redis-server locales")
+    parser.add_argument("--cargas", default=",".join(CARGAS),
+                        help="cargas a correr, separadas por coma")
+    parser.add_argument("--modos", default=",".join(MODOS_PERSISTENCIA))
+    parser.add_argument("--politicas", default=",".join(POLITICAS))
+    parser.add_argument("--datasets", default=",".join(DATASETS))
+    parser.add_argument("--cpus-por-celda", type=int, default=2,
+                        help="CPUs por instancia: una para redis-server, el resto para el cliente")
+    parser.add_argument("--instancias", type=int, default=0,
+                        help="redis-server concurrentes (0 = CPUs disponibles / cpus-por-celda)")
+    parser.add_argument("--puerto-base", type=int, default=6400)
+    parser.add_argument("--dir-base", default=os.path.join(RAIZ, "orquestador", "redis-data"),
+                        help="se crea un subdirectorio de persistencia por instancia")
+    parser.add_argument("--redis-server", default="redis-server", help="binario de redis-server")
+    parser.add_argument("--datos-ranking", default=os.path.join(RAIZ, CARGAS["ranking"]["datos"]))
+    parser.add_argument("--datos-queue", default=os.path.join(RAIZ, CARGAS["queue"]["datos"]))
+    parser.add_argument("--datos-stream", default=os.path.join(RAIZ, CARGAS["stream"]["datos"]),
+                        help="archivo, directorio o patrón de archivos .json.gz")
+    parser.add_argument("--args-ranking", default="", help="argumentos extra para ranking")
+    parser.add_argument("--args-queue", default="", help="argumentos extra para queue")
+    parser.add_argument("--args-stream", default="", help="argumentos extra para stream")
+    parser.add_argument("--transportes", default="tcp", help="tcp y/o unix, separados por coma")
+    parser.add_argument("--resps", default="2", help="versiones de RESP (ej: 2,3)")
+    parser.add_argument("--parsers", default="auto", help="auto, hiredis y/o python")
+    parser.add_argument("--decodificar", default="si", help="si y/o no")
+    parser.add_argument("--conexiones", default="pool", help="pool y/o unica")
+    parser.add_argument("--recuperacion", action="store_true",
+                        help="después de cada celda reinicia redis-server y mide el tiempo "
+                             "hasta estar listo con los datos (recuperacion.csv)")
+    parser.add_argument("--aof-rewrite", default="si",
+                        help="si y/o no: BGREWRITEAOF al final de las celdas con AOF")
+    parser.add_argument("--repeticiones", type=int, default=1,
+                        help="veces que se corre cada celda")
+    parser.add_argument("--confianza", type=float, default=0.95,
+                        help="nivel de confianza de los intervalos del resumen")
+    parser.add_argument("--dry-run", action="store_true", help="solo lista las celdas")
+    args = parser.parse_args()
+
+    lista = celdas(args.cargas.split(","), args.modos.split(","),
+                   args.politicas.split(","), args.datasets.split(","))
+    variantes = variantes_conexion(
+        args.transportes.split(","), args.resps.split(","), args.parsers.split(","),
+        args.decodificar.split(","), args.conexiones.split(","))
+    # Con una sola variante no se nombra (los nombres de celda quedan como antes)
+    variantes = variantes if len(variantes) > 1 else [None]
+    rewrites = [x == "si" for x in args.aof_rewrite.split(",")]
+    # Sin AOF el rewrite no cambia nada: esas celdas se corren una sola vez
+    tareas = [(celda, k + 1, v, rw) for k in range(args.repeticiones) for celda in lista
+              for v in variantes
+              for rw in (rewrites if usa_aof(celda[1]) else [True])]
+    if args.dry_run:
+        for celda, k, v, rw in tareas:
+            print(*celda, f"r{k}", etiqueta_variante(v) if v else "", "" if rw else "sin rewrite")
+        return
+
+    if shutil.which(args.redis_server) is None and not os.path.isfile(args.redis_server):
+        print("ERROR: no se encontró redis-server:", args.redis_server)
+        sys.exit(1)
+
+    n = args.instancias
+    if n <= 0:
+        disponibles = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+        n = max(1, disponibles // args.cpus_por_celda)
+    n = min(n, len(tareas))
+    rutas_datos = {"ranking": args.datos_ranking, "queue": args.datos_queue,
+                   "stream": args.datos_stream}
+    args_extra = {"ranking": shlex.split(args.args_ranking),
+                  "queue": shlex.split(args.args_queue),
+                  "stream": shlex.split(args.args_stream)}
+    log_dir = os.path.join(RAIZ, "orquestador", "logs")
+    os.makedirs(log_dir, exist_ok=True)
+
+    instancias = []
+    libres = queue.Queue()
+    lock = threading.Lock()
+    print(f"=== {len(lista)} celdas x {len(variantes)} variantes de conexión x "
+          f"{args.repeticiones} repeticiones en {n} instancias de redis-server ===")
+    inicio = time.time()
+    try:
+        for i, (cpus_srv, cpus_cli) in enumerate(repartir_cpus(n, args.cpus_por_celda)):
+            inst = InstanciaRedis(args.redis_server, args.puerto_base + i,
+                                  os.path.join(args.dir_base, f"redis-{args.puerto_base + i}"),
+                                  cpus_srv)
+            inst.iniciar()
+            instancias.append(inst)
+            libres.put((inst, cpus_cli))
+
+        vivas = [len(instancias)]
+
+        def tarea(celda_rep):
+            celda, k, variante, reescribir = celda_rep
+            libre = libres.get()
+            if libre is None:
+                # No queda ninguna instancia: se pasa el aviso a la siguiente tarea
+                libres.put(None)
+                print(f"{' '.join(celda)}: sin instancias de redis-server, no se corre")
+                return None
+            inst, cpus_cli = libre
+            try:
+                return correr_celda(celda, inst, cpus_cli, args_extra, rutas_datos, lock,
+                                    log_dir, k, variante, reescribir, args.recuperacion)
+            except (redis.RedisError, RuntimeError) as e:
+                print(f"[{inst.puerto}] {' '.join(celda)}: ERROR en Redis: {e}")
+                return None
+            finally:
+                if inst.reponer():
+                    libres.put((inst, cpus_cli))
+                else:
+                    print(f"[{inst.puerto}] redis-server no vuelve a arrancar: "
+                          f"la instancia sale del pool")
+                    with lock:
+                        vivas[0] -= 1
+                        if vivas[0] == 0:
+                            libres.put(None)
+
+        with ThreadPoolExecutor(max_workers=n) as pool:
+            salidas = list(pool.map(tarea, tareas))
+    finally:
+        for inst in instancias:
+            inst.detener()
+
+    print(f"Matriz completada en {time.time() - inicio:.1f}s: "
+          f"{sum(s is not None for s in salidas)}/{len(tareas)} corridas ok. Logs en {log_dir}")
+
+    if args.repeticiones > 1:
+        por_carga = {}
+        for (celda, *_), filas in zip(tareas, salidas):
+            por_carga.setdefault(celda[0], []).extend(filas or [])
+        for carga, filas in por_carga.items():
+            resumir(carga, filas, args.confianza)
+
+
+if __name__ == "__main__":
+    main()
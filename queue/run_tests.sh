@@ -50,6 +50,26 @@ REDIS_PERSISTENCE_DIR="/home/sofi/redis-data"
 PYTHON_SCRIPT="/mnt/c/Users/PC/Escritorio/bdnr 2025/bdnr-2025/queue/test_redis.py"
 CSV_PATH="/mnt/c/Users/PC/Escritorio/bdnr 2025/bdnr-2025/queue/customer_support_tickets.csv"
 
+# ------------------------------
+# 5) Consumo (simple | confiable) y workers a medir en modo confiable
+# ------------------------------
+CONSUME_MODE="${CONSUME_MODE:-simple}"
+WORKERS="${WORKERS:-1,2,4,8}"
+WORKER_TYPE="${WORKER_TYPE:-thread}"
+# Cola FIFO (lista) o por prioridad (ZSET + ZPOPMIN/BZPOPMIN), tickets por ZPOPMIN
+QUEUE_TYPE="${QUEUE_TYPE:-lista}"
+POP_N="${POP_N:-1}"
+
+# ------------------------------
+# 6) Conexión del cliente (comun/conexion.py). El contenedor escucha también
+#    en un socket Unix dentro del directorio de persistencia (TRANSPORT=unix).
+# ------------------------------
+TRANSPORT="${TRANSPORT:-tcp}"
+RESP="${RESP:-2}"
+PARSER="${PARSER:-auto}"
+DECODE="${DECODE:-si}"
+CONN="${CONN:-pool}"
+
 mkdir -p "$REDIS_PERSISTENCE_DIR"
 
 echo "Iniciando pruebas…"
@@ -69,7 +89,8 @@ for mode in "${!PERSISTENCE_MODES_CMDS[@]}"; do
         -v "$REDIS_PERSISTENCE_DIR":/data \
         -p 6380:6379 \
         redis:7.4 \
-        redis-server --dir /data --dbfilename dump.rdb
+        redis-server --dir /data --dbfilename dump.rdb \
+        --unixsocket /data/redis.sock --unixsocketperm 777
 
       for cmdVar in ${PERSISTENCE_MODES_CMDS[$mode]}; do
         declare -n arr="$cmdVar"
@@ -103,7 +124,18 @@ for mode in "${!PERSISTENCE_MODES_CMDS[@]}"; do
         "$policy" \
         "$size" \
         "$REDIS_PERSISTENCE_DIR" \
-        "$RESULTS_FILE"
+        "$RESULTS_FILE" \
+        --consumo "$CONSUME_MODE" \
+        --workers "$WORKERS" \
+        --tipo-worker "$WORKER_TYPE" \
+        --cola "$QUEUE_TYPE" \
+        --pop-n "$POP_N" \
+        --transporte "$TRANSPORT" \
+        --socket "$REDIS_PERSISTENCE_DIR/redis.sock" \
+        --resp "$RESP" \
+        --parser "$PARSER" \
+        --decodificar "$DECODE" \
+        --conexiones "$CONN"
 
       # Forzar snapshot SAVE después del benchmark
       echo "  -> Forzando snapshot SAVE"
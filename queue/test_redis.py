@@ -2,213 +2,506 @@
 # -*- coding: utf-8 -*-
 """
 Benchmark Redis con sistema de cola de tickets de soporte.
-Usa LIST y HASH de Redis.
+Usa LIST y HASH de Redis; con --cola prioridad la cola es un ZSET con score
+prioridad * 1e13 + ms de encolado, consumido con ZPOPMIN / BZPOPMIN.
 Se llama desde run_tests.sh
 """
-import redis
+import argparse
+import numpy as np
 import pandas as pd
 import random
 import time
 import os
 import sys
-import csv
+import resource
+import threading
+import multiprocessing as mp
 from datetime import datetime
 
-def cargar_tickets(path_csv, max_tickets, expandir_tickets=True):
-    """Carga el CSV en memoria, expandiendo si es necesario para llegar a max_tickets"""
-    df = pd.read_csv(path_csv)
-    total = len(df)
-    print(f"Filas totales en CSV: {total}")
-    
-    # Rellenar nulos correctamente según tipo
-    for col in df.select_dtypes(include=["object"]).columns:
-        df[col].fillna("", inplace=True)
-    for col in df.select_dtypes(include=["number"]).columns:
-        df[col].fillna(0, inplace=True)
-
-    tickets = []
-    contador = 0
-    id_global = 0
-
-    while contador < max_tickets:
-        for _, row in df.iterrows():
-            if contador >= max_tickets:
-                break
-
-            versiones = [0] if not expandir_tickets else range(4)
-            for v in versiones:
-                if contador >= max_tickets:
-                    break
-
-                ticket_id = f"tkt:{id_global}"
-                id_global += 1
-
-                subject = row["Ticket Subject"] if v == 0 else f"{row['Ticket Subject']} - versión {v}"
-
-                ticket = {
-                    "Ticket ID": ticket_id,
-                    "Customer Name": row.get("Customer Name", ""),
-                    "Customer Email": row.get("Customer Email", ""),
-                    "Ticket Subject": subject,
-                    "Ticket Priority": row.get("Ticket Priority", ""),
-                    "Ticket Status": row.get("Ticket Status", ""),
-                }
-                tickets.append(ticket)
-                contador += 1
-
-                if contador % 100000 == 0:
-                    print(f"Cargados {contador} tickets...")
-
-            if contador >= max_tickets:
-                break
-
-    print(f"Tickets cargados en memoria: {len(tickets)}")
-    return tickets
-
-
-def ejecutar_operaciones(r, tickets, rondas=3):
-    """Mide latencias de inserción y consumo en Redis"""
-    consume_lat = []
-    n = len(tickets)
-
-    # Inserción de todos los tickets antes de consumo
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from comun import cache_columnar, conexion, perfilado
+from comun.conexion import campo, texto
+from comun.funciones import Funciones
+from comun.histograma import Histograma
+from comun.instrumentacion import (columnas_keyspace, columnas_muestreo, contadores_keyspace,
+                                   contar_claves, fraccion, iniciar_muestreo, medir_metricas)
+from comun.resultados import escribir_fila
+
+COLUMNAS_TICKET = ["Customer Name", "Customer Email", "Ticket Subject",
+                   "Ticket Priority", "Ticket Status"]
+
+COLA = "tickets_queue"
+COLA_PRIORIDAD = "tickets_pq"
+# Ticket Priority -> prioridad en el ZSET (menor sale primero)
+PRIORIDADES = {"Critical": 0, "High": 1, "Medium": 2, "Low": 3}
+
+
+def score_prioridad(prioridad, encolado_ms):
+    """Prioridad en los dígitos altos y ms de encolado en los bajos (FIFO dentro
+    de cada prioridad). Entra exacto en el double del score hasta ~9e15."""
+    return PRIORIDADES.get(prioridad, len(PRIORIDADES)) * 10**13 + encolado_ms
+
+
+def registrar_espera(esperas, datos, ahora_ns):
+    """Suma la espera en cola de un ticket leído al histograma de su prioridad."""
+    encolado = campo(datos, "enqueued_ms")
+    if encolado is None:
+        return
+    hist = esperas.setdefault(campo(datos, "ticket_priority") or "", Histograma())
+    hist.registrar(max(0, ahora_ns - int(encolado) * 1_000_000))
+
+
+def combinar_esperas(destino, otras):
+    for prioridad, hist in otras.items():
+        destino.setdefault(prioridad, Histograma()).combinar(hist)
+    return destino
+
+
+def columnas_espera(esperas):
+    """p50/p99 de la espera en cola por prioridad."""
+    cols = {}
+    for prioridad in PRIORIDADES:
+        hist = esperas.get(prioridad)
+        nombre = prioridad.lower()
+        cols[f"espera_{nombre}_p50_ms"] = f"{hist.percentil_ms(50):.3f}" if hist else ""
+        cols[f"espera_{nombre}_p99_ms"] = f"{hist.percentil_ms(99):.3f}" if hist else ""
+    return cols
+
+
+def _expandir_pasada(df, expandir_tickets=True):
+    """Expande una pasada completa del CSV con operaciones vectorizadas.
+    Cada fila aparece 4 veces (versiones 0..3) en el mismo orden que antes
+    (fila0 v0..v3, fila1 v0..v3, ...) y las versiones > 0 llevan el sufijo
+    ' - versión {v}' en el subject."""
+    if not expandir_tickets:
+        return df.reset_index(drop=True)
+    exp = df.loc[df.index.repeat(4)].reset_index(drop=True)
+    version = pd.Series(np.tile(np.arange(4), len(df)))
+    sufijo = (" - versión " + version.astype(str)).where(version > 0, "")
+    exp["Ticket Subject"] = exp["Ticket Subject"].astype(str) + sufijo
+    return exp
+
+
+def _construir_pasada(path_csv, expandir_tickets=True):
+    df = pd.read_csv(path_csv, usecols=COLUMNAS_TICKET)
+    print(f"Filas totales en CSV: {len(df)}")
+
+    # Las cinco columnas usadas son de texto
+    df = df.fillna("")
+
+    pasada = _expandir_pasada(df, expandir_tickets)
+    return {c: pasada[c].astype(str).tolist() for c in COLUMNAS_TICKET}, {}
+
+
+def preparar_tickets(path_csv, expandir_tickets=True):
+    """Pasada expandida del CSV desde la cache columnar (se genera la primera vez)."""
+    return cache_columnar.obtener(
+        "queue", [path_csv], {"expandir": expandir_tickets},
+        lambda: _construir_pasada(path_csv, expandir_tickets))
+
+
+def cargar_tickets(path_csv, max_tickets, expandir_tickets=True, tam_lote=10_000):
+    """Generador de lotes de tickets listos para insertar.
+    La pasada expandida del CSV (~34k filas) se lee de la cache columnar;
+    los ids tkt:{n} se numeran globalmente y cada lote es (primer_n, filas),
+    con las filas como tuplas en el orden de COLUMNAS_TICKET. Así la memoria
+    del cliente no crece con max_tickets y el primer lote sale enseguida."""
+    tabla = preparar_tickets(path_csv, expandir_tickets)
+    columnas = [tabla[c] for c in COLUMNAS_TICKET]
+    n_pasada = len(tabla)
+    if n_pasada == 0:
+        return
+
+    emitidos = 0
+    while emitidos < max_tickets:
+        inicio = emitidos % n_pasada
+        fin = min(inicio + tam_lote, n_pasada, inicio + max_tickets - emitidos)
+        yield emitidos, list(zip(*(col.rebanada(inicio, fin) for col in columnas)))
+
+        antes = emitidos
+        emitidos += fin - inicio
+        if emitidos // 100000 > antes // 100000:
+            print(f"Generados {emitidos // 100000 * 100000} tickets...")
+
+
+def rss_max_kb():
+    """Pico de RSS del proceso cliente en KB (ru_maxrss viene en bytes en macOS)."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+
+def encolar_ticket(cliente, tid, fila, cola="lista"):
+    """HASH del ticket (con el ms de encolado) + LPUSH a la cola, o ZADD con
+    score_prioridad en la cola de prioridad. `cliente` puede ser un pipeline."""
+    nombre, email, subject, prioridad, estado = fila
+    encolado_ms = time.time_ns() // 1_000_000
+    cliente.hset(f"ticket:{tid}", mapping={
+        "customer_name": nombre,
+        "customer_email": email,
+        "ticket_subject": subject,
+        "ticket_priority": prioridad,
+        "ticket_status": estado,
+        "enqueued_ms": encolado_ms,
+    })
+    if cola == "prioridad":
+        cliente.zadd(COLA_PRIORIDAD, {tid: score_prioridad(prioridad, encolado_ms)})
+    else:
+        cliente.lpush(COLA, tid)
+
+
+def insertar_tickets(r, lotes, t_inicio, cola="lista"):
+    """Inserta los lotes a medida que se generan (HASH + LPUSH por ticket, o
+    ZADD con score_prioridad en la cola de prioridad). El hash guarda el ms de
+    encolado para medir la espera al consumir.
+    Devuelve (tickets insertados, segundos desde t_inicio hasta el primer insert)."""
     print("=== Fase de inserción ===")
-    for t in tickets:
-        r.hset(f"ticket:{t['Ticket ID']}", mapping={
-            "customer_name": t["Customer Name"],
-            "customer_email": t["Customer Email"],
-            "ticket_subject": t["Ticket Subject"],
-            "ticket_priority": t["Ticket Priority"],
-            "ticket_status": t["Ticket Status"],
-        })
-        r.lpush("tickets_queue", t["Ticket ID"])
+    n = 0
+    t_primer = None
+    for primer_n, filas in lotes:
+        for i, fila in enumerate(filas):
+            encolar_ticket(r, f"tkt:{primer_n + i}", fila, cola)
+            if t_primer is None:
+                t_primer = time.time() - t_inicio
+        n += len(filas)
+    print(f"Tickets insertados: {n}")
+    return n, (t_primer or 0)
+
+
+def pop_prioridad(r, n):
+    """ZPOPMIN de hasta n tickets + HGETALL de cada uno en un pipeline."""
+    sacados = r.zpopmin(COLA_PRIORIDAD, n)
+    if not sacados:
+        return []
+    pipe = r.pipeline(transaction=False)
+    for tid, _ in sacados:
+        pipe.hgetall(f"ticket:{texto(tid)}")
+    return list(zip((tid for tid, _ in sacados), pipe.execute()))
+
+
+def ejecutar_operaciones(r, rondas=3, hist=None, funciones=None, pop_n=1, cola="lista"):
+    """Mide latencias de consumo en Redis. Con `funciones` (modo servidor) cada
+    llamada a bdnr_pop_y_leer saca hasta pop_n tickets con sus datos en un solo
+    round trip; la latencia es la de cada llamada. En la cola de prioridad el
+    cliente hace ZPOPMIN de pop_n tickets y los lee en un pipeline.
+    Devuelve (hist, throughput, cuentas) con los hits/misses del keyspace, los
+    ids colgantes (sacados de la cola pero con el hash desalojado), el
+    throughput útil (solo tickets que se pudieron leer) y la espera en cola
+    por prioridad."""
+    hist = hist if hist is not None else Histograma()
 
     # Consumo de tickets simulando procesamiento por rondas
     print("=== Fase de consumo ===")
-    ops = 0
-    t0 = time.time()
+    ops = colgantes = 0
+    esperas = {}
+    ks_inicial = contadores_keyspace(r)
+    t0 = time.perf_counter()
     for i in range(rondas):
         while True:
-            start = time.time()
-            tid = r.rpop("tickets_queue")
-            if tid is None:
+            start = time.perf_counter_ns()
+            if funciones is not None:
+                tickets = funciones.pop_y_leer(COLA_PRIORIDAD if cola == "prioridad" else COLA,
+                                               pop_n, "ticket:", zset=cola == "prioridad")
+            elif cola == "prioridad":
+                tickets = pop_prioridad(r, pop_n)
+            else:
+                tid = r.rpop(COLA)
+                tickets = [] if tid is None else [(tid, r.hgetall(f"ticket:{texto(tid)}"))]
+            if not tickets:
                 break
-            _ = r.hgetall(f"ticket:{tid}")
-            consume_lat.append(time.time() - start)
-            ops += 2  # RPOP + HGETALL
+            hist.registrar(time.perf_counter_ns() - start)
+            ahora = time.time_ns()
+            ops += 2 * len(tickets)  # (RPOP | ZPOPMIN) + HGETALL por ticket
+            for _, datos in tickets:
+                if datos:
+                    registrar_espera(esperas, datos, ahora)
+                else:
+                    colgantes += 1
         print(f"Ronda {i+1}/{rondas} completada.")
-    dt = time.time() - t0
+    dt = time.perf_counter() - t0
 
-    ms = sorted([l * 1000 for l in consume_lat])
-    p50 = ms[len(ms) // 2] if ms else 0
-    p99 = ms[int(len(ms) * 0.99)] if len(ms) > 1 else p50
     thr = ops / dt if dt > 0 else 0
-
-    return p50, p99, thr
+    cuentas = cuentas_consumo(ks_inicial, contadores_keyspace(r), ops, 2 * colgantes,
+                              colgantes, dt, esperas)
+    print(f"Consumo: {hist}")
+
+    return hist, thr, cuentas
+
+
+def cuentas_consumo(ks_inicial, ks_final, ops, ops_colgantes, colgantes, dt, esperas):
+    """Columnas de desalojos del consumo: hits/misses del keyspace, ids
+    colgantes y throughput contando solo las operaciones sobre tickets vivos;
+    más la espera en cola por prioridad."""
+    if colgantes:
+        print(f"Desalojos: {colgantes} ids en la cola sin su hash de ticket")
+    for prioridad in PRIORIDADES:
+        if prioridad in esperas:
+            print(f"Espera {prioridad}: {esperas[prioridad]}")
+    utiles = ops - ops_colgantes
+    return {
+        **columnas_keyspace(ks_inicial, ks_final),
+        "colgantes": colgantes,
+        "useful_throughput": f"{utiles / dt:.1f}" if dt > 0 else "0.0",
+        **columnas_espera(esperas),
+    }
 
 
-def esperar_bgsave(r, timeout=60.0, interval=0.5):
-    start = time.time()
+def reencolar(r, n_tickets, tam_lote=10_000, cola="lista"):
+    """Vuelve a llenar la cola con tkt:0..n-1 (mismo orden que la inserción)
+    para poder repetir el consumo con otra cantidad de workers. Renueva el ms
+    de encolado de los tickets que siguen en Redis (los desalojados se
+    encolan igual, para que el consumo los encuentre colgantes)."""
+    r.delete(COLA, COLA_PRIORIDAD)
+    pipe = r.pipeline(transaction=False)
+    for inicio in range(0, n_tickets, tam_lote):
+        ids = [f"tkt:{n}" for n in range(inicio, min(inicio + tam_lote, n_tickets))]
+        for tid in ids:
+            pipe.hget(f"ticket:{tid}", "ticket_priority")
+        prioridades = pipe.execute()
+        encolado_ms = time.time_ns() // 1_000_000
+        for tid, prioridad in zip(ids, prioridades):
+            if prioridad is not None:
+                pipe.hset(f"ticket:{tid}", "enqueued_ms", encolado_ms)
+        if cola == "prioridad":
+            pipe.zadd(COLA_PRIORIDAD, {tid: score_prioridad(texto(p), encolado_ms)
+                                       for tid, p in zip(ids, prioridades)})
+        else:
+            pipe.lpush(COLA, *ids)
+        pipe.execute()
+
+
+def recuperar_pendientes(r):
+    """Devuelve a tickets_queue lo que haya quedado en las listas de procesamiento
+    (workers que murieron sin hacer ack), también las de corridas anteriores
+    con más workers. Devuelve cuántos tickets recuperó."""
+    recuperados = 0
+    for clave in list(r.scan_iter(match="tickets_processing:*", count=1000)):
+        while r.lmove(clave, COLA, "LEFT", "RIGHT") is not None:
+            recuperados += 1
+    if recuperados:
+        print(f"Recuperados {recuperados} tickets sin ack.")
+    return recuperados
+
+
+def _consumidor_confiable(opciones, worker_id, timeout_bloqueo, barrera, cola="lista"):
+    """Worker del patrón reliable queue: BLMOVE de tickets_queue a su lista
+    tickets_processing:{id}, HGETALL del ticket y ack con LREM.
+    En la cola de prioridad hace BZPOPMIN + HGETALL (un ZSET no tiene un
+    BLMOVE, así que no hay lista de procesamiento ni ack).
+    Termina cuando el pop bloqueante vence sin datos.
+    Devuelve (ops, histograma, t_inicio, t_ultimo_ack, ids colgantes, esperas)."""
+    r = conexion.conectar(opciones)
+    procesando = f"tickets_processing:{worker_id}"
+    hist = Histograma()
+    esperas = {}
+    ops = colgantes = 0
+    barrera.wait()
+    t_inicio = t_ultimo = time.time()
     while True:
-        info = r.info("persistence")
-        if info.get("rdb_bgsave_in_progress") == 0:
-            break
-        if time.time() - start > timeout:
-            print("WARNING: timeout esperando fin de BGSAVE previo")
-            return False
-        time.sleep(interval)
-    r.bgsave()
-    while True:
-        info = r.info("persistence")
-        if info.get("rdb_bgsave_in_progress") == 0:
-            break
-        if time.time() - start > timeout:
-            print("WARNING: timeout esperando BGSAVE")
-            return False
-        time.sleep(interval)
-    return True
-
-
-def medir_metricas(r, redis_dir, modo):
-    if modo.startswith("rdb") or modo == "mixto":
-        esperar_bgsave(r)
-    if modo.startswith("aof") or modo == "mixto":
-        start = time.time()
-        while r.info("persistence").get("aof_rewrite_in_progress", 0) == 1:
-            time.sleep(0.1)
-            if time.time() - start > 30:
-                print("WARNING: timeout esperando fin de AOF rewrite previo")
+        start = time.perf_counter_ns()
+        if cola == "prioridad":
+            sacado = r.bzpopmin(COLA_PRIORIDAD, timeout_bloqueo)
+            if sacado is None:
                 break
-        r.bgrewriteaof()
-        start = time.time()
-        while r.info("persistence").get("aof_rewrite_in_progress", 0) == 1:
-            time.sleep(0.1)
-            if time.time() - start > 30:
-                print("WARNING: timeout esperando nuevo AOF rewrite")
+            tid = sacado[1]
+            datos = r.hgetall(f"ticket:{texto(tid)}")
+            ops += 2  # BZPOPMIN + HGETALL
+        else:
+            tid = r.blmove(COLA, procesando, timeout_bloqueo, "RIGHT", "LEFT")
+            if tid is None:
                 break
+            datos = r.hgetall(f"ticket:{texto(tid)}")
+            r.lrem(procesando, 1, tid)
+            ops += 3  # BLMOVE + HGETALL + LREM
+        hist.registrar(time.perf_counter_ns() - start)
+        t_ultimo = time.time()
+        if datos:
+            registrar_espera(esperas, datos, time.time_ns())
+        else:
+            colgantes += 1
+    return ops, hist, t_inicio, t_ultimo, colgantes, esperas
+
+
+def _proceso_consumidor(opciones, worker_id, timeout_bloqueo, barrera, salida, cola):
+    salida.put(_consumidor_confiable(opciones, worker_id, timeout_bloqueo, barrera, cola))
+
+
+def consumir_con_workers(r, n_workers, tipo_worker="thread", timeout_bloqueo=0.5,
+                         cola="lista"):
+    """Consume la cola con n_workers consumidores confiables (hilos o procesos),
+    cada uno con su propia conexión (con las mismas opciones que r). El tiempo se mide desde que arrancan todos
+    (barrera) hasta el último ack, sin contar la espera final del BLMOVE."""
+    recuperar_pendientes(r)
+    opciones = conexion.opciones_de(r)
+    ks_inicial = contadores_keyspace(r)
+
+    if tipo_worker == "thread":
+        barrera = threading.Barrier(n_workers)
+        resultados = [None] * n_workers
+
+        def correr(i):
+            resultados[i] = _consumidor_confiable(opciones, i, timeout_bloqueo, barrera, cola)
+
+        hilos = [threading.Thread(target=correr, args=(i,)) for i in range(n_workers)]
+        for h in hilos:
+            h.start()
+        for h in hilos:
+            h.join()
+    else:
+        barrera = mp.Barrier(n_workers)
+        salida = mp.Queue()
+        procesos = [mp.Process(target=_proceso_consumidor,
+                               args=(opciones, i, timeout_bloqueo, barrera, salida, cola))
+                    for i in range(n_workers)]
+        for p in procesos:
+            p.start()
+        # Leer antes del join para no trabar procesos con resultados grandes
+        resultados = [salida.get() for _ in procesos]
+        for p in procesos:
+            p.join()
+
+    ops = sum(res[0] for res in resultados)
+    hist = Histograma()
+    for res in resultados:
+        hist.combinar(res[1])
+    dt = max(res[3] for res in resultados) - min(res[2] for res in resultados)
 
-    mem = r.info("memory")
-    stats = r.info("stats")
-    memory_used = mem["used_memory"]
-    evicted_keys = stats.get("evicted_keys", 0)
-
-    rdb_path = os.path.join(redis_dir, "dump.rdb")
-    rdb_size = os.path.getsize(rdb_path) if os.path.exists(rdb_path) else 0
-
-    aof_size = 0
-    main_aof = os.path.join(redis_dir, "appendonly.aof")
-    if os.path.exists(main_aof):
-        aof_size += os.path.getsize(main_aof)
-    append_dir = os.path.join(redis_dir, "appendonlydir")
-    if os.path.isdir(append_dir):
-        for fname in os.listdir(append_dir):
-            if fname.startswith("appendonly.aof"):
-                aof_size += os.path.getsize(os.path.join(append_dir, fname))
-
-    return {
-        "memory_used": memory_used,
-        "evicted_keys": evicted_keys,
-        "rdb_size": rdb_size,
-        "aof_size": aof_size
+    thr = ops / dt if dt > 0 else 0
+    colgantes = sum(res[4] for res in resultados)
+    esperas = {}
+    for res in resultados:
+        combinar_esperas(esperas, res[5])
+    ops_por_ticket = 2 if cola == "prioridad" else 3
+    cuentas = cuentas_consumo(ks_inicial, contadores_keyspace(r), ops,
+                              ops_por_ticket * colgantes, colgantes, dt, esperas)
+    print(f"{n_workers} workers ({tipo_worker}): {hist} | thr={thr:.1f} op/s")
+    return hist, thr, cuentas
+
+
+def guardar_csv(fname, datos, modo, politica, dataset, hist, thr, extra=None):
+    fila = {
+        "fecha": datetime.now().isoformat(),
+        "modo": modo, "politica": politica, "dataset": dataset,
+        **hist.columnas_csv("lat"),
+        "throughput": f"{thr:.1f}",
+        "rdb_bytes": datos["rdb_size"], "aof_bytes": datos["aof_size"],
+        "evicted_keys": datos["evicted_keys"],
     }
-
-
-def guardar_csv(fname, datos, modo, politica, dataset, p50, p99, thr):
-    header = ["fecha","modo","politica","dataset",
-              "lat_p50_ms","lat_p99_ms","throughput",
-              "rdb_bytes","aof_bytes","evicted_keys"]
-    existe = os.path.isfile(fname)
-    with open(fname, "a", newline="") as f:
-        w = csv.writer(f)
-        if not existe:
-            w.writerow(header)
-        w.writerow([
-            datetime.now().isoformat(),
-            modo, politica, dataset,
-            f"{p50:.3f}", f"{p99:.3f}", f"{thr:.1f}",
-            datos["rdb_size"], datos["aof_size"], datos["evicted_keys"]
-        ])
+    fila.update(extra or {})
+    escribir_fila(fname, fila)
 
 
 def main():
-    if len(sys.argv) != 7:
-        print("Uso: test_redis_queue.py <csv> <modo> <politica> <dataset> <redis_dir> <out_csv>")
-        sys.exit(1)
-
-    path_csv, modo, politica, dataset, redis_dir, out_csv = sys.argv[1:]
+    parser = argparse.ArgumentParser(
+        description="Benchmark Redis de cola de tickets (LIST + HASH)")
+    parser.add_argument("csv", help="CSV de tickets de soporte")
+    parser.add_argument("modo", help="modo de persistencia (rdb, aof_everysec, aof_always, mixto)")
+    parser.add_argument("politica", help="política de memoria")
+    parser.add_argument("dataset", type=int, help="cantidad de tickets (incluyendo versiones)")
+    parser.add_argument("redis_dir", help="directorio de persistencia de Redis")
+    parser.add_argument("out_csv", help="CSV de resultados")
+    parser.add_argument("--lote", type=int, default=10_000,
+                        help="tickets por lote generado a partir del CSV")
+    parser.add_argument("--consumo", choices=["simple", "confiable"], default="simple",
+                        help="simple: RPOP + HGETALL en un solo cliente; "
+                             "confiable: N workers con BLMOVE + ack")
+    parser.add_argument("--workers", default="1,2,4,8",
+                        help="cantidades de workers a medir en modo confiable (ej: 1,2,4,8)")
+    parser.add_argument("--tipo-worker", choices=["thread", "process"], default="thread",
+                        help="workers como hilos o como procesos")
+    parser.add_argument("--cola", choices=["lista", "prioridad"], default="lista",
+                        help="lista: FIFO con LPUSH/RPOP; prioridad: ZSET por Ticket Priority "
+                             "y ms de encolado, con ZPOPMIN (o BZPOPMIN en los workers)")
+    conexion.agregar_argumentos(parser)
+    parser.add_argument("--ejecucion", choices=["cliente", "servidor"], default="cliente",
+                        help="(consumo simple) cliente: RPOP + HGETALL; servidor: pop y "
+                             "lectura en una Redis Function")
+    parser.add_argument("--pop-n", type=int, default=1,
+                        help="(consumo simple) tickets por llamada a la función en modo "
+                             "servidor o por ZPOPMIN en la cola de prioridad")
+    perfilado.agregar_argumentos(parser)
+    parser.add_argument("--sin-rewrite-aof", action="store_true",
+                        help="no consolida el AOF con BGREWRITEAOF al final (el orquestador "
+                             "lo usa para medir la recuperación con el AOF sin reescribir)")
+    parser.add_argument("--intervalo-info", type=float, default=0.1,
+                        help="segundos entre muestras de INFO en segundo plano (0 desactiva)")
+    args = parser.parse_args()
+
+    path_csv, modo, politica, dataset = args.csv, args.modo, args.politica, args.dataset
+    redis_dir, out_csv = args.redis_dir, args.out_csv
     if not os.path.isfile(path_csv):
         print("ERROR: CSV no existe:", path_csv); sys.exit(1)
     if not os.path.isdir(redis_dir):
         print("ERROR: redis_dir no es dir:", redis_dir); sys.exit(1)
 
-    r = redis.Redis(host="localhost", port=6380, decode_responses=True)
+    r = conexion.conectar(conexion.opciones(args))
     print("=== Ejecutando benchmark de cola de tickets ===")
     print(f"Modo={modo}, Pol={politica}, Dataset={dataset}")
+    print(f"Conexión: {conexion.describir(r)}")
+
+    muestreador = iniciar_muestreo(r, out_csv, args.intervalo_info,
+                                   "queue", modo, politica, dataset)
+    perfil = perfilado.iniciar_perfilado(r, out_csv, args.perfilar, args.cprofile,
+                                         args.tracemalloc, "queue", modo, politica, dataset)
+    t_inicio = time.time()
+    lotes = cargar_tickets(path_csv, dataset, tam_lote=args.lote)
+    n_tickets, t_primer = insertar_tickets(r, lotes, t_inicio, args.cola)
+    rss_kb = rss_max_kb()
+    print(f"Primer insert a los {t_primer * 1000:.1f} ms | RSS máx cliente: {rss_kb} KB")
+
+    # Lo que quedó después de la carga (con maxmemory parte pudo desalojarse)
+    carga = {
+        "t_primer_insert_ms": f"{t_primer * 1000:.1f}",
+        "rss_max_kb": rss_kb,
+        "sobrevive_tickets": fraccion(min(contar_claves(r, "ticket:tkt:*"), n_tickets), n_tickets),
+        "sobrevive_cola": fraccion(min(r.zcard(COLA_PRIORIDAD) if args.cola == "prioridad"
+                                       else r.llen(COLA), n_tickets), n_tickets),
+        "cola": args.cola,
+        "aof_rewrite": "no" if args.sin_rewrite_aof else "si",
+        **conexion.columnas(r),
+    }
 
-    tickets = cargar_tickets(path_csv, int(dataset))
-    p50, p99, thr = ejecutar_operaciones(r, tickets)
-    mets = medir_metricas(r, redis_dir, modo)
-    guardar_csv(out_csv, mets, modo, politica, dataset, p50, p99, thr)
+    if muestreador:
+        muestreador.fase("consumo")
+    if perfil:
+        perfil.fase("consumo")
+    if args.consumo == "simple":
+        hist = Histograma()
+        if muestreador:
+            muestreador.observar(hist)
+        funciones = Funciones(r) if args.ejecucion == "servidor" else None
+        pop_n = args.pop_n if funciones or args.cola == "prioridad" else 1
+        filas = [(ejecutar_operaciones(r, hist=hist, funciones=funciones, pop_n=pop_n,
+                                       cola=args.cola), {
+            "modo_consumo": "simple", "consumidores": 1, "tipo_consumidor": "",
+            "ejecucion": args.ejecucion, "pop_n": pop_n,
+        })]
+    else:
+        print("=== Fase de consumo (reliable queue) ===")
+        if args.cola == "prioridad":
+            print("Cola de prioridad: los workers hacen BZPOPMIN + HGETALL, sin ack.")
+        filas = []
+        for i, n_workers in enumerate(int(w) for w in args.workers.split(",")):
+            if i > 0:
+                reencolar(r, n_tickets, cola=args.cola)
+            res = consumir_con_workers(r, n_workers, args.tipo_worker, cola=args.cola)
+            filas.append((res, {
+                "modo_consumo": "confiable", "consumidores": n_workers,
+                "tipo_consumidor": args.tipo_worker,
+            }))
+
+    if muestreador:
+        muestreador.fase("persistencia")
+    if perfil:
+        perfil.fase("persistencia")
+    mets = medir_metricas(r, redis_dir, modo, not args.sin_rewrite_aof)
+    if muestreador:
+        muestreador.detener()
+    if perfil:
+        perfil.terminar()
+    serie = columnas_muestreo(muestreador)
+    for (hist, thr, cuentas), consumo in filas:
+        guardar_csv(out_csv, mets, modo, politica, dataset, hist, thr,
+                    extra={**carga, **consumo, **cuentas, **serie})
 
     print("Benchmark completado. Resultados en", out_csv)
 
@@ -0,0 +1,181 @@
+# Layouts de almacenamiento de los artículos de Hacker News en Redis.
+#
+#  hash:   un HASH article:hn:{n} por artículo (layout original)
+#  bucket: los artículos se agrupan de a N en HASHes chicos article_bucket:{n//N},
+#          con un campo "{n%N}:{atributo}" por dato y nombres de atributo de una
+#          letra, así cada bucket entra en el encoding listpack de Redis y se
+#          ahorra el overhead de una clave (dictEntry + robj + expires) por artículo.
+#
+# Opcionalmente la carga mantiene un índice versiones:{base} (SET) con los ids
+# de todas las versiones de un artículo del CSV; la base es el id de su
+# primera versión (hn:{fila * versiones}).
+#
+# Los ids pueden venir como bytes (de un ZSET leído con --decodificar no): lo
+# que arma claves a partir de un id lo pasa por texto().
+import redis
+
+from comun.conexion import texto
+
+# atributo -> nombre corto dentro del bucket
+CAMPOS = {
+    "title": "t",
+    "author": "a",
+    "url": "u",
+    "created_at": "c",
+    "num_points": "p",
+    "num_comments": "k",
+}
+CAMPOS_INV = {v: k for k, v in CAMPOS.items()}
+
+LAYOUTS = ["hash", "bucket"]
+CLAVE_LAYOUT = "ranking:layout"
+
+def numero(article_id):
+    """hn:123 -> 123"""
+    return int(texto(article_id).split(":", 1)[1])
+
+def clave_bucket(n, tam_bucket):
+    return f"article_bucket:{n // tam_bucket}"
+
+def configurar_listpack(r, tam_bucket, max_valor=1024):
+    """Sube los límites de listpack para que un bucket completo (6 campos por
+    artículo, títulos/urls largos) no se convierta a hashtable."""
+    entradas = max(128, len(CAMPOS) * tam_bucket)
+    try:
+        r.config_set("hash-max-listpack-entries", entradas)
+        r.config_set("hash-max-listpack-value", max_valor)
+    except redis.ResponseError:
+        # Redis < 7 usa los nombres ziplist
+        r.config_set("hash-max-ziplist-entries", entradas)
+        r.config_set("hash-max-ziplist-value", max_valor)
+
+def guardar_layout(r, layout, tam_bucket):
+    """Deja registrado el layout para que otros scripts (redis_queries.py) lo detecten."""
+    r.hset(CLAVE_LAYOUT, mapping={"layout": layout, "tam_bucket": tam_bucket})
+
+def reescribir_registro(r, registro):
+    """Vuelve a escribir CLAVE_LAYOUT (lo que devolvió HGETALL tras la carga) al
+    final de la corrida: con allkeys-* la clave se puede desalojar como cualquier
+    otra. Con noeviction y sin memoria el HSET falla, pero ahí la clave no se
+    pudo desalojar."""
+    try:
+        r.hset(CLAVE_LAYOUT, mapping=registro)
+    except redis.ResponseError:
+        pass
+
+def guardar_indice_versiones(r, n_pasada, n_versiones):
+    """Registra que hay índice de versiones y cómo calcular la base de un id."""
+    r.hset(CLAVE_LAYOUT, mapping={"pasada": n_pasada, "versiones": n_versiones})
+
+def leer_indice_versiones(r):
+    """(filas de la pasada expandida, versiones por fila) o None si no hay índice."""
+    pasada, n_versiones = r.hmget(CLAVE_LAYOUT, ["pasada", "versiones"])
+    if pasada is None:
+        return None
+    return int(pasada), int(n_versiones)
+
+def id_base(n, n_pasada, n_versiones):
+    """Id de la primera versión del artículo del CSV que generó hn:{n}
+    (la pasada expandida se repite cuando el dataset es más grande)."""
+    return f"hn:{(n % n_pasada) // n_versiones * n_versiones}"
+
+def clave_versiones(base):
+    return f"versiones:{base}"
+
+def indexar_version(cliente, article_id, base):
+    """Agrega article_id al índice de versiones de `base` (Redis o pipeline)."""
+    return cliente.sadd(clave_versiones(base), article_id)
+
+def leer_layout(r):
+    """Devuelve (layout, tam_bucket) registrado en Redis. Si la clave no está
+    (datos cargados sin ranking/test_redis.py o clave desalojada) es un error:
+    asumir el layout hash leería claves que no existen sin avisar."""
+    layout, tam_bucket = r.hmget(CLAVE_LAYOUT, ["layout", "tam_bucket"])
+    if layout is None:
+        raise RuntimeError(f"no está {CLAVE_LAYOUT}: recargar los datos o indicar el layout")
+    return texto(layout), int(tam_bucket)
+
+def escribir(cliente, article_id, campos, layout="hash", tam_bucket=16):
+    """Escribe un artículo. `cliente` puede ser el Redis o un pipeline."""
+    if layout == "hash":
+        return cliente.hset(f"article:{article_id}", mapping=campos)
+    n = numero(article_id)
+    off = n % tam_bucket
+    return cliente.hset(clave_bucket(n, tam_bucket), mapping={
+        f"{off}:{CAMPOS[k]}": v for k, v in campos.items()
+    })
+
+def encolar_lectura(pipe, article_id, layout="hash", tam_bucket=16, atributos=None):
+    """Encola en `pipe` (sync o asyncio) la lectura de un artículo; la respuesta
+    se convierte a dict con armar_lectura. Con el cliente en lugar de un
+    pipeline lee directamente y devuelve la respuesta."""
+    if layout == "hash":
+        if atributos is None:
+            return pipe.hgetall(f"article:{texto(article_id)}")
+        return pipe.hmget(f"article:{texto(article_id)}", atributos)
+    n = numero(article_id)
+    off = n % tam_bucket
+    nombres = atributos or list(CAMPOS)
+    return pipe.hmget(clave_bucket(n, tam_bucket), [f"{off}:{CAMPOS[a]}" for a in nombres])
+
+def armar_lectura(respuesta, layout="hash", atributos=None):
+    if layout == "hash" and atributos is None:
+        return respuesta
+    nombres = atributos or list(CAMPOS)
+    # Un artículo desalojado (o inexistente) vuelve como {} igual que HGETALL
+    return {k: v for k, v in zip(nombres, respuesta) if v is not None}
+
+def leer_muchos(r, article_ids, layout="hash", tam_bucket=16, atributos=None):
+    """Lee varios artículos en un solo pipeline. Devuelve una lista de dicts
+    (vacío si el artículo no existe) en el mismo orden que article_ids.
+    Con `atributos` solo trae esos campos."""
+    pipe = r.pipeline(transaction=False)
+    for aid in article_ids:
+        encolar_lectura(pipe, aid, layout, tam_bucket, atributos)
+    return [armar_lectura(res, layout, atributos) for res in pipe.execute()]
+
+def leer(r, article_id, layout="hash", tam_bucket=16, atributos=None):
+    return leer_muchos(r, [article_id], layout, tam_bucket, atributos)[0]
+
+def leer_top(r, k=10, layout="hash", tam_bucket=16):
+    """Top-k del ranking con sus datos, las lecturas van en un solo pipeline."""
+    top = r.zrevrange("ranking_articles", 0, k - 1, withscores=True)
+    datos = leer_muchos(r, [aid for aid, _ in top], layout, tam_bucket)
+    return list(zip(top, datos))
+
+def encoding_muestra(r, layout="hash", tam_bucket=16, total=0, muestras=20):
+    """Encoding de algunas claves de artículos (para verificar listpack)."""
+    if total <= 0:
+        return ""
+    paso = max(1, total // muestras)
+    if layout == "hash":
+        claves = [f"article:hn:{n}" for n in range(0, total, paso)]
+    else:
+        claves = sorted({clave_bucket(n, tam_bucket) for n in range(0, total, paso)})
+    pipe = r.pipeline(transaction=False)
+    for c in claves:
+        pipe.object("encoding", c)
+    encodings = [e for e in pipe.execute(raise_on_error=False)
+                 if e and not isinstance(e, Exception)]
+    conteo = {}
+    for e in encodings:
+        conteo[texto(e)] = conteo.get(texto(e), 0) + 1
+    return ";".join(f"{e}={c}" for e, c in sorted(conteo.items()))
+
+def existen(r, article_ids, layout="hash", tam_bucket=16):
+    """Lista de bools: si cada artículo sigue en Redis (no fue desalojado)."""
+    pipe = r.pipeline(transaction=False)
+    for aid in article_ids:
+        if layout == "hash":
+            pipe.exists(f"article:{texto(aid)}")
+        else:
+            n = numero(aid)
+            pipe.hexists(clave_bucket(n, tam_bucket), f"{n % tam_bucket}:{CAMPOS['title']}")
+    return [bool(x) for x in pipe.execute()]
+
+def patron_claves(layout="hash"):
+    return "article:hn:*" if layout == "hash" else "article_bucket:*"
+
+def claves_esperadas(total, layout="hash", tam_bucket=16):
+    """Cantidad de claves de artículos que habría sin desalojos."""
+    return total if layout == "hash" else -(-total // tam_bucket)
@@ -0,0 +1,154 @@
+# Mezclas de operaciones estilo YCSB para el ranking, con popularidad de
+# artículos no uniforme.
+#
+# Una mezcla es la proporción de cada tipo de operación:
+#  leer:  datos de un artículo (HGETALL / HMGET del bucket)
+#  votar: ZINCRBY de 1..5 puntos
+#  top:   top-10 con sus datos (ZREVRANGE + lecturas, o la Redis Function)
+#  rango: página de 50 del ranking con puntajes (ZREVRANGE desde una posición)
+#
+# Qué artículo toca cada operación sale de una distribución:
+#  uniforme: todos igual de probables (lo que hacía el benchmark original)
+#  zipf:     el de rango i tiene probabilidad ~ 1/i^theta (YCSB usa 0.99);
+#            los rangos se asignan a ids al azar para que los artículos
+#            populares no queden todos en el mismo bucket
+#  hotspot:  una fracción de los artículos recibe una fracción de las operaciones
+#
+# La secuencia completa (tipo de operación, artículo e incremento) se arma de
+# antemano como arrays de NumPy, así el loop medido solo manda comandos.
+import time
+
+import numpy as np
+
+import almacenamiento
+from comun.histograma import Histograma
+from comun.instrumentacion import columnas_keyspace, contadores_keyspace
+
+OPERACIONES = ["leer", "votar", "top", "rango"]
+
+MEZCLAS = {
+    # YCSB B: lecturas con pocas escrituras
+    "lectura": {"leer": 0.90, "votar": 0.05, "top": 0.05},
+    # YCSB A: mitad y mitad
+    "mixta": {"leer": 0.50, "votar": 0.50},
+    "escritura": {"votar": 0.90, "leer": 0.10},
+    # YCSB E: recorridos del ranking
+    "top": {"top": 0.40, "rango": 0.40, "votar": 0.20},
+}
+
+DISTRIBUCIONES = ["uniforme", "zipf", "hotspot"]
+
+TAM_PAGINA = 50
+
+def cdf_zipf(n, theta=0.99):
+    """CDF de la probabilidad ~ 1/rango^theta sobre n elementos."""
+    pesos = 1.0 / np.arange(1, n + 1, dtype=np.float64) ** theta
+    cdf = np.cumsum(pesos)
+    return cdf / cdf[-1]
+
+def generar_articulos(n_articulos, n_ops, distribucion="uniforme", rng=None, theta=0.99,
+                      hotspot_claves=0.2, hotspot_ops=0.8):
+    """Array de n_ops números de artículo (0..n_articulos-1) según la distribución."""
+    rng = rng or np.random.default_rng()
+    if distribucion == "uniforme":
+        return rng.integers(0, n_articulos, n_ops, dtype=np.uint32)
+    if distribucion == "zipf":
+        rangos = np.searchsorted(cdf_zipf(n_articulos, theta), rng.random(n_ops))
+        return rng.permutation(n_articulos).astype(np.uint32)[np.minimum(rangos, n_articulos - 1)]
+    # hotspot: los calientes son un subconjunto al azar, el resto es uniforme entre los fríos
+    if n_articulos <= 1:
+        # Con un solo artículo no hay fríos: todas las operaciones van a ese
+        return np.zeros(n_ops, dtype=np.uint32)
+    orden = rng.permutation(n_articulos).astype(np.uint32)
+    n_calientes = max(1, min(n_articulos - 1, int(n_articulos * hotspot_claves)))
+    calientes = rng.random(n_ops) < hotspot_ops
+    res = orden[n_calientes + rng.integers(0, n_articulos - n_calientes, n_ops)]
+    res[calientes] = orden[rng.integers(0, n_calientes, int(calientes.sum()))]
+    return res
+
+def generar_operaciones(mezcla, n_ops, rng=None):
+    """Array de n_ops índices en OPERACIONES con las proporciones de la mezcla."""
+    rng = rng or np.random.default_rng()
+    proporciones = MEZCLAS[mezcla]
+    tipos = [OPERACIONES.index(op) for op in proporciones]
+    p = np.array(list(proporciones.values()), dtype=np.float64)
+    return np.array(tipos, dtype=np.uint8)[rng.choice(len(tipos), n_ops, p=p / p.sum())]
+
+def concentracion(articulos, n_articulos, fraccion=0.01):
+    """Fracción de las operaciones que cae en el `fraccion` más popular de los artículos."""
+    conteo = np.bincount(articulos, minlength=n_articulos)
+    k = max(1, int(n_articulos * fraccion))
+    return np.partition(conteo, n_articulos - k)[n_articulos - k:].sum() / max(1, len(articulos))
+
+def ejecutar_mezcla(r, mezcla, n_articulos, n_ops, distribucion="uniforme", layout="hash",
+                    tam_bucket=16, hist=None, funciones=None, rng=None, **parametros):
+    """Corre n_ops operaciones de la mezcla sobre los artículos hn:0..n-1.
+    Devuelve (hist de todas las operaciones, throughput, {operación: hist},
+    cuentas); cuentas tiene los hits/misses del keyspace, las lecturas y
+    entradas de top vacías (artículos desalojados) como colgantes, el
+    throughput útil (sin las operaciones que solo encontraron colgantes) y la
+    fracción de operaciones en el 1% de artículos más popular."""
+    rng = rng or np.random.default_rng()
+    tipos = generar_operaciones(mezcla, n_ops, rng)
+    articulos = generar_articulos(n_articulos, n_ops, distribucion, rng, **parametros)
+    incrementos = rng.integers(1, 6, n_ops, dtype=np.uint8)
+    ids = [f"hn:{n}" for n in articulos.tolist()]
+    top1 = concentracion(articulos, n_articulos)
+    print(f"Mezcla {mezcla} ({', '.join(f'{op} {p:.0%}' for op, p in MEZCLAS[mezcla].items())}), "
+          f"distribución {distribucion}: {top1:.1%} de las operaciones en el 1% de los artículos")
+
+    hist = hist if hist is not None else Histograma()
+    por_op = {op: Histograma() for op in MEZCLAS[mezcla]}
+    hists = [por_op.get(op) for op in OPERACIONES]
+    leer, votar, top, rango = range(len(OPERACIONES))
+    colgantes = vacias = 0
+    ks_inicial = contadores_keyspace(r)
+    t0 = time.perf_counter()
+    for tipo, aid, incremento, n in zip(tipos.tolist(), ids, incrementos.tolist(),
+                                        articulos.tolist()):
+        t = time.perf_counter_ns()
+        if tipo == leer:
+            datos = almacenamiento.armar_lectura(
+                almacenamiento.encolar_lectura(r, aid, layout, tam_bucket), layout)
+        elif tipo == votar:
+            r.zincrby("ranking_articles", incremento, aid)
+        elif tipo == top:
+            if funciones is not None:
+                res = funciones.incr_y_top("ranking_articles", 10, layout=layout,
+                                           tam_bucket=tam_bucket)
+            else:
+                res = almacenamiento.leer_top(r, 10, layout, tam_bucket)
+        else:
+            r.zrevrange("ranking_articles", n, n + TAM_PAGINA - 1, withscores=True)
+        ns = time.perf_counter_ns() - t
+        hists[tipo].registrar(ns)
+        hist.registrar(ns)
+        if tipo == leer and not datos:
+            colgantes += 1
+            vacias += 1
+        elif tipo == top:
+            faltan = sum(1 for _, d in res if not d)
+            colgantes += faltan
+            vacias += faltan == len(res)
+    dt = time.perf_counter() - t0
+
+    thr = n_ops / dt if dt > 0 else 0
+    cuentas = {
+        **columnas_keyspace(ks_inicial, contadores_keyspace(r)),
+        "colgantes": colgantes,
+        "useful_throughput": f"{(n_ops - vacias) / dt:.1f}" if dt > 0 else "0.0",
+        "ops_top1pct": f"{top1:.4f}",
+    }
+    for op, h in por_op.items():
+        print(f"{op:<6} ({h.total} ops): {h}")
+    if colgantes:
+        print(f"Desalojos: {colgantes} lecturas/entradas de top sin los datos del artículo")
+    return hist, thr, por_op, cuentas
+
+def columnas_operaciones(por_op):
+    """Cantidad y percentiles de cada tipo de operación ({op}_ops, {op}_p50_ms...)."""
+    cols = {}
+    for op, h in por_op.items():
+        cols[f"{op}_ops"] = h.total
+        cols.update(h.columnas_csv(op))
+    return cols
@@ -1,41 +1,200 @@
-# Script usado para verificar la carga de datos en Redis
-import redis
+# Consultas sobre el ranking cargado por test_redis.py, como módulo y como CLI.
+#
+# Todas las lecturas van en pipelines (o en un solo comando multi-clave como
+# ZMSCORE), de a `lote` ids por round trip. Las versiones de un artículo salen
+# del índice versiones:{base} que arma la carga con --indice-versiones, en
+# lugar de adivinar ids y probar uno por uno con EXISTS.
+#
+# Uso:
+#   redis_queries.py                        resumen (total, top/bottom 5, un artículo)
+#   redis_queries.py articulo hn:0 hn:17    datos completos de esos artículos
+#   redis_queries.py versiones hn:0 hn:6    versiones de los artículos base de esos ids
+#   redis_queries.py bulk --ids 5000        latencia de lecturas masivas por lote
+# El layout (hash o bucket) se toma del registrado al cargar, salvo --layout.
+# Las opciones de conexión (--transporte, --resp, --parser, ...) son las de
+# comun/conexion.py; las consultas que solo muestran datos decodifican siempre.
+import argparse
 import json
+import os
+import sys
+import time
+from datetime import datetime
 
-# Conexión a Redis
-r = redis.Redis(host='localhost', port=6380, decode_responses=True)
-
-print("=== Verificación de carga en Redis ===\n")
-
-# 1. Total de artículos en el ranking
-total = r.zcard("ranking_articles")
-print(f"Total de artículos en el ZSET 'ranking_articles': {total}\n")
-
-# 2. Top 5 artículos más populares
-print("Top 5 artículos más populares (mayor puntaje):")
-top5 = r.zrevrange("ranking_articles", 0, 4, withscores=True)
-for aid, score in top5:
-    title = r.hget(f"article:{aid}", "title")
-    print(f"- {aid}: {title} ({int(score)} puntos)")
-print()
-
-# 3. Bottom 5 artículos menos populares
-print("Bottom 5 artículos menos populares (menor puntaje):")
-bottom5 = r.zrange("ranking_articles", 0, 4, withscores=True)
-for aid, score in bottom5:
-    title = r.hget(f"article:{aid}", "title")
-    print(f"- {aid}: {title} ({int(score)} puntos)")
-print()
-
-# 4. Datos completos de un artículo específico (por ejemplo, hn:0_0)
-ejemplo_id = "hn:0_0"
-datos = r.hgetall(f"article:{ejemplo_id}")
-print(f"Datos completos de '{ejemplo_id}':")
-print(json.dumps(datos, indent=2, ensure_ascii=False))
-print()
-
-# 5. Contar cuántas versiones hay de un artículo base (ej: hn:0)
-base = "hn:0"
-versiones = [f"{base}_{v}" for v in range(4)]
-existentes = [vid for vid in versiones if r.exists(f"article:{vid}")]
-print(f"Versiones encontradas para {base}: {len(existentes)} -> {existentes}")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from comun import conexion
+from comun.histograma import Histograma
+from comun.resultados import escribir_fila
+
+import almacenamiento
+
+def _lotes(ids, lote):
+    for i in range(0, len(ids), lote):
+        yield ids[i:i + lote]
+
+def extremos(r, k=5):
+    """(top k, bottom k) del ranking con sus puntajes, en un solo round trip."""
+    pipe = r.pipeline(transaction=False)
+    pipe.zrevrange("ranking_articles", 0, k - 1, withscores=True)
+    pipe.zrange("ranking_articles", 0, k - 1, withscores=True)
+    return tuple(pipe.execute())
+
+def leer_articulos(r, ids, layout="hash", tam_bucket=16, atributos=None, lote=1000):
+    """Datos de cada id (dict vacío si no existe), un pipeline por lote."""
+    res = []
+    for parte in _lotes(ids, lote):
+        res.extend(almacenamiento.leer_muchos(r, parte, layout, tam_bucket, atributos))
+    return res
+
+def puntajes(r, ids, lote=1000):
+    """Puntaje de cada id en el ranking (None si no está), un ZMSCORE por lote."""
+    res = []
+    for parte in _lotes(ids, lote):
+        res.extend(r.zmscore("ranking_articles", parte))
+    return res
+
+def versiones(r, bases, lote=1000):
+    """dict base -> ids de sus versiones ordenados, un pipeline de SMEMBERS por lote."""
+    res = {}
+    for parte in _lotes(bases, lote):
+        pipe = r.pipeline(transaction=False)
+        for base in parte:
+            pipe.smembers(almacenamiento.clave_versiones(base))
+        for base, ids in zip(parte, pipe.execute()):
+            res[base] = sorted(ids, key=almacenamiento.numero)
+    return res
+
+def articulos_con_versiones(r, bases, layout="hash", tam_bucket=16, atributos=None, lote=1000):
+    """dict base -> [(id, datos)] de todas sus versiones: un pipeline para el
+    índice y otro para los datos (por lote)."""
+    por_base = versiones(r, bases, lote)
+    ids = [aid for vs in por_base.values() for aid in vs]
+    datos = dict(zip(ids, leer_articulos(r, ids, layout, tam_bucket, atributos, lote)))
+    return {base: [(aid, datos[aid]) for aid in vs] for base, vs in por_base.items()}
+
+def ids_al_azar(r, n):
+    """n ids distintos al azar de los que siguen en el ranking (ZRANDMEMBER, sin
+    traer el ZSET). Después de desalojos los ids que quedan no son contiguos:
+    muestrear hn:0..ZCARD-1 mediría faltantes en lugar de lecturas."""
+    return r.zrandmember("ranking_articles", n) or []
+
+def medir_bulk(r, ids, layout="hash", tam_bucket=16, lote=1000, repeticiones=3):
+    """Latencia por lote y throughput de cada consulta masiva sobre `ids`.
+    Devuelve {consulta: (hist por lote, ids/s)}."""
+    consultas = {
+        "datos": lambda parte: leer_articulos(r, parte, layout, tam_bucket, lote=lote),
+        "titulos": lambda parte: leer_articulos(r, parte, layout, tam_bucket, ["title"], lote),
+        "puntajes": lambda parte: puntajes(r, parte, lote),
+    }
+    entradas = {c: ids for c in consultas}
+    indice = almacenamiento.leer_indice_versiones(r)
+    if indice is not None:
+        # Las bases de los ids elegidos (sin repetir)
+        consultas["versiones"] = lambda parte: versiones(r, parte, lote)
+        entradas["versiones"] = sorted({almacenamiento.id_base(almacenamiento.numero(aid), *indice)
+                                        for aid in ids}, key=almacenamiento.numero)
+    res = {}
+    for nombre, consulta in consultas.items():
+        hist = Histograma()
+        t0 = time.perf_counter()
+        for _ in range(repeticiones):
+            for parte in _lotes(entradas[nombre], lote):
+                t = time.perf_counter_ns()
+                consulta(parte)
+                hist.registrar(time.perf_counter_ns() - t)
+        dt = time.perf_counter() - t0
+        res[nombre] = (hist, len(entradas[nombre]) * repeticiones / dt if dt > 0 else 0)
+    return res
+
+def mostrar_resumen(r, layout, tam_bucket):
+    print("=== Verificación de carga en Redis ===\n")
+    print(f"Layout de artículos: {layout}" + (f" (bucket={tam_bucket})" if layout == "bucket" else "") + "\n")
+
+    total = r.zcard("ranking_articles")
+    print(f"Total de artículos en el ZSET 'ranking_articles': {total}\n")
+
+    top, bottom = extremos(r, 5)
+    titulos = leer_articulos(r, [aid for aid, _ in top + bottom], layout, tam_bucket, ["title"])
+    for nombre, filas, datos in [("Top 5 artículos más populares (mayor puntaje)", top, titulos),
+                                 ("Bottom 5 artículos menos populares (menor puntaje)", bottom,
+                                  titulos[len(top):])]:
+        print(f"{nombre}:")
+        for (aid, score), d in zip(filas, datos):
+            print(f"- {aid}: {d.get('title')} ({int(score)} puntos)")
+        print()
+
+    # Los ids que escribe cargar_datos son hn:{n}; hn:0 es la primera versión del primer artículo
+    mostrar_articulos(r, ["hn:0"], layout, tam_bucket)
+    mostrar_versiones(r, ["hn:0"], layout, tam_bucket)
+
+def mostrar_articulos(r, ids, layout, tam_bucket):
+    for aid, datos in zip(ids, leer_articulos(r, ids, layout, tam_bucket)):
+        print(f"Datos completos de '{aid}':")
+        print(json.dumps(datos, indent=2, ensure_ascii=False))
+        print()
+
+def mostrar_versiones(r, bases, layout, tam_bucket):
+    indice = almacenamiento.leer_indice_versiones(r)
+    if indice is None:
+        print("No hay índice de versiones (cargar con test_redis.py --indice-versiones).")
+        return
+    # Se acepta cualquier versión y se busca por su base
+    bases = [almacenamiento.id_base(almacenamiento.numero(b), *indice) for b in bases]
+    for base, vs in articulos_con_versiones(r, bases, layout, tam_bucket, ["title"]).items():
+        print(f"Versiones encontradas para {base}: {len(vs)}")
+        for aid, datos in vs:
+            print(f"- {aid}: {datos.get('title')}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Consultas sobre el ranking de Hacker News en Redis")
+    conexion.agregar_argumentos(parser)
+    parser.add_argument("--layout", choices=almacenamiento.LAYOUTS,
+                        help="layout de los artículos (default: el registrado al cargar)")
+    parser.add_argument("--tam-bucket", type=int, default=16, help="artículos por bucket")
+    sub = parser.add_subparsers(dest="comando")
+    sub.add_parser("resumen", help="total, top/bottom 5 y un artículo de ejemplo")
+    p = sub.add_parser("articulo", help="datos completos de uno o más artículos")
+    p.add_argument("ids", nargs="+")
+    p = sub.add_parser("versiones", help="versiones de uno o más artículos base")
+    p.add_argument("bases", nargs="+")
+    p = sub.add_parser("bulk", help="latencia de consultas masivas por lote")
+    p.add_argument("--ids", type=int, default=5000, help="ids al azar a consultar")
+    p.add_argument("--lote", type=int, default=1000, help="ids por pipeline")
+    p.add_argument("--repeticiones", type=int, default=3)
+    p.add_argument("--csv", help="agrega una fila por consulta a este CSV")
+    args = parser.parse_args()
+
+    r = conexion.conectar(conexion.opciones(args))
+    if args.comando != "bulk":
+        r = conexion.control(r)
+    if args.layout:
+        layout, tam_bucket = args.layout, args.tam_bucket
+    else:
+        try:
+            layout, tam_bucket = almacenamiento.leer_layout(r)
+        except RuntimeError as e:
+            sys.exit(f"ERROR: {e} (--layout)")
+
+    if args.comando == "articulo":
+        mostrar_articulos(r, args.ids, layout, tam_bucket)
+    elif args.comando == "versiones":
+        mostrar_versiones(r, args.bases, layout, tam_bucket)
+    elif args.comando == "bulk":
+        ids = ids_al_azar(r, args.ids)
+        print(f"=== Consultas masivas: {len(ids)} ids, lotes de {args.lote}, "
+              f"{args.repeticiones} repeticiones ({conexion.describir(r)}) ===")
+        for nombre, (hist, thr) in medir_bulk(r, ids, layout, tam_bucket, args.lote,
+                                              args.repeticiones).items():
+            print(f"{nombre:<10} {thr:>10.1f} ids/s | por lote: {hist}")
+            if args.csv:
+                escribir_fila(args.csv, {
+                    "fecha": datetime.now().isoformat(), "consulta": nombre,
+                    "layout": layout, "ids": len(ids), "lote": args.lote,
+                    "repeticiones": args.repeticiones, "throughput": f"{thr:.1f}",
+                    **hist.columnas_csv("lat"),
+                    **conexion.columnas(r),
+                })
+    else:
+        mostrar_resumen(r, layout, tam_bucket)
+
+if __name__ == "__main__":
+    main()
@@ -50,6 +50,33 @@ REDIS_PERSISTENCE_DIR="/home/sofi/redis-data"
 PYTHON_SCRIPT="/mnt/c/Users/PC/Escritorio/bdnr 2025/bdnr-2025/ranking/test_redis.py"
 CSV_PATH="/mnt/c/Users/PC/Escritorio/bdnr 2025/bdnr-2025/ranking/hacker_news.csv"
 
+# ------------------------------
+# 5) Carga masiva (simple | pipeline | multi) y tamaño de lote
+# ------------------------------
+LOAD_MODE="${LOAD_MODE:-pipeline}"
+BATCH_SIZE="${BATCH_SIZE:-1000}"
+
+# ------------------------------
+# 6) Layout de artículos (hash | bucket) y artículos por bucket
+# ------------------------------
+LAYOUT="${LAYOUT:-hash}"
+BUCKET_SIZE="${BUCKET_SIZE:-16}"
+
+# Mezcla de operaciones (original | lectura | mixta | escritura | top) y
+# popularidad de los artículos (uniforme | zipf | hotspot), ver carga_trabajo.py
+MIX="${MIX:-original}"
+DISTRIBUTION="${DISTRIBUTION:-uniforme}"
+
+# ------------------------------
+# 7) Conexión del cliente (comun/conexion.py). El contenedor escucha también
+#    en un socket Unix dentro del directorio de persistencia (TRANSPORT=unix).
+# ------------------------------
+TRANSPORT="${TRANSPORT:-tcp}"
+RESP="${RESP:-2}"
+PARSER="${PARSER:-auto}"
+DECODE="${DECODE:-si}"
+CONN="${CONN:-pool}"
+
 mkdir -p "$REDIS_PERSISTENCE_DIR"
 
 echo "Iniciando pruebas…"
@@ -69,7 +96,8 @@ for mode in "${!PERSISTENCE_MODES_CMDS[@]}"; do
         -v "$REDIS_PERSISTENCE_DIR":/data \
         -p 6380:6379 \
         redis:7.4 \
-        redis-server --dir /data --dbfilename dump.rdb
+        redis-server --dir /data --dbfilename dump.rdb \
+        --unixsocket /data/redis.sock --unixsocketperm 777
 
       for cmdVar in ${PERSISTENCE_MODES_CMDS[$mode]}; do
         declare -n arr="$cmdVar"
@@ -103,7 +131,19 @@ for mode in "${!PERSISTENCE_MODES_CMDS[@]}"; do
         "$policy" \
         "$size" \
         "$REDIS_PERSISTENCE_DIR" \
-        "$RESULTS_FILE"
+        "$RESULTS_FILE" \
+        --carga "$LOAD_MODE" \
+        --batch "$BATCH_SIZE" \
+        --layout "$LAYOUT" \
+        --tam-bucket "$BUCKET_SIZE" \
+        --mezcla "$MIX" \
+        --distribucion "$DISTRIBUTION" \
+        --transporte "$TRANSPORT" \
+        --socket "$REDIS_PERSISTENCE_DIR/redis.sock" \
+        --resp "$RESP" \
+        --parser "$PARSER" \
+        --decodificar "$DECODE" \
+        --conexiones "$CONN"
 
       # Forzar snapshot SAVE después del benchmark
       echo "  -> Forzando snapshot SAVE"
@@ -0,0 +1,205 @@
+# Ranking particionado en varios Redis locales (sharding del lado del cliente).
+#
+# Cada artículo vive en el nodo dueño del hash slot de su clave de
+# almacenamiento (CRC16 % 16384, igual que Redis Cluster): article:hn:{n} en el
+# layout hash o article_bucket:{n//N} en el layout bucket, así un bucket nunca
+# queda partido entre nodos. Los slots se reparten en rangos contiguos y cada
+# nodo tiene su propio ZSET ranking_articles con los artículos que le tocan.
+#
+# Carga y ZINCRBY van en un pipeline por nodo (los nodos en paralelo); el
+# top-K global hace un ZREVRANGE por nodo (scatter) y los mezcla (gather).
+import heapq
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import redis
+
+import almacenamiento
+from comun import conexion
+from comun.conexion import texto
+from comun.histograma import Histograma
+
+SLOTS = 16384
+
+def _tabla_crc16():
+    tabla = []
+    for i in range(256):
+        crc = i << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021) if crc & 0x8000 else crc << 1
+        tabla.append(crc & 0xFFFF)
+    return tabla
+
+_CRC16 = _tabla_crc16()
+
+def crc16(datos):
+    """CRC16-CCITT (XMODEM), el que usa Redis Cluster."""
+    crc = 0
+    for b in datos:
+        crc = ((crc << 8) & 0xFFFF) ^ _CRC16[((crc >> 8) ^ b) & 0xFF]
+    return crc
+
+def hash_slot(clave):
+    """Slot de Redis Cluster, respetando hashtags {...}."""
+    ini = clave.find("{")
+    if ini >= 0:
+        fin = clave.find("}", ini + 1)
+        if fin > ini + 1:
+            clave = clave[ini + 1:fin]
+    return crc16(clave.encode()) % SLOTS
+
+def clave_almacen(article_id, layout="hash", tam_bucket=16):
+    if layout == "hash":
+        return f"article:{texto(article_id)}"
+    return almacenamiento.clave_bucket(almacenamiento.numero(article_id), tam_bucket)
+
+def conectar(nodos, opciones):
+    """"6380,6381" o "host:6380,host:6381" -> lista de clientes Redis armados
+    con las `opciones` de conexion.py (siempre TCP: cada nodo es un puerto)."""
+    clientes = []
+    for nodo in nodos.split(","):
+        h, _, p = nodo.rpartition(":")
+        clientes.append(conexion.conectar(opciones, transporte="tcp",
+                                          host=h or opciones["host"], puerto=int(p)))
+    return clientes
+
+class Shards:
+    """Vista particionada de ranking_articles + artículos sobre varios nodos."""
+
+    def __init__(self, nodos, layout="hash", tam_bucket=16):
+        self.nodos = nodos
+        self.layout = layout
+        self.tam_bucket = tam_bucket
+        self.pool = ThreadPoolExecutor(max_workers=len(nodos))
+
+    def nodo(self, article_id):
+        slot = hash_slot(clave_almacen(article_id, self.layout, self.tam_bucket))
+        return slot * len(self.nodos) // SLOTS
+
+    def repartir(self, article_ids):
+        """Lista (por nodo) de los ids que le corresponden."""
+        partes = [[] for _ in self.nodos]
+        for aid in article_ids:
+            partes[self.nodo(aid)].append(aid)
+        return partes
+
+    def en_paralelo(self, funcion, argumentos):
+        """funcion(nodo, argumento) en todos los nodos a la vez."""
+        return list(self.pool.map(funcion, self.nodos, argumentos))
+
+    def zcard(self):
+        return sum(self.en_paralelo(lambda r, _: r.zcard("ranking_articles"), self.nodos))
+
+    def top(self, k=10):
+        """Top-k global con los datos de cada artículo."""
+        parciales = self.en_paralelo(
+            lambda r, _: r.zrevrange("ranking_articles", 0, k - 1, withscores=True), self.nodos)
+        # Desempate por id para que el resultado no dependa del orden de los nodos
+        top = heapq.nlargest(k, (x for p in parciales for x in p), key=lambda x: (x[1], x[0]))
+        por_nodo = self.repartir([aid for aid, _ in top])
+        leidos = self.en_paralelo(
+            lambda r, ids: dict(zip(ids, almacenamiento.leer_muchos(
+                r, ids, self.layout, self.tam_bucket))) if ids else {}, por_nodo)
+        datos = {aid: d for parte in leidos for aid, d in parte.items()}
+        return [((aid, pts), datos[aid]) for aid, pts in top]
+
+    def memoria(self):
+        """(used_memory, maxmemory) de cada nodo."""
+        infos = self.en_paralelo(lambda r, _: r.info("memory"), self.nodos)
+        return [(i["used_memory"], i.get("maxmemory", 0)) for i in infos]
+
+    def cerrar(self):
+        self.pool.shutdown()
+
+def preparar_nodos(shards):
+    """FLUSHDB, listpack y layout registrado en cada nodo."""
+    def preparar(r, _):
+        r.flushdb()
+        if shards.layout == "bucket":
+            almacenamiento.configurar_listpack(r, shards.tam_bucket)
+        almacenamiento.guardar_layout(r, shards.layout, shards.tam_bucket)
+    shards.en_paralelo(preparar, shards.nodos)
+
+def reescribir_layout(shards):
+    """Vuelve a registrar el layout en cada nodo al final de la corrida (con
+    allkeys-* la clave se puede haber desalojado)."""
+    shards.en_paralelo(lambda r, _: almacenamiento.reescribir_registro(
+        r, {"layout": shards.layout, "tam_bucket": shards.tam_bucket}), shards.nodos)
+
+def _mandar_lote(r, lote, layout, tam_bucket):
+    """Un pipeline con el ZADD agregado y los HSET de un nodo. Devuelve errores."""
+    if not lote:
+        return 0
+    pipe = r.pipeline(transaction=False)
+    pipe.zadd("ranking_articles", {aid: pts for aid, pts, _ in lote})
+    for aid, _, campos in lote:
+        almacenamiento.escribir(pipe, aid, campos, layout, tam_bucket)
+    try:
+        res = pipe.execute(raise_on_error=False)
+    except redis.RedisError as e:
+        print("ERROR al insertar lote en Redis:", e)
+        return len(lote)
+    return sum(1 for x in res if isinstance(x, redis.RedisError))
+
+def cargar(shards, articulos, batch_size=1000):
+    """Carga (article_id, pts, campos) repartiendo por nodo. Cuando se
+    juntan batch_size artículos por nodo se mandan todos los lotes a la vez.
+    Devuelve (artículos cargados, throughput de carga)."""
+    lotes = [[] for _ in shards.nodos]
+    contador = errores = 0
+    t0 = time.time()
+    for aid, pts, campos in articulos:
+        lotes[shards.nodo(aid)].append((aid, pts, campos))
+        contador += 1
+        if contador % (batch_size * len(shards.nodos)) == 0:
+            errores += sum(shards.en_paralelo(
+                lambda r, l: _mandar_lote(r, l, shards.layout, shards.tam_bucket), lotes))
+            lotes = [[] for _ in shards.nodos]
+        if contador % 100000 == 0:
+            print(f"Cargados {contador} artículos...")
+    errores += sum(shards.en_paralelo(
+        lambda r, l: _mandar_lote(r, l, shards.layout, shards.tam_bucket), lotes))
+    if errores:
+        print(f"ERROR al insertar en Redis: {errores} comandos con error")
+    dt = time.time() - t0
+    return contador, (contador / dt if dt > 0 else 0)
+
+def _incrementar_nodo(r, ids, lote):
+    """ZINCRBY de `ids` en pipelines de `lote`; latencia por pipeline."""
+    hist = Histograma()
+    pipe = r.pipeline(transaction=False)
+    for i in range(0, len(ids), lote):
+        for aid in ids[i:i + lote]:
+            pipe.zincrby("ranking_articles", random.randint(1, 5), aid)
+        t0 = time.perf_counter_ns()
+        try:
+            pipe.execute(raise_on_error=False)
+        except redis.RedisError as e:
+            print("ERROR en ZINCRBY:", e)
+            continue
+        hist.registrar(time.perf_counter_ns() - t0)
+    return hist
+
+def ejecutar_operaciones(shards, indice, rondas=3, lote=100):
+    """Igual que el benchmark de un nodo (10% de ZINCRBY por ronda y un
+    top-10), pero con pipelines por nodo. Devuelve (hist por pipeline, thr)."""
+    hist = Histograma()
+    ops = 0
+    rng = np.random.default_rng()
+    t0 = time.perf_counter()
+    for i in range(rondas):
+        total = shards.zcard()
+        k = min(max(1, total // 10), len(indice))
+        sample = [f"hn:{n}" for n in rng.choice(indice, k, replace=False)]
+        for h in shards.en_paralelo(lambda r, ids: _incrementar_nodo(r, ids, lote),
+                                    shards.repartir(sample)):
+            hist.combinar(h)
+        ops += len(sample)
+        shards.top(10)
+        print(f"Ronda {i+1}/{rondas} completada.")
+    dt = time.perf_counter() - t0
+    thr = ops / dt if dt > 0 else 0
+    print(f"ZINCRBY ({len(shards.nodos)} nodos, lotes de {lote}): {hist}")
+    return hist, thr
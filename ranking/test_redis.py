@@ -1,225 +1,506 @@
 #Script usado para benchmark Redis con datos de Hacker News, se llama desde run_tests.sh
+import argparse
 import redis
+import numpy as np
 import pandas as pd
 import random
 import time
 import os
 import sys
-import csv
 from datetime import datetime
 
-def cargar_datos(r, path_csv, max_articulos=1_000_000, expandir_articulos=True):
-    r.flushdb()
-    print("Base de datos Redis vaciada.")
-
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from comun import cache_columnar, conexion, perfilado
+from comun.funciones import Funciones
+from comun.histograma import Histograma
+from comun.instrumentacion import (columnas_keyspace, columnas_muestreo, contadores_keyspace,
+                                   contar_claves, fraccion, iniciar_muestreo, medir_metricas)
+from comun.resultados import escribir_fila
+
+import almacenamiento
+import carga_trabajo
+import shards
+
+def _expandir_articulos(path_csv, expandir_articulos=True):
+    """Lee el CSV, rellena nulos y arma una pasada expandida (fila0 v0..v3,
+    fila1 v0..v3, ...) como columnas para la cache columnar."""
     df = pd.read_csv(path_csv)
-    total_filas = len(df)
-    print(f"Filas totales en CSV: {total_filas}")
-    print(f"Max artículos (incluyendo versiones): {max_articulos}")
+    print(f"Filas totales en CSV: {len(df)}")
 
     # Rellenar nulos
     for col, val in [("title","sin título"),
                      ("author","desconocido"),
                      ("url","sin url"),
                      ("created_at","unknown")]:
-        df[col].fillna(val, inplace=True)
-    df["num_points"].fillna(0, inplace=True)
-    df["num_comments"].fillna(0, inplace=True)
+        df[col] = df[col].fillna(val)
+    df["num_points"] = df["num_points"].fillna(0)
+    df["num_comments"] = df["num_comments"].fillna(0)
 
+    n_versiones = 4 if expandir_articulos else 1
+    exp = df.loc[df.index.repeat(n_versiones)].reset_index(drop=True)
+    v = pd.Series(np.tile(np.arange(n_versiones), len(df)))
+    return {
+        "title": (exp["title"].astype(str)
+                  + (" - versión " + v.astype(str)).where(v > 0, "")).tolist(),
+        "author": exp["author"].astype(str).tolist(),
+        "url": (exp["url"].astype(str) + ("?v=" + v.astype(str)).where(v > 0, "")).tolist(),
+        "created_at": exp["created_at"].astype(str).tolist(),
+        "num_points": exp["num_points"].astype(np.int64).to_numpy() + v.to_numpy() * 3,
+        "num_comments": exp["num_comments"].astype(np.int64).to_numpy() + v.to_numpy() * 2,
+    }, {}
+
+def preparar_articulos(path_csv, expandir_articulos=True):
+    """Pasada expandida del CSV desde la cache columnar (se genera la primera vez)."""
+    return cache_columnar.obtener(
+        "ranking", [path_csv], {"expandir": expandir_articulos},
+        lambda: _expandir_articulos(path_csv, expandir_articulos))
+
+def generar_articulos(tabla, max_articulos, tam_bloque=10_000):
+    """Recorre la pasada expandida (las veces que haga falta) y genera
+    (article_id, pts, campos) hasta llegar a max_articulos."""
+    n = len(tabla)
     contador = 0
-    id_global = 0
-
-    while contador < max_articulos:
-        for idx, row in df.iterrows():
-            if contador >= max_articulos:
-                break
-
-            versiones = [0] if not expandir_articulos else range(4)
-            for v in versiones:
-                if contador >= max_articulos:
-                    break
-
-                article_id = f"hn:{id_global}"
-                id_global += 1
-
-                title    = row["title"] if v == 0 else f"{row['title']} - versión {v}"
-                url      = row["url"]   if v == 0 else f"{row['url']}?v={v}"
-                pts      = int(row["num_points"])   + v*3
-                comments = int(row["num_comments"]) + v*2
-
-                try:
-                    r.zadd("ranking_articles", {article_id: pts})
-                    r.hset(f"article:{article_id}", mapping={
-                        "title": title,
-                        "author": row["author"],
-                        "url": url,
-                        "created_at": row["created_at"],
-                        "num_points": pts,
-                        "num_comments": comments,
-                    })
-                except redis.RedisError as e:
-                    print("ERROR al insertar en Redis:", e)
-
+    while n and contador < max_articulos:
+        for inicio in range(0, n, tam_bloque):
+            fin = min(inicio + tam_bloque, n, inicio + max_articulos - contador)
+            if fin <= inicio:
+                return
+            titulos = tabla["title"].rebanada(inicio, fin)
+            autores = tabla["author"].rebanada(inicio, fin)
+            urls = tabla["url"].rebanada(inicio, fin)
+            fechas = tabla["created_at"].rebanada(inicio, fin)
+            puntos = tabla["num_points"][inicio:fin].tolist()
+            comentarios = tabla["num_comments"][inicio:fin].tolist()
+            for i in range(fin - inicio):
+                yield f"hn:{contador}", puntos[i], {
+                    "title": titulos[i],
+                    "author": autores[i],
+                    "url": urls[i],
+                    "created_at": fechas[i],
+                    "num_points": puntos[i],
+                    "num_comments": comentarios[i],
+                }
                 contador += 1
-                if contador % 100000 == 0:
-                    print(f"Cargados {contador} artículos...")
 
-            if contador >= max_articulos:
-                break
+def _ejecutar_lote(pipe, lote, por_articulo=1):
+    """Manda un lote del pipeline (`por_articulo` comandos de cada artículo y
+    el ZADD agregado al final). Devuelve la cantidad de artículos que no
+    quedaron cargados: los que tuvieron algún comando con error, o todo el
+    lote si falló el ZADD."""
+    pipe.zadd("ranking_articles", lote)
+    try:
+        resultados = pipe.execute(raise_on_error=False)
+    except redis.RedisError as e:
+        # Con MULTI un OOM aborta toda la transacción (EXECABORT)
+        print("ERROR al insertar lote en Redis:", e)
+        return len(lote)
+    errores = [res for res in resultados if isinstance(res, redis.RedisError)]
+    if not errores:
+        return 0
+    print(f"ERROR al insertar en Redis ({len(errores)} comandos del lote):", errores[0])
+    if isinstance(resultados[-1], redis.RedisError):
+        return len(lote)
+    return sum(1 for i in range(0, len(resultados) - 1, por_articulo)
+               if any(isinstance(res, redis.RedisError)
+                      for res in resultados[i:i + por_articulo]))
+
+def cargar_datos(r, path_csv, max_articulos=1_000_000, expandir_articulos=True,
+                 modo_carga="simple", batch_size=1000, layout="hash", tam_bucket=16,
+                 indice_versiones=False):
+    """Carga los artículos en Redis. modo_carga puede ser:
+    - simple:   un ZADD y un HSET por artículo (un round trip cada uno)
+    - pipeline: lotes de batch_size artículos en un pipeline sin MULTI
+    - multi:    lotes de batch_size artículos en un pipeline con MULTI/EXEC
+    layout es el de almacenamiento.py (hash o bucket). Con indice_versiones
+    cada artículo se agrega también a versiones:{base} (un SADD más).
+    Devuelve (artículos cargados, throughput de carga en artículos/s,
+    bytes de used_memory que agregó la carga); los artículos rechazados
+    (p. ej. OOM con noeviction) no cuentan como cargados."""
+    r.flushdb()
+    print("Base de datos Redis vaciada.")
+    if layout == "bucket":
+        almacenamiento.configurar_listpack(r, tam_bucket)
+    almacenamiento.guardar_layout(r, layout, tam_bucket)
+    mem_inicial = r.info("memory")["used_memory"]
+
+    tabla = preparar_articulos(path_csv, expandir_articulos)
+    n_versiones = 4 if expandir_articulos else 1
+    if indice_versiones:
+        almacenamiento.guardar_indice_versiones(r, len(tabla), n_versiones)
+    print(f"Filas en la pasada expandida (cache): {len(tabla)}")
+    print(f"Max artículos (incluyendo versiones): {max_articulos}")
+    print(f"Modo de carga: {modo_carga} (batch={batch_size}) | Layout: {layout}"
+          + (f" (bucket={tam_bucket})" if layout == "bucket" else ""))
+
+    contador = 0
+    fallidos = 0
+    t0 = time.time()
+
+    if modo_carga == "simple":
+        for article_id, pts, campos in generar_articulos(tabla, max_articulos):
+            try:
+                r.zadd("ranking_articles", {article_id: pts})
+                almacenamiento.escribir(r, article_id, campos, layout, tam_bucket)
+                if indice_versiones:
+                    almacenamiento.indexar_version(r, article_id, almacenamiento.id_base(
+                        contador, len(tabla), n_versiones))
+            except redis.RedisError as e:
+                print("ERROR al insertar en Redis:", e)
+                fallidos += 1
+
+            contador += 1
+            if contador % 100000 == 0:
+                print(f"Cargados {contador} artículos...")
+    else:
+        pipe = r.pipeline(transaction=(modo_carga == "multi"))
+        lote = {}
+        for article_id, pts, campos in generar_articulos(tabla, max_articulos):
+            # Los ZADD del lote se agregan en un único ZADD con todo el mapping
+            lote[article_id] = pts
+            almacenamiento.escribir(pipe, article_id, campos, layout, tam_bucket)
+            if indice_versiones:
+                almacenamiento.indexar_version(pipe, article_id, almacenamiento.id_base(
+                    contador, len(tabla), n_versiones))
+            if len(lote) >= batch_size:
+                fallidos += _ejecutar_lote(pipe, lote, 1 + indice_versiones)
+                lote = {}
+
+            contador += 1
+            if contador % 100000 == 0:
+                print(f"Cargados {contador} artículos...")
+        if lote:
+            fallidos += _ejecutar_lote(pipe, lote, 1 + indice_versiones)
+
+    dt = time.time() - t0
+    intentados, contador = contador, contador - fallidos
+    thr_carga = contador / dt if dt > 0 else 0
+    mem_carga = r.info("memory")["used_memory"] - mem_inicial
+    # Con allkeys-* la carga puede desalojar el layout registrado al principio
+    registro = {"layout": layout, "tam_bucket": tam_bucket}
+    if indice_versiones:
+        registro.update({"pasada": len(tabla), "versiones": n_versiones})
+    almacenamiento.reescribir_registro(r, registro)
 
     print("Carga finalizada.")
-    print(f"Total artículos insertados: {contador}")
+    print(f"Total artículos insertados: {contador}"
+          + (f" ({fallidos} de {intentados} rechazados)" if fallidos else ""))
     print(f"Total en ZSET: {r.zcard('ranking_articles')}")
-    return contador
-
-def ejecutar_operaciones(r, rondas=3):
+    print(f"Throughput de carga: {thr_carga:.1f} artículos/s ({dt:.2f}s)")
+    if contador:
+        print(f"Memoria por artículo: {mem_carga / contador:.1f} bytes")
+    return contador, thr_carga, mem_carga
+
+def construir_indice(contador):
+    """Índice compacto de ids numéricos (hn:{n}) armado una sola vez al cargar:
+    4 bytes por artículo en lugar de traer el ZSET entero en cada ronda."""
+    return np.arange(contador, dtype=np.uint32)
+
+def muestrear_ids(r, indice, k, muestreo="indice", rng=None):
+    """Devuelve k ids distintos de artículos.
+    - indice:   muestreo local sobre el índice numérico (O(k) en red); puede
+                elegir artículos ya desalojados (ZINCRBY los vuelve a crear en el ZSET)
+    - servidor: ZRANDMEMBER en Redis, solo devuelve miembros que siguen en el ZSET"""
+    if muestreo == "servidor":
+        return r.zrandmember("ranking_articles", k)
+    rng = rng or np.random.default_rng()
+    k = min(k, len(indice))
+    return [f"hn:{n}" for n in rng.choice(indice, k, replace=False)]
+
+def incr_y_top(r, funciones=None, article_id="", incremento=0, k=10, layout="hash",
+               tam_bucket=16):
+    """ZINCRBY (si hay article_id) y top-k con datos. En el cliente son tres
+    round trips (ZINCRBY, ZREVRANGE y el pipeline de lecturas); con
+    `funciones` (modo servidor) es un solo FCALL."""
+    if funciones is not None:
+        return funciones.incr_y_top("ranking_articles", k, article_id, incremento,
+                                    layout, tam_bucket)
+    if article_id:
+        r.zincrby("ranking_articles", incremento, article_id)
+    return almacenamiento.leer_top(r, k, layout, tam_bucket)
+
+def ejecutar_operaciones(r, indice, rondas=3, muestreo="indice", layout="hash", tam_bucket=16,
+                         hist=None, funciones=None, top_cada=0):
+    """Rondas de ZINCRBY sobre el 10% de los artículos con un top-10 al final.
+    Con top_cada > 0, cada top_cada operaciones el ZINCRBY y el top-10 se hacen
+    juntos (incr_y_top). Devuelve (hist de ZINCRBY, throughput, hist de los top,
+    cuentas); cuentas tiene los hits/misses del keyspace, las referencias
+    colgantes de los top (ids del ZSET cuyo artículo fue desalojado) y el
+    throughput útil (ZINCRBY de artículos que todavía existen)."""
+    hist_top = Histograma()
     total = r.zcard("ranking_articles")
     if total == 0:
         print("No hay artículos cargados.")
-        return 0, 0, 0
+        return Histograma(), 0, hist_top, {}
 
-    latencias = []
-    ops = 0
-    t0 = time.time()
+    # hist se puede pasar desde afuera para que el muestreador de INFO lo lea en vivo
+    hist = hist if hist is not None else Histograma()
+    ops = utiles = colgantes = 0
+    # La verificación de existencia queda fuera del tiempo y de los hits/misses
+    pausa, propios = 0.0, (0, 0)
+    rng = np.random.default_rng()
+    ks_inicial = contadores_keyspace(r)
+    t0 = time.perf_counter()
 
     for i in range(rondas):
-        ids = r.zrange("ranking_articles", 0, -1)
-        sample = random.sample(ids, max(1, len(ids)//10))
-        for aid in sample:
-            t_start = time.time()
-            r.zincrby("ranking_articles", random.randint(1,5), aid)
-            latencias.append(time.time() - t_start)
+        # Igual que antes: 10% de lo que sigue en el ZSET, pero sin traerlo entero
+        total = r.zcard("ranking_articles")
+        sample = muestrear_ids(r, indice, max(1, total//10), muestreo, rng)
+        for j, aid in enumerate(sample):
+            t_start = time.perf_counter_ns()
+            if top_cada and j % top_cada == top_cada - 1:
+                top = incr_y_top(r, funciones, aid, random.randint(1,5), 10, layout, tam_bucket)
+                hist_top.registrar(time.perf_counter_ns() - t_start)
+                colgantes += sum(1 for _, datos in top if not datos)
+            else:
+                r.zincrby("ranking_articles", random.randint(1,5), aid)
+                hist.registrar(time.perf_counter_ns() - t_start)
             ops += 1
-        for aid,_ in r.zrevrange("ranking_articles", 0, 9, withscores=True):
-            _ = r.hgetall(f"article:{aid}")
+        t_start = time.perf_counter_ns()
+        top = incr_y_top(r, funciones, k=10, layout=layout, tam_bucket=tam_bucket)
+        hist_top.registrar(time.perf_counter_ns() - t_start)
+        colgantes += sum(1 for _, datos in top if not datos)
+
+        t_pausa = time.perf_counter()
+        antes = contadores_keyspace(r)
+        utiles += sum(almacenamiento.existen(r, sample, layout, tam_bucket))
+        despues = contadores_keyspace(r)
+        propios = (propios[0] + despues[0] - antes[0], propios[1] + despues[1] - antes[1])
+        pausa += time.perf_counter() - t_pausa
         print(f"Ronda {i+1}/{rondas} completada.")
 
-    dt = time.time() - t0
-    ms = sorted([l*1000 for l in latencias])
-    p50 = ms[len(ms)//2] if ms else 0
-    p99 = ms[int(len(ms)*0.99)] if len(ms)>1 else p50
+    dt = time.perf_counter() - t0 - pausa
     thr = ops / dt if dt>0 else 0
-    return p50, p99, thr
-
-def esperar_bgsave(r, timeout=60.0, interval=0.5):
-    start = time.time()
-
-    # Esperar a que no haya un BGSAVE en progreso
-    while True:
-        info = r.info("persistence")
-        if info.get("rdb_bgsave_in_progress") == 0:
-            break
-        if time.time() - start > timeout:
-            print("WARNING: timeout esperando que termine BGSAVE previo")
-            return False
-        time.sleep(interval)
-
-    # Lanzar nuevo BGSAVE
-    r.bgsave()
-
-    # Esperar a que termine este BGSAVE
-    while True:
-        info = r.info("persistence")
-        if info.get("rdb_bgsave_in_progress") == 0:
-            break
-        if time.time() - start > timeout:
-            print("WARNING: timeout esperando BGSAVE")
-            return False
-        time.sleep(interval)
-
-    return True
-
-
-def medir_metricas(r, redis_dir, modo):
-    # — Forzar persistencia —
-    if modo.startswith("rdb") or modo=="mixto":
-        esperar_bgsave(r)
-    if modo.startswith("aof") or modo=="mixto":
-        # Esperar y lanzar AOF rewrite
-        start = time.time()
-        # esperar que no haya rewrite en curso
-        while r.info("persistence").get("aof_rewrite_in_progress", 0) == 1:
-            time.sleep(0.1)
-            if time.time() - start > 30:
-                print("WARNING: timeout esperando fin de AOF rewrite previo")
-                break
-        # lanzar
-        r.bgrewriteaof()
-        # esperar que termine
-        start = time.time()
-        while r.info("persistence").get("aof_rewrite_in_progress", 0) == 1:
-            time.sleep(0.1)
-            if time.time() - start > 30:
-                print("WARNING: timeout esperando nuevo AOF rewrite")
-                break
-
-    mem = r.info("memory")
-    stats = r.info("stats")
-    memory_used  = mem["used_memory"]
-    evicted_keys = stats["evicted_keys"]
-
-    # Tamaño RDB
-    rdb_path = os.path.join(redis_dir, "dump.rdb")
-    rdb_size = os.path.getsize(rdb_path) if os.path.exists(rdb_path) else 0
-
-    # Tamaño AOF (busca en $REDIS_PERSISTENCE_DIR y en appendonlydir/)
-    aof_size = 0
-
-    # 1) Archivo principal si existe
-    main_aof = os.path.join(redis_dir, "appendonly.aof")
-    if os.path.exists(main_aof):
-        aof_size += os.path.getsize(main_aof)
-
-    # 2) Cualquier AOF dentro de appendonlydir/
-    append_dir = os.path.join(redis_dir, "appendonlydir")
-    if os.path.isdir(append_dir):
-        for fname in os.listdir(append_dir):
-            if fname.startswith("appendonly.aof"):
-                aof_size += os.path.getsize(os.path.join(append_dir, fname))
-
-    return {
-        "memory_used": memory_used,
-        "evicted_keys": evicted_keys,
-        "rdb_size": rdb_size,
-        "aof_size": aof_size
+    cuentas = {
+        **columnas_keyspace(ks_inicial, contadores_keyspace(r), propios),
+        "colgantes": colgantes,
+        "useful_throughput": f"{utiles / dt:.1f}" if dt > 0 else "0.0",
     }
-
-def guardar_csv(fname, datos, modo, politica, dataset, lat_p50, lat_p99, thr):
-    header = ["fecha","modo","politica","dataset","lat_p50_ms",
-              "lat_p99_ms","throughput","rdb_bytes","aof_bytes",
-              "evicted_keys"]
-    existe = os.path.isfile(fname)
-    with open(fname, "a", newline="") as f:
-        w = csv.writer(f)
-        if not existe:
-            w.writerow(header)
-        w.writerow([
-            datetime.now().isoformat(),
-            modo, politica, dataset,
-            f"{lat_p50:.3f}", f"{lat_p99:.3f}", f"{thr:.1f}",
-            datos["rdb_size"], datos["aof_size"], datos["evicted_keys"]
-        ])
+    print(f"ZINCRBY: {hist}")
+    print(f"Top-10 ({'servidor' if funciones else 'cliente'}): {hist_top}")
+    if utiles < ops or colgantes:
+        print(f"Desalojos: {ops - utiles}/{ops} ZINCRBY sobre artículos desalojados, "
+              f"{colgantes} ids colgantes en los top-10")
+    return hist, thr, hist_top, cuentas
+
+def guardar_csv(fname, datos, modo, politica, dataset, hist, thr, extra=None):
+    fila = {
+        "fecha": datetime.now().isoformat(),
+        "modo": modo, "politica": politica, "dataset": dataset,
+        **hist.columnas_csv("lat"),
+        "throughput": f"{thr:.1f}",
+        "rdb_bytes": datos["rdb_size"], "aof_bytes": datos["aof_size"],
+        "evicted_keys": datos["evicted_keys"],
+    }
+    fila.update(extra or {})
+    escribir_fila(fname, fila)
+
+def correr_particionado(args, nodos, n_nodos):
+    """Una corrida del benchmark con el ranking repartido en los primeros
+    n_nodos nodos. Escribe una fila con throughput y memoria por nodo."""
+    vista = shards.Shards(nodos[:n_nodos], args.layout, args.tam_bucket)
+    dirs = (args.dirs_nodos.split(",") if args.dirs_nodos else [args.redis_dir])
+    print(f"=== Ranking particionado en {n_nodos} nodos ===")
+    shards.preparar_nodos(vista)
+    mem_inicial = sum(u for u, _ in vista.memoria())
+
+    tabla = preparar_articulos(args.csv)
+    cargados, thr_carga = shards.cargar(
+        vista, generar_articulos(tabla, args.dataset), args.batch)
+    memoria = vista.memoria()
+    mem_carga = sum(u for u, _ in memoria) - mem_inicial
+    print(f"Cargados {cargados} artículos ({thr_carga:.1f} art/s) | en ZSETs: {vista.zcard()}")
+    print("Memoria por nodo: " + ", ".join(f"{u / 2**20:.1f} MB" for u, _ in memoria))
+
+    hist, thr = shards.ejecutar_operaciones(vista, construir_indice(cargados), lote=args.lote_zincrby)
+    shards.reescribir_layout(vista)
+
+    mets = [medir_metricas(r, dirs[i] if i < len(dirs) else None, args.modo,
+                           not args.sin_rewrite_aof)
+            for i, r in enumerate(vista.nodos)]
+    memoria = vista.memoria()
+    margen = [m - u for u, m in memoria if m]
+    vista.cerrar()
+    total = {k: sum(m[k] for m in mets) for k in mets[0]}
+    guardar_csv(args.out_csv, total, args.modo, args.politica, args.dataset, hist, thr, extra={
+        "modo_carga": "pipeline",
+        "load_throughput": f"{thr_carga:.1f}",
+        "muestreo": "indice",
+        "layout": args.layout,
+        "tam_bucket": args.tam_bucket if args.layout == "bucket" else "",
+        "memory_used": total["memory_used"],
+        "bytes_por_articulo": f"{mem_carga / cargados:.1f}" if cargados else "",
+        "nodos": n_nodos,
+        "lote_zincrby": args.lote_zincrby,
+        "memoria_max_nodo": max(u for u, _ in memoria),
+        "margen_min_nodo": min(margen) if margen else "",
+        **conexion.columnas(vista.nodos[0]),
+    })
 
 def main():
-    if len(sys.argv)!=7:
-        print("Uso: test_redis.py <csv> <modo> <politica> <dataset> <redis_dir> <out_csv>")
-        sys.exit(1)
-
-    path_csv, modo, politica, dataset, redis_dir, out_csv = sys.argv[1:]
+    parser = argparse.ArgumentParser(
+        description="Benchmark Redis con datos de Hacker News (ZSET + HASH)")
+    parser.add_argument("csv", help="CSV de Hacker News")
+    parser.add_argument("modo", help="modo de persistencia (rdb, aof_everysec, aof_always, mixto)")
+    parser.add_argument("politica", help="política de memoria")
+    parser.add_argument("dataset", type=int, help="cantidad de artículos (incluyendo versiones)")
+    parser.add_argument("redis_dir", help="directorio de persistencia de Redis")
+    parser.add_argument("out_csv", help="CSV de resultados")
+    parser.add_argument("--carga", choices=["simple", "pipeline", "multi"], default="simple",
+                        help="modo de carga masiva (default: simple, un round trip por comando)")
+    parser.add_argument("--batch", type=int, default=1000,
+                        help="artículos por lote en los modos pipeline/multi")
+    parser.add_argument("--muestreo", choices=["indice", "servidor"], default="indice",
+                        help="cómo elegir el 10%% de artículos de cada ronda: índice local "
+                             "de ids o ZRANDMEMBER en el servidor")
+    parser.add_argument("--layout", choices=almacenamiento.LAYOUTS, default="hash",
+                        help="hash: un HASH por artículo; bucket: artículos agrupados en "
+                             "HASHes chicos con encoding listpack")
+    parser.add_argument("--tam-bucket", type=int, default=16,
+                        help="artículos por bucket en el layout bucket")
+    parser.add_argument("--ejecucion", choices=["cliente", "servidor"], default="cliente",
+                        help="cliente: ZINCRBY + ZREVRANGE + lecturas desde el cliente; "
+                             "servidor: incremento y top-10 con datos en una Redis Function")
+    parser.add_argument("--top-cada", type=int, default=0,
+                        help="cada N operaciones el ZINCRBY se hace junto con el top-10 "
+                             "(0 = solo un top-10 por ronda)")
+    parser.add_argument("--mezcla", choices=["original"] + list(carga_trabajo.MEZCLAS),
+                        default="original",
+                        help="original: rondas de ZINCRBY sobre el 10%% con un top-10 por ronda; "
+                             "lectura/mixta/escritura/top: mezclas estilo YCSB de "
+                             "carga_trabajo.py con latencia por tipo de operación")
+    parser.add_argument("--distribucion", choices=carga_trabajo.DISTRIBUCIONES,
+                        default="uniforme",
+                        help="(con --mezcla) popularidad de los artículos")
+    parser.add_argument("--zipf-theta", type=float, default=0.99,
+                        help="exponente de la distribución zipf")
+    parser.add_argument("--hotspot-claves", type=float, default=0.2,
+                        help="fracción de artículos calientes en la distribución hotspot")
+    parser.add_argument("--hotspot-ops", type=float, default=0.8,
+                        help="fracción de operaciones que van a los artículos calientes")
+    parser.add_argument("--operaciones", type=int, default=0,
+                        help="(con --mezcla) operaciones a correr (0 = 30%% de los artículos, "
+                             "lo mismo que las tres rondas del 10%%)")
+    conexion.agregar_argumentos(parser)
+    parser.add_argument("--nodos", default="",
+                        help="ranking particionado: puertos (o host:puerto) de los nodos, "
+                             "separados por coma (ej: 6380,6381,6382,6383)")
+    parser.add_argument("--escalar", action="store_true",
+                        help="con --nodos: una fila por cada cantidad de nodos 1..N")
+    parser.add_argument("--dirs-nodos", default="",
+                        help="con --nodos: directorios de persistencia de cada nodo "
+                             "(por defecto solo se miden los archivos de redis_dir)")
+    parser.add_argument("--lote-zincrby", type=int, default=100,
+                        help="con --nodos: ZINCRBY por pipeline en cada nodo")
+    parser.add_argument("--indice-versiones", action="store_true",
+                        help="mantiene versiones:{base} con las versiones de cada artículo "
+                             "durante la carga (lo usa redis_queries.py)")
+    perfilado.agregar_argumentos(parser)
+    parser.add_argument("--sin-rewrite-aof", action="store_true",
+                        help="no consolida el AOF con BGREWRITEAOF al final (el orquestador "
+                             "lo usa para medir la recuperación con el AOF sin reescribir)")
+    parser.add_argument("--intervalo-info", type=float, default=0.1,
+                        help="segundos entre muestras de INFO en segundo plano (0 desactiva)")
+    args = parser.parse_args()
+
+    path_csv, modo, politica, dataset = args.csv, args.modo, args.politica, args.dataset
+    redis_dir, out_csv = args.redis_dir, args.out_csv
     if not os.path.isfile(path_csv):
         print("ERROR: CSV no existe:", path_csv); sys.exit(1)
     if not os.path.isdir(redis_dir):
         print("ERROR: redis_dir no es dir:", redis_dir); sys.exit(1)
 
-    r = redis.Redis(host="localhost", port=6380, decode_responses=True)
-
     print("=== Ejecutando benchmark Redis ===")
     print(f"Modo={modo}, Pol={politica}, Dataset={dataset}")
 
-    cargar_datos(r, path_csv, max_articulos=int(dataset))
-    p50, p99, thr = ejecutar_operaciones(r)
-    mets = medir_metricas(r, redis_dir, modo)
-    guardar_csv(out_csv, mets, modo, politica, dataset, p50, p99, thr)
+    if args.nodos:
+        if args.transporte == "unix":
+            print("ERROR: --nodos va por TCP (un puerto por nodo), no con --transporte unix")
+            sys.exit(1)
+        nodos = shards.conectar(args.nodos, conexion.opciones(args))
+        print(f"Conexión: {conexion.describir(nodos[0])}")
+        for n in (range(1, len(nodos) + 1) if args.escalar else [len(nodos)]):
+            correr_particionado(args, nodos, n)
+        print("Benchmark completado. Resultados en", out_csv)
+        return
+
+    r = conexion.conectar(conexion.opciones(args))
+    print(f"Conexión: {conexion.describir(r)}")
+
+    muestreador = iniciar_muestreo(r, out_csv, args.intervalo_info,
+                                   "ranking", modo, politica, dataset)
+    perfil = perfilado.iniciar_perfilado(r, out_csv, args.perfilar, args.cprofile,
+                                         args.tracemalloc, "ranking", modo, politica, dataset)
+    cargados, thr_carga, mem_carga = cargar_datos(
+        r, path_csv, max_articulos=dataset, modo_carga=args.carga, batch_size=args.batch,
+        layout=args.layout, tam_bucket=args.tam_bucket,
+        indice_versiones=args.indice_versiones)
+    registro = r.hgetall(almacenamiento.CLAVE_LAYOUT)
+    encoding = almacenamiento.encoding_muestra(r, args.layout, args.tam_bucket, cargados)
+    print(f"Encoding de una muestra de claves: {encoding}")
+    indice = construir_indice(cargados)
+    funciones = Funciones(r) if args.ejecucion == "servidor" else None
+    hist = Histograma()
+    if muestreador:
+        muestreador.fase("operaciones")
+        muestreador.observar(hist)
+    if perfil:
+        perfil.fase("operaciones")
+    por_op = {}
+    distribucion = args.distribucion if args.mezcla != "original" else "uniforme"
+    if args.mezcla == "original":
+        if args.distribucion != "uniforme":
+            print("--distribucion solo se aplica con --mezcla: la corrida original es uniforme.")
+        hist, thr, hist_top, cuentas = ejecutar_operaciones(
+            r, indice, muestreo=args.muestreo, layout=args.layout, tam_bucket=args.tam_bucket,
+            hist=hist, funciones=funciones, top_cada=args.top_cada)
+    else:
+        hist, thr, por_op, cuentas = carga_trabajo.ejecutar_mezcla(
+            r, args.mezcla, cargados, args.operaciones or max(1, cargados * 3 // 10),
+            distribucion, args.layout, args.tam_bucket, hist=hist, funciones=funciones,
+            theta=args.zipf_theta, hotspot_claves=args.hotspot_claves,
+            hotspot_ops=args.hotspot_ops)
+        hist_top = por_op.get("top", Histograma())
+    sobreviven = {
+        "sobrevive_articulos": fraccion(
+            contar_claves(r, almacenamiento.patron_claves(args.layout)),
+            almacenamiento.claves_esperadas(cargados, args.layout, args.tam_bucket)),
+        "sobrevive_ranking": fraccion(min(r.zcard("ranking_articles"), cargados), cargados),
+    }
+    almacenamiento.reescribir_registro(r, registro)
+    if muestreador:
+        muestreador.fase("persistencia")
+    if perfil:
+        perfil.fase("persistencia")
+    mets = medir_metricas(r, redis_dir, modo, not args.sin_rewrite_aof)
+    if muestreador:
+        muestreador.detener()
+    if perfil:
+        perfil.terminar()
+    guardar_csv(out_csv, mets, modo, politica, dataset, hist, thr, extra={
+        "modo_carga": args.carga,
+        "load_throughput": f"{thr_carga:.1f}",
+        "muestreo": args.muestreo,
+        "layout": args.layout,
+        "tam_bucket": args.tam_bucket if args.layout == "bucket" else "",
+        "memory_used": mets["memory_used"],
+        "bytes_por_articulo": f"{mem_carga / cargados:.1f}" if cargados else "",
+        "encoding": encoding,
+        "ejecucion": args.ejecucion,
+        "top_cada": args.top_cada,
+        "indice_versiones": "si" if args.indice_versiones else "no",
+        "aof_rewrite": "no" if args.sin_rewrite_aof else "si",
+        **hist_top.columnas_csv("top"),
+        "mezcla": args.mezcla,
+        "distribucion": distribucion,
+        "zipf_theta": args.zipf_theta if distribucion == "zipf" else "",
+        "hotspot": (f"{args.hotspot_claves}/{args.hotspot_ops}"
+                    if distribucion == "hotspot" else ""),
+        **carga_trabajo.columnas_operaciones(por_op),
+        **cuentas,
+        **sobreviven,
+        **conexion.columnas(r),
+        **columnas_muestreo(muestreador),
+    })
 
     print("Benchmark completado. Resultados en", out_csv)
 
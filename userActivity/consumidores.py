@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+Consumidores del stream user_activity_stream con consumer groups.
+Lo usa test_stream.py para medir el lado de lectura (XREADGROUP + XACK) y la
+recuperación de mensajes pendientes (XPENDING + XAUTOCLAIM).
+"""
+
+import threading
+import time
+
+from redis import Redis
+
+from comun import conexion
+from comun.conexion import texto
+from comun.histograma import Histograma
+
+STREAM = "user_activity_stream"
+GRUPO = "procesadores"
+
+
+def crear_grupo(r: Redis, grupo: str = GRUPO):
+    """Crea el consumer group desde el principio del stream (lo crea si no existe)."""
+    r.xgroup_create(STREAM, grupo, id="0", mkstream=True)
+
+
+class EstadoConsumo:
+    """Estado compartido entre los consumidores: total confirmado y objetivo."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.confirmados = 0
+        self.objetivo = None  # lo fija el productor cuando termina
+        self.t_ultimo_ack = None
+        self.cancelado = False
+
+    def sumar(self, n: int):
+        with self.lock:
+            self.confirmados += n
+            self.t_ultimo_ack = time.time()
+
+    def terminado(self) -> bool:
+        with self.lock:
+            if self.cancelado:
+                return True
+            return self.objetivo is not None and self.confirmados >= self.objetivo
+
+    def esperar(self, hilos, timeout: float = 60.0) -> bool:
+        """Espera a que los consumidores confirmen todo. Si no hay progreso en
+        `timeout` segundos (ej: el stream fue desalojado) los cancela."""
+        ultimo, t_ultimo = -1, time.time()
+        while any(h.is_alive() for h in hilos):
+            with self.lock:
+                actual = self.confirmados
+            if actual != ultimo:
+                ultimo, t_ultimo = actual, time.time()
+            elif time.time() - t_ultimo > timeout:
+                print("WARNING: consumidores sin progreso, se cancelan")
+                with self.lock:
+                    self.cancelado = True
+            time.sleep(0.1)
+        return not self.cancelado
+
+
+def _lag_ms(entry_id: str, ahora_ms: float) -> float:
+    """Lag produce->ack: la parte en ms del ID del stream es el reloj del
+    servidor al hacer XADD (cliente y servidor corren en la misma máquina).
+    Solo vale con ids automáticos (*): los ids por fecha salen de created_at."""
+    return ahora_ms - int(texto(entry_id).split("-", 1)[0])
+
+
+def _entradas(resp) -> list:
+    """Entradas de un XREADGROUP de un solo stream: [[stream, entradas]] en
+    RESP2, {stream: [entradas]} en RESP3."""
+    if not resp:
+        return []
+    return next(iter(resp.values()))[0] if isinstance(resp, dict) else resp[0][1]
+
+
+def consumir(opciones: dict, nombre: str, estado: EstadoConsumo, count: int = 100,
+             lote_ack: int = 100, min_idle_ms: int = 1000, caido: bool = False,
+             medir_lag: bool = True):
+    """Loop de un consumidor. Lee con XREADGROUP de a `count` entradas y hace
+    XACK cada `lote_ack`. Cuando no hay entradas nuevas revisa XPENDING y
+    reclama con XAUTOCLAIM lo que lleve más de `min_idle_ms` sin ack.
+    Si `caido` es True lee un lote y termina sin hacer ack (simula una caída).
+    Con `medir_lag` False (ids explícitos) el histograma de lags queda vacío.
+    Devuelve un dict con el histograma de lags, confirmados y reclamados."""
+    r = conexion.conectar(opciones)
+    lags = Histograma()
+    sin_ack = []
+    confirmados = 0
+    reclamados = 0
+
+    def confirmar():
+        nonlocal sin_ack, confirmados
+        # XACK devuelve cuántas entradas sacó del PEL: si XAUTOCLAIM le pasó a
+        # otro consumidor una entrada que este tenía sin ack, solo cuenta uno
+        n = r.xack(STREAM, GRUPO, *sin_ack)
+        if medir_lag:
+            ahora_ms = time.time() * 1000
+            for eid in sin_ack:
+                lags.registrar(_lag_ms(eid, ahora_ms) * 1e6)
+        confirmados += n
+        estado.sumar(n)
+        sin_ack = []
+
+    while not estado.terminado():
+        resp = r.xreadgroup(GRUPO, nombre, {STREAM: ">"}, count=count, block=100)
+        entradas = _entradas(resp)
+
+        if caido and entradas:
+            print(f"Consumidor {nombre} cae con {len(entradas)} entradas sin ack.")
+            break
+
+        if not entradas:
+            # Sin entradas nuevas: confirmar lo acumulado y buscar pendientes ajenos
+            if sin_ack:
+                confirmar()
+            if r.xpending(STREAM, GRUPO)["pending"] > 0:
+                _, entradas, *_ = r.xautoclaim(STREAM, GRUPO, nombre, min_idle_ms,
+                                               start_id="0-0", count=count)
+                entradas = [e for e in entradas if e and e[0]]
+                reclamados += len(entradas)
+
+        sin_ack.extend(eid for eid, _ in entradas)
+        if len(sin_ack) >= lote_ack:
+            confirmar()
+
+    if sin_ack and not caido:
+        confirmar()
+
+    return {"lags": lags, "confirmados": confirmados, "reclamados": reclamados}
+
+
+def lanzar_consumidores(r: Redis, n: int, estado: EstadoConsumo, count: int = 100,
+                        lote_ack: int = 100, min_idle_ms: int = 1000,
+                        con_caido: bool = False, medir_lag: bool = True):
+    """Arranca n consumidores en hilos (más uno que se cae si con_caido).
+    Devuelve (hilos, resultados); resultados se completa al terminar cada hilo."""
+    opciones = conexion.opciones_de(r)
+    resultados = []
+
+    def correr(nombre, caido):
+        resultados.append(consumir(opciones, nombre, estado, count, lote_ack,
+                                   min_idle_ms, caido, medir_lag))
+
+    nombres = [(f"consumidor-{i}", False) for i in range(n)]
+    if con_caido:
+        nombres.insert(0, ("consumidor-caido", True))
+    hilos = [threading.Thread(target=correr, args=nc, daemon=True) for nc in nombres]
+    for h in hilos:
+        h.start()
+    return hilos, resultados
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+"""
+Índices secundarios de user_activity_stream, mantenidos en la ingesta.
+
+  actividad:usuarios           ZSET user -> eventos (contador global)
+  actividad:usuarios:{minuto}  ZSET user -> eventos de ese minuto (ms // 60000)
+  actividad:tipos              HASH type -> eventos
+
+Además los ids de las entradas salen de created_at ("{ms}-{seq}"), así que
+un rango de tiempo es directamente un XRANGE por id en vez de recorrer el
+stream entero filtrando por el campo timestamp.
+
+Las consultas vienen de a pares (o tríos): la versión con índices y la de
+recorrer el stream completo, que es lo único posible sin ellos.
+"""
+
+import calendar
+import threading
+import time
+from functools import lru_cache
+
+from redis import Redis
+
+from comun.histograma import Histograma
+
+STREAM = "user_activity_stream"
+USUARIOS = "actividad:usuarios"
+PREFIJO_MINUTO = "actividad:usuarios:"
+TIPOS = "actividad:tipos"
+PATRON = "actividad:*"
+# ZSET de paso de top_ventana_indice: no es parte del índice
+PREFIJO_TMP = "actividad:tmp:"
+
+# Comandos de índice que se encolan por evento además del XADD
+COMANDOS = 3
+
+
+@lru_cache(maxsize=8192)
+def ms_de(created_at: str) -> int:
+    """'2025-06-01T15:00:00Z' -> milisegundos epoch (UTC)."""
+    return calendar.timegm(time.strptime(created_at, "%Y-%m-%dT%H:%M:%SZ")) * 1000
+
+
+def fecha_de(ms: int) -> str:
+    """Inversa de ms_de, en el mismo formato que el campo timestamp."""
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(ms // 1000))
+
+
+class IdsPorFecha:
+    """Genera ids de stream "{ms}-{seq}" crecientes a partir de created_at.
+    GH Archive viene casi ordenado; un evento con fecha anterior al último se
+    corre al ms del último (el stream no acepta ids menores) y se cuenta."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ultimo_ms = 0
+        self.seq = -1
+        self.corridos = 0
+
+    def siguiente(self, created_at: str) -> str:
+        ms = ms_de(created_at)
+        with self.lock:
+            if ms > self.ultimo_ms:
+                self.ultimo_ms, self.seq = ms, 0
+            else:
+                if ms < self.ultimo_ms:
+                    self.corridos += 1
+                self.seq += 1
+            return f"{self.ultimo_ms}-{self.seq}"
+
+
+def encolar(pipe, user: str, tipo: str, ts: str, ids: IdsPorFecha = None, retencion=None):
+    """XADD del evento y, con `ids`, la actualización de los índices en el
+    mismo pipeline (1 + COMANDOS comandos). Con `retencion`
+    (retencion.Retencion) el XADD lleva su recorte inline. `pipe` también
+    puede ser el cliente: sin `ids` es un solo comando."""
+    opciones = retencion.opciones_xadd(ts) if retencion is not None else {}
+    if ids is None:
+        pipe.xadd(STREAM, {"user": user, "type": tipo, "timestamp": ts}, **opciones)
+        return
+    pipe.xadd(STREAM, {"user": user, "type": tipo, "timestamp": ts}, id=ids.siguiente(ts),
+              **opciones)
+    pipe.zincrby(USUARIOS, 1, user)
+    pipe.zincrby(f"{PREFIJO_MINUTO}{ms_de(ts) // 60000}", 1, user)
+    pipe.hincrby(TIPOS, tipo, 1)
+
+
+def claves(r: Redis) -> list:
+    return list(r.scan_iter(match=PATRON, count=1000))
+
+
+def limpiar(r: Redis):
+    for c in claves(r):
+        r.delete(c)
+
+
+def memoria(r: Redis) -> int:
+    """Bytes que ocupan las claves de índices (MEMORY USAGE de cada una)."""
+    pipe = r.pipeline(transaction=False)
+    for c in claves(r):
+        pipe.memory_usage(c, samples=0)
+    return sum(x or 0 for x in pipe.execute())
+
+
+def recorrer(r: Redis, inicio="-", fin="+", pagina: int = 10_000):
+    """Entradas de XRANGE inicio..fin, paginadas para no traer todo junto."""
+    while True:
+        entradas = r.xrange(STREAM, min=inicio, max=fin, count=pagina)
+        yield from entradas
+        if len(entradas) < pagina:
+            return
+        inicio = "(" + entradas[-1][0]
+
+
+def ultimo_ms(r: Redis) -> int:
+    ultima = r.xrevrange(STREAM, count=1)
+    return int(ultima[0][0].split("-")[0]) if ultima else 0
+
+
+def _top(conteo: dict, k: int) -> list:
+    return sorted(conteo.items(), key=lambda x: (-x[1], x[0]))[:k]
+
+
+# --- eventos de un usuario ---
+
+def eventos_usuario_indice(r: Redis, user: str) -> int:
+    return int(r.zscore(USUARIOS, user) or 0)
+
+
+def eventos_usuario_scan(r: Redis, user: str) -> int:
+    return sum(1 for _, campos in recorrer(r) if campos.get("user") == user)
+
+
+# --- eventos por tipo ---
+
+def eventos_por_tipo_indice(r: Redis) -> dict:
+    return {t: int(n) for t, n in r.hgetall(TIPOS).items()}
+
+
+def eventos_por_tipo_scan(r: Redis) -> dict:
+    conteo = {}
+    for _, campos in recorrer(r):
+        conteo[campos["type"]] = conteo.get(campos["type"], 0) + 1
+    return conteo
+
+
+# --- usuarios más activos en los últimos N minutos ---
+
+def top_ventana_indice(r: Redis, desde_ms: int, hasta_ms: int, k: int = 10) -> list:
+    """ZUNIONSTORE de los ZSET por minuto de la ventana en una clave temporal."""
+    minutos = [f"{PREFIJO_MINUTO}{m}" for m in range(desde_ms // 60000, hasta_ms // 60000 + 1)]
+    tmp = f"{PREFIJO_TMP}{threading.get_ident()}"
+    pipe = r.pipeline(transaction=False)
+    pipe.zunionstore(tmp, minutos)
+    pipe.zrevrange(tmp, 0, k - 1, withscores=True)
+    pipe.delete(tmp)
+    top = pipe.execute()[1]
+    return [(u, int(s)) for u, s in top]
+
+
+def top_ventana_rango(r: Redis, desde_ms: int, hasta_ms: int, k: int = 10) -> list:
+    """Solo el XRANGE de la ventana (posible por los ids derivados de la fecha)."""
+    conteo = {}
+    for _, campos in recorrer(r, desde_ms, hasta_ms):
+        conteo[campos["user"]] = conteo.get(campos["user"], 0) + 1
+    return _top(conteo, k)
+
+
+def top_ventana_scan(r: Redis, desde_ms: int, hasta_ms: int, k: int = 10) -> list:
+    """Stream completo filtrando por el campo timestamp."""
+    desde, hasta = fecha_de(desde_ms), fecha_de(hasta_ms)
+    conteo = {}
+    for _, campos in recorrer(r):
+        if desde <= campos["timestamp"] <= hasta:
+            conteo[campos["user"]] = conteo.get(campos["user"], 0) + 1
+    return _top(conteo, k)
+
+
+# --- cantidad de eventos en un rango de tiempo ---
+
+def eventos_ventana_rango(r: Redis, desde_ms: int, hasta_ms: int) -> int:
+    return sum(1 for _ in recorrer(r, desde_ms, hasta_ms))
+
+
+def eventos_ventana_scan(r: Redis, desde_ms: int, hasta_ms: int) -> int:
+    desde, hasta = fecha_de(desde_ms), fecha_de(hasta_ms)
+    return sum(1 for _, campos in recorrer(r) if desde <= campos["timestamp"] <= hasta)
+
+
+def _medir(funcion, argumentos: list, hist):
+    """Corre funcion(*a) para cada a de `argumentos` y devuelve el último resultado."""
+    res = None
+    for a in argumentos:
+        t0 = time.perf_counter_ns()
+        res = funcion(*a)
+        hist.registrar(time.perf_counter_ns() - t0)
+    return res
+
+
+def medir_consultas(r: Redis, repeticiones: int = 100, repeticiones_scan: int = 3,
+                    minutos: int = 10, k: int = 10) -> list:
+    """Latencia de cada consulta con índices y con el recorrido completo.
+    Las versiones que recorren el stream se repiten menos (son O(eventos)).
+    Devuelve dicts con consulta, metodo, hist, resultado y coincide (si da
+    lo mismo que el recorrido completo)."""
+    hasta = ultimo_ms(r)
+    desde = (hasta // 60000 - minutos + 1) * 60000
+    usuarios = r.zrandmember(USUARIOS, repeticiones) or []
+    if not usuarios:
+        print("No hay índices: correr la ingesta con --indexar.")
+        return []
+
+    casos = [
+        ("eventos_usuario", [
+            ("indice", eventos_usuario_indice, [(r, u) for u in usuarios]),
+            ("scan", eventos_usuario_scan, [(r, u) for u in usuarios[:repeticiones_scan]]),
+        ]),
+        ("eventos_por_tipo", [
+            ("indice", eventos_por_tipo_indice, [(r,)] * repeticiones),
+            ("scan", eventos_por_tipo_scan, [(r,)] * repeticiones_scan),
+        ]),
+        (f"top{k}_ultimos_{minutos}min", [
+            ("indice", top_ventana_indice, [(r, desde, hasta, k)] * repeticiones),
+            ("rango", top_ventana_rango, [(r, desde, hasta, k)] * repeticiones),
+            ("scan", top_ventana_scan, [(r, desde, hasta, k)] * repeticiones_scan),
+        ]),
+        (f"eventos_ultimos_{minutos}min", [
+            ("rango", eventos_ventana_rango, [(r, desde, hasta)] * repeticiones),
+            ("scan", eventos_ventana_scan, [(r, desde, hasta)] * repeticiones_scan),
+        ]),
+    ]
+    filas = []
+    for consulta, metodos in casos:
+        resultados = {}
+        for metodo, funcion, argumentos in metodos:
+            hist = Histograma()
+            # Para comparar con el scan, todos los métodos terminan con el mismo argumento
+            argumentos = argumentos[:-1] + [metodos[-1][2][-1]]
+            resultados[metodo] = _medir(funcion, argumentos, hist)
+            filas.append({"consulta": consulta, "metodo": metodo, "hist": hist})
+            print(f"{consulta} ({metodo}, {len(argumentos)} veces): {hist}")
+        for fila in filas[-len(metodos):]:
+            res = resultados[fila["metodo"]]
+            if isinstance(res, list):
+                # Empates en el top-k: se comparan las cantidades, no los usuarios
+                iguales = [n for _, n in res] == [n for _, n in resultados["scan"]]
+            else:
+                iguales = res == resultados["scan"]
+            fila["resultado"] = len(res) if isinstance(res, (list, dict)) else res
+            fila["coincide"] = "si" if iguales else "no"
+    return filas
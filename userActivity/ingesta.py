@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+"""
+Pipeline de ingesta de GH Archive hacia user_activity_stream.
+
+Etapas:
+  1. procesos decodificadores: gunzip + json.loads + proyección de
+     (actor.login, type, created_at), en chunks hacia una cola acotada;
+  2. un despachador en el proceso principal que reparte los chunks;
+  3. hilos escritores que hacen XADD en pipelines.
+Así la latencia medida (solo el execute() del pipeline) no se mezcla con el
+parseo, que es CPU-bound y corre en otros núcleos.
+
+Con la cache columnar (comun/cache_columnar.py) cada archivo se parsea una
+sola vez: las corridas siguientes leen los eventos proyectados directamente
+de disco y la etapa 1 no hace falta.
+
+Con `ids` (indices.IdsPorFecha) cada XADD lleva un id derivado de created_at
+y va acompañado de la actualización de los índices (userActivity/indices.py).
+Con `retencion` (userActivity/retencion.py) el XADD lleva el recorte inline.
+"""
+
+import glob
+import gzip
+import json
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+
+from redis import Redis, RedisError
+
+import indices
+from comun import cache_columnar, conexion
+from comun.histograma import Histograma
+
+STREAM = "user_activity_stream"
+# Parámetros de la cache de eventos: subir el formato cuando cambian las
+# columnas, así las caches viejas se regeneran en lugar de reusarse
+PARAMETROS_CACHE = {"formato": 2}
+
+
+def resolver_archivos(ruta: str) -> list:
+    """Acepta un .json.gz, un directorio con archivos horarios o un patrón glob."""
+    if os.path.isdir(ruta):
+        return sorted(glob.glob(os.path.join(ruta, "*.json.gz")))
+    if any(c in ruta for c in "*?["):
+        return sorted(glob.glob(ruta))
+    return [ruta] if os.path.isfile(ruta) else []
+
+
+def proyectar(linea: str):
+    """Devuelve (user, type, created_at) de un evento o None si le falta algo."""
+    evt = json.loads(linea)
+    user = evt.get("actor", {}).get("login")
+    tipo = evt.get("type")
+    ts = evt.get("created_at")
+    if not (user and tipo and ts):
+        return None
+    return user, tipo, ts
+
+
+def _construir_eventos(ruta: str):
+    """Proyecta los eventos válidos de un .json.gz (user, type, created_at)."""
+    users, tipos, fechas = [], [], []
+    with gzip.open(ruta, "rt") as f:
+        for linea in f:
+            try:
+                evt = proyectar(linea)
+            except ValueError:
+                continue
+            if evt:
+                users.append(evt[0])
+                tipos.append(evt[1])
+                fechas.append(evt[2])
+    return {"user": users, "type": tipos, "created_at": fechas}, {}
+
+
+def tabla_eventos(ruta: str):
+    return cache_columnar.obtener("stream", [ruta], PARAMETROS_CACHE,
+                                  lambda: _construir_eventos(ruta))
+
+
+def _generar_cache(ruta: str) -> str:
+    return tabla_eventos(ruta).directorio
+
+
+def preparar_cache(archivos: list, procesos: int = 4, cantidad: int = 0) -> list:
+    """Devuelve una TablaColumnar por archivo, generando en paralelo (un
+    proceso por archivo) las caches que falten. Con `cantidad` > 0 se corta
+    en cuanto las tablas ya tienen esa cantidad de eventos."""
+    tablas = []
+    eventos = 0
+    for i in range(0, len(archivos), max(1, procesos)):
+        grupo = archivos[i:i + max(1, procesos)]
+        faltantes = [a for a in grupo if not os.path.isdir(
+            cache_columnar.ruta_cache("stream", [a], PARAMETROS_CACHE))]
+        if len(faltantes) > 1:
+            with mp.Pool(len(faltantes)) as pool:
+                pool.map(_generar_cache, faltantes)
+        for ruta in grupo:
+            tablas.append(tabla_eventos(ruta))
+            eventos += len(tablas[-1])
+        if 0 < cantidad <= eventos:
+            break
+    return tablas
+
+
+def chunks_cache(tablas: list, cantidad: int = 0, tam_chunk: int = 5000,
+                 duracion: float = 0):
+    """Chunks de (user, type, created_at) leídos de la cache. Como en la
+    ingesta serial y el cupo del pipeline, `cantidad` cuenta eventos válidos
+    (<= 0 lee todo).
+    Con `duracion` > 0 repite la pasada hasta que pasan esos segundos (ingesta
+    sostenida): cada repetición corre created_at lo que abarca la pasada, así
+    las fechas (y los ids y ventanas que salen de ellas) siguen creciendo."""
+    if duracion <= 0:
+        yield from _pasada_cache(tablas, cantidad, tam_chunk)
+        return
+    fin = time.time() + duracion
+    desfase = 0
+    primero = ultimo = None
+    while True:
+        for chunk in _pasada_cache(tablas, cantidad, tam_chunk):
+            if not chunk:
+                continue
+            if desfase == 0:
+                ms = indices.ms_de(chunk[0][2])
+                primero = ms if primero is None else min(primero, ms)
+                ultimo = max(ultimo or 0, indices.ms_de(chunk[-1][2]))
+            else:
+                chunk = [(user, tipo, indices.fecha_de(indices.ms_de(ts) + desfase))
+                         for user, tipo, ts in chunk]
+            yield chunk
+            if time.time() >= fin:
+                return
+        if primero is None:
+            return
+        desfase += ultimo - primero + 1000
+
+
+def _pasada_cache(tablas: list, cantidad: int, tam_chunk: int):
+    restante = cantidad if cantidad > 0 else float("inf")
+    for tabla in tablas:
+        if restante <= 0:
+            break
+        k = int(min(len(tabla), restante))
+        restante -= k
+        for a in range(0, k, tam_chunk):
+            b = min(a + tam_chunk, k)
+            yield list(zip(tabla["user"].rebanada(a, b), tabla["type"].rebanada(a, b),
+                           tabla["created_at"].rebanada(a, b)))
+
+
+def _decodificador(archivos, salida, tam_chunk: int, detener):
+    """Proceso decodificador: toma archivos de la cola `archivos` hasta
+    recibir None y pone chunks de eventos proyectados en `salida`."""
+    while True:
+        ruta = archivos.get()
+        if ruta is None:
+            break
+        chunk = []
+        with gzip.open(ruta, "rt") as f:
+            for linea in f:
+                if detener.is_set():
+                    break
+                try:
+                    evt = proyectar(linea)
+                except ValueError:
+                    continue
+                if evt:
+                    chunk.append(evt)
+                if len(chunk) >= tam_chunk:
+                    salida.put(chunk)
+                    chunk = []
+        if chunk and not detener.is_set():
+            salida.put(chunk)
+    salida.put(None)  # este decodificador terminó
+
+
+class _Cupo:
+    """Reparte el límite de eventos entre los escritores."""
+
+    def __init__(self, limite: int):
+        self.lock = threading.Lock()
+        self.restante = limite if limite > 0 else float("inf")
+        self.cargados = 0
+
+    def tomar(self, n: int) -> int:
+        with self.lock:
+            n = int(min(n, self.restante))
+            self.restante -= n
+            return n
+
+    def sumar(self, n: int):
+        with self.lock:
+            self.cargados += n
+
+
+def _escritor(opciones: dict, entrada: queue.Queue, lote_xadd: int,
+              cupo: _Cupo, hist: Histograma, lock_lat: threading.Lock,
+              ids: indices.IdsPorFecha = None, retencion=None):
+    r = conexion.conectar(opciones)
+    pipe = r.pipeline(transaction=False)
+    propias = Histograma()
+    por_evento = 1 if ids is None else 1 + indices.COMANDOS
+    while True:
+        chunk = entrada.get()
+        if chunk is None:
+            break
+        chunk = chunk[:cupo.tomar(len(chunk))]
+        for i in range(0, len(chunk), lote_xadd):
+            lote = chunk[i:i + lote_xadd]
+            for user, tipo, ts in lote:
+                indices.encolar(pipe, user, tipo, ts, ids, retencion)
+            t0 = time.perf_counter_ns()
+            try:
+                res = pipe.execute(raise_on_error=False)
+            except RedisError:
+                continue
+            propias.registrar(time.perf_counter_ns() - t0)
+            cupo.sumar(sum(1 for x in res[::por_evento] if not isinstance(x, RedisError)))
+    with lock_lat:
+        hist.combinar(propias)
+
+
+def producir_pipeline(r: Redis, archivos: list, cantidad: int, decodificadores: int = 4,
+                      escritores: int = 2, lote_xadd: int = 100, tam_chunk: int = 5000,
+                      max_chunks: int = 64, tablas: list = None,
+                      ids: indices.IdsPorFecha = None, retencion=None, duracion: float = 0):
+    """Ingesta con decodificadores en procesos y escritores con pipelines.
+    Si se pasan `tablas` (cache columnar) los chunks salen de ahí y no se
+    levantan decodificadores. `cantidad` <= 0 carga todos los eventos; con
+    `duracion` (requiere `tablas`) se repite la pasada de `cantidad` eventos
+    durante esos segundos (ver chunks_cache).
+    Con `ids` (o una retención con ids propios) hay un solo escritor y, sin
+    cache, un solo decodificador: los ids explícitos tienen que llegar en
+    orden y varios decodificadores mezclan los chunks de distintos archivos.
+    Devuelve (histograma de latencias por pipeline, eventos cargados, duración)."""
+    opciones = conexion.opciones_de(r)
+    if ids is not None or getattr(retencion, "ids", None) is not None:
+        escritores = 1
+        if tablas is None:
+            decodificadores = 1
+
+    entrada = queue.Queue(maxsize=max_chunks)
+    # Con duración el límite es el tiempo; `cantidad` solo acota cada pasada
+    cupo = _Cupo(0 if duracion > 0 else cantidad)
+    hist = Histograma()
+    lock_lat = threading.Lock()
+
+    inicio = time.time()
+    procesos = []
+    if tablas is None:
+        cola_archivos = mp.Queue()
+        for ruta in archivos:
+            cola_archivos.put(ruta)
+        for _ in range(decodificadores):
+            cola_archivos.put(None)
+        salida = mp.Queue(maxsize=max_chunks)
+        detener = mp.Event()
+        procesos = [mp.Process(target=_decodificador,
+                               args=(cola_archivos, salida, tam_chunk, detener))
+                    for _ in range(decodificadores)]
+    for p in procesos:
+        p.start()
+    hilos = [threading.Thread(target=_escritor,
+                              args=(opciones, entrada, lote_xadd, cupo, hist, lock_lat, ids,
+                                    retencion))
+             for _ in range(escritores)]
+    for h in hilos:
+        h.start()
+
+    # Despachador: reparte chunks hasta que terminan todos los decodificadores.
+    # Al llegar al límite sigue drenando la cola para que ningún proceso quede
+    # bloqueado en put().
+    terminados = 0
+    ultimo_aviso = 0
+    fuente = None
+    if tablas is not None:
+        fuente = iter(chunks_cache(tablas, cantidad if duracion > 0 else 0, tam_chunk, duracion))
+    while terminados < len(procesos) or fuente is not None:
+        chunk = next(fuente, None) if fuente is not None else salida.get()
+        if chunk is None:
+            if fuente is not None:
+                break
+            terminados += 1
+            continue
+        if cupo.restante <= 0:
+            if fuente is not None:
+                break
+            detener.set()
+            continue
+        entrada.put(chunk)
+        if cupo.cargados // 100000 > ultimo_aviso:
+            ultimo_aviso = cupo.cargados // 100000
+            print(f"Cargados {ultimo_aviso * 100000} eventos... ({time.time() - inicio:.1f}s)")
+
+    for _ in hilos:
+        entrada.put(None)
+    for h in hilos:
+        h.join()
+    for p in procesos:
+        p.join()
+
+    return hist, cupo.cargados, time.time() - inicio
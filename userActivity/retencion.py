@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+Retención acotada de user_activity_stream.
+
+Sin retención el stream crece con cada evento y a 1M de eventos ocupa buena
+parte de los 100mb de la matriz. Con una política de retención se modela el
+estado estacionario:
+
+  maxlen  se quedan las últimas `limite` entradas
+  minid   se quedan las entradas de los últimos `ventana_min` minutos según
+          created_at (los ids salen de created_at, como con --indexar)
+
+El recorte puede ser exacto (=, borra justo hasta el límite) o aproximado
+(~, Redis solo borra nodos enteros del radix tree: más barato pero deja
+algunas entradas de más), e ir en cada XADD (inline) o en un XTRIM que corre
+un hilo cada `cada_s` segundos (periodica).
+
+El hilo además muestrea used_memory, XLEN y el tamaño de RDB/AOF durante la
+ingesta: la meseta de memoria es la mediana de used_memory en la segunda
+mitad de la corrida.
+"""
+
+import csv
+import os
+import threading
+import time
+
+import redis
+from redis import Redis
+
+import indices
+from comun.histograma import Histograma
+from comun.instrumentacion import cliente_como, tamanio_persistencia
+
+ESTRATEGIAS = ["ninguna", "maxlen", "minid"]
+APLICACIONES = ["inline", "periodica"]
+
+
+class Retencion:
+    """Política de retención: qué agrega a cada XADD y qué XTRIM corre el
+    hilo periódico. Con minid lleva el created_at más nuevo visto, que es el
+    que corre la ventana."""
+
+    def __init__(self, estrategia: str = "maxlen", limite: int = 100_000,
+                 ventana_min: float = 60, exacto: bool = False,
+                 aplicacion: str = "inline", cada_s: float = 1.0,
+                 ids: indices.IdsPorFecha = None):
+        self.estrategia = estrategia
+        self.limite = limite
+        self.ventana_ms = int(ventana_min * 60_000)
+        self.exacto = exacto
+        self.aplicacion = aplicacion
+        self.cada_s = cada_s
+        # Ids por fecha propios (minid sin --indexar); con --indexar los pone encolar()
+        self.ids = ids
+        self.lock = threading.Lock()
+        self.ultimo_ms = 0
+
+    def _recorte(self, ms: int) -> dict:
+        if self.estrategia == "maxlen":
+            return {"maxlen": self.limite, "approximate": not self.exacto}
+        if self.estrategia == "minid":
+            return {"minid": max(0, ms - self.ventana_ms), "approximate": not self.exacto}
+        return {}
+
+    def opciones_xadd(self, ts: str) -> dict:
+        """Argumentos extra del XADD del evento con created_at `ts`."""
+        opciones = {"id": self.ids.siguiente(ts)} if self.ids is not None else {}
+        if self.estrategia != "minid":
+            return {**opciones, **(self._recorte(0) if self.aplicacion == "inline" else {})}
+        ms = indices.ms_de(ts)
+        with self.lock:
+            self.ultimo_ms = max(self.ultimo_ms, ms)
+        if self.aplicacion == "inline":
+            opciones.update(self._recorte(ms))
+        return opciones
+
+    def recortar(self, r: Redis) -> int:
+        """XTRIM con la política (el hilo periódico). Devuelve las entradas borradas."""
+        if self.estrategia == "ninguna" or (self.estrategia == "minid" and not self.ultimo_ms):
+            return 0
+        return r.xtrim(indices.STREAM, **self._recorte(self.ultimo_ms))
+
+    def columnas(self) -> dict:
+        return {
+            "retencion": self.estrategia,
+            "retencion_limite": (self.limite if self.estrategia == "maxlen" else
+                                 self.ventana_ms // 60_000 if self.estrategia == "minid" else ""),
+            "retencion_exacta": "si" if self.exacto else "no",
+            "retencion_aplicacion": self.aplicacion,
+            "retencion_cada_s": self.cada_s if self.aplicacion == "periodica" else "",
+        }
+
+    def describir(self) -> str:
+        if self.estrategia == "ninguna":
+            return "sin recorte (solo se muestrea)"
+        limite = (f"MAXLEN {'=' if self.exacto else '~'} {self.limite}"
+                  if self.estrategia == "maxlen" else
+                  f"MINID {'=' if self.exacto else '~'} created_at - {self.ventana_ms // 60_000} min")
+        return limite + (" en cada XADD" if self.aplicacion == "inline"
+                         else f" con XTRIM cada {self.cada_s}s")
+
+
+class MonitorRetencion(threading.Thread):
+    """Hilo que cada `retencion.cada_s` segundos corre el XTRIM (si la
+    aplicación es periódica) y anota used_memory, XLEN y RDB/AOF en `ruta`."""
+
+    CAMPOS = ["t_s", "used_memory", "xlen", "rdb_bytes", "aof_bytes", "recortados", "xtrim_ms"]
+
+    def __init__(self, r: Redis, retencion: Retencion, redis_dir: str, ruta: str):
+        super().__init__(daemon=True)
+        self.r = cliente_como(r)
+        self.retencion = retencion
+        self.redis_dir = redis_dir
+        self.ruta = ruta
+        self.hist = Histograma()
+        self.recortados = 0
+        self.filas = []
+        self._detener = threading.Event()
+
+    def _muestra(self, t0: float):
+        recortados, ms = 0, ""
+        if self.retencion.aplicacion == "periodica":
+            t = time.perf_counter_ns()
+            try:
+                recortados = self.retencion.recortar(self.r)
+            except redis.RedisError:
+                pass
+            else:
+                ns = time.perf_counter_ns() - t
+                self.hist.registrar(ns)
+                ms = round(ns / 1e6, 3)
+                self.recortados += recortados
+        try:
+            memoria, xlen = self.r.info("memory")["used_memory"], self.r.xlen(indices.STREAM)
+        except redis.RedisError:
+            memoria, xlen = "", ""
+        rdb, aof = tamanio_persistencia(self.redis_dir)
+        return [round(time.time() - t0, 3), memoria, xlen, rdb, aof, recortados, ms]
+
+    def run(self):
+        t0 = time.time()
+        with open(self.ruta, "w", newline="") as f:
+            w = csv.writer(f)
+            w.writerow(self.CAMPOS)
+            while not self._detener.is_set():
+                fila = self._muestra(t0)
+                w.writerow(fila)
+                self.filas.append(fila)
+                self._detener.wait(self.retencion.cada_s)
+
+    def detener(self):
+        self._detener.set()
+        self.join()
+
+    def columnas(self) -> dict:
+        """Resumen de la serie: picos, meseta de memoria (mediana de la segunda
+        mitad) y latencia de los XTRIM periódicos."""
+        def serie(campo):
+            i = self.CAMPOS.index(campo)
+            return [fila[i] for fila in self.filas if fila[i] != ""]
+
+        memoria, xlen = serie("used_memory"), serie("xlen")
+        segunda = sorted(memoria[len(memoria) // 2:])
+        cols = {
+            **self.retencion.columnas(),
+            "memoria_max": max(memoria, default=""),
+            "memoria_meseta": segunda[len(segunda) // 2] if segunda else "",
+            "xlen_max": max(xlen, default=""),
+            "rdb_max_bytes": max(serie("rdb_bytes"), default=""),
+            "aof_max_bytes": max(serie("aof_bytes"), default=""),
+            "serie_retencion": os.path.relpath(self.ruta),
+        }
+        if self.retencion.aplicacion == "periodica":
+            cols.update({"xtrim_ops": self.hist.total, "recortados_xtrim": self.recortados,
+                         **self.hist.columnas_csv("xtrim")})
+        return cols
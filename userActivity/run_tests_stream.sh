@@ -37,6 +37,57 @@ REDIS_PERSISTENCE_DIR="/Users/adelinacurbelo/Documents/bdnr-2025/bdnr-pruebas/pe
 PYTHON_SCRIPT_STREAM="/Users/adelinacurbelo/Documents/bdnr-2025/bdnr-pruebas/test_stream.py"
 GZ_PATH="/Users/adelinacurbelo/Documents/bdnr-2025/bdnr-pruebas/2025-06-01-15.json.gz"
 
+# Consumer group: consumidores concurrentes (0 = solo inserción), COUNT y lote de XACK
+CONSUMERS="${CONSUMERS:-0}"
+READ_COUNT="${READ_COUNT:-100}"
+ACK_BATCH="${ACK_BATCH:-100}"
+
+# Ingesta: GZ_PATH puede ser un directorio con un día de archivos horarios.
+# DECODERS=0 mantiene la ingesta serial original.
+DECODERS="${DECODERS:-0}"
+WRITERS="${WRITERS:-2}"
+XADD_BATCH="${XADD_BATCH:-100}"
+
+# Índices por usuario/minuto/tipo e ids derivados de created_at (INDEX=1);
+# QUERIES > 0 mide las consultas contra el recorrido completo del stream.
+INDEX="${INDEX:-0}"
+QUERIES="${QUERIES:-100}"
+INDEX_ARGS=()
+if [[ "$INDEX" == "1" ]]; then
+  INDEX_ARGS=(--indexar --consultas "$QUERIES")
+fi
+
+# Retención del stream (userActivity/retencion.py): RETENTION=maxlen|minid|ninguna
+# con RETENTION_LIMIT (entradas), RETENTION_WINDOW (minutos de created_at),
+# RETENTION_EXACT=1 (= en vez de ~) y RETENTION_APPLY=inline|periodica.
+# maxlen y minid recortan el stream: no se combinan con CONSUMERS > 0.
+# DURATION_MIN > 0 repite la pasada durante esos minutos (ingesta sostenida).
+RETENTION="${RETENTION:-}"
+RETENTION_LIMIT="${RETENTION_LIMIT:-100000}"
+RETENTION_WINDOW="${RETENTION_WINDOW:-60}"
+RETENTION_EXACT="${RETENTION_EXACT:-0}"
+RETENTION_APPLY="${RETENTION_APPLY:-inline}"
+DURATION_MIN="${DURATION_MIN:-0}"
+RETENTION_ARGS=(--duracion-min "$DURATION_MIN")
+if [[ -n "$RETENTION" ]]; then
+  RETENTION_ARGS+=(--retencion "$RETENTION" --retencion-limite "$RETENTION_LIMIT"
+                   --retencion-ventana-min "$RETENTION_WINDOW"
+                   --retencion-aplicacion "$RETENTION_APPLY")
+  if [[ "$RETENTION_EXACT" == "1" ]]; then
+    RETENTION_ARGS+=(--retencion-exacta)
+  fi
+fi
+
+# Conexión del cliente (comun/conexion.py). El contenedor escucha también en un
+# socket Unix dentro del directorio de persistencia (TRANSPORT=unix).
+TRANSPORT="${TRANSPORT:-tcp}"
+RESP="${RESP:-2}"
+PARSER="${PARSER:-auto}"
+DECODE="${DECODE:-si}"
+CONN="${CONN:-pool}"
+CONN_ARGS=(--transporte "$TRANSPORT" --socket "$REDIS_PERSISTENCE_DIR/redis.sock"
+           --resp "$RESP" --parser "$PARSER" --decodificar "$DECODE" --conexiones "$CONN")
+
 mkdir -p "$REDIS_PERSISTENCE_DIR"
 
 for mode in "${!PERSISTENCE_MODES_CMDS[@]}"; do
@@ -47,7 +98,7 @@ for mode in "${!PERSISTENCE_MODES_CMDS[@]}"; do
 
       docker rm -f redis-bdnr-ranking >/dev/null 2>&1 || true
 
-      docker run -d         --name redis-bdnr-ranking         -v "$REDIS_PERSISTENCE_DIR":/data         -p 6380:6379         redis:7.4         redis-server --dir /data --dbfilename dump.rdb
+      docker run -d         --name redis-bdnr-ranking         -v "$REDIS_PERSISTENCE_DIR":/data         -p 6380:6379         redis:7.4         redis-server --dir /data --dbfilename dump.rdb --unixsocket /data/redis.sock --unixsocketperm 777
 
       for cmdVar in ${PERSISTENCE_MODES_CMDS[$mode]}; do
         declare -n arr="$cmdVar"
@@ -65,7 +116,7 @@ for mode in "${!PERSISTENCE_MODES_CMDS[@]}"; do
       docker exec redis-bdnr-ranking redis-cli FLUSHALL
 
       echo "  -> Ejecutando benchmark con test_stream.py"
-      python3 "$PYTHON_SCRIPT_STREAM"         "$GZ_PATH"         "$mode"         "$policy"         "$size"         "$REDIS_PERSISTENCE_DIR"         "$RESULTS_FILE"
+      python3 "$PYTHON_SCRIPT_STREAM"         "$GZ_PATH"         "$mode"         "$policy"         "$size"         "$REDIS_PERSISTENCE_DIR"         "$RESULTS_FILE"         --consumidores "$CONSUMERS"         --count "$READ_COUNT"         --lote-ack "$ACK_BATCH"         --decodificadores "$DECODERS"         --escritores "$WRITERS"         --lote-xadd "$XADD_BATCH" "${INDEX_ARGS[@]}" "${RETENTION_ARGS[@]}" "${CONN_ARGS[@]}"
 
       docker exec redis-bdnr-ranking redis-cli SAVE
     done
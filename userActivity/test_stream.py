@@ -3,174 +3,379 @@
 Script para benchmarkear inserciones en un Stream de Redis y registrar las métricas.
 """
 
+import argparse
 import gzip
 import json
 import time
 import sys
-import csv
 import os
 from datetime import datetime
 from redis import Redis, RedisError
 
-def esperar_bgsave(r, timeout=60.0, interval=0.5):
-    """Espera a que finalice un BGSAVE previo y lanza otro para asegurar
-    que haya un snapshot RDB actualizado."""
-    start = time.time()
-    while True:
-        if r.info("persistence").get("rdb_bgsave_in_progress", 0) == 0:
-            break
-        if time.time() - start > timeout:
-            print("WARNING: timeout esperando fin de BGSAVE previo")
-            return False
-        time.sleep(interval)
-
-    r.bgsave()
-
-    while True:
-        if r.info("persistence").get("rdb_bgsave_in_progress", 0) == 0:
-            break
-        if time.time() - start > timeout:
-            print("WARNING: timeout esperando BGSAVE")
-            return False
-        time.sleep(interval)
-    return True
-
-
-def medir_metricas(r: Redis, redis_dir: str, modo: str):
-    """Fuerza persistencia y devuelve estadísticas de uso de disco/RAM."""
-    if modo.startswith("rdb") or modo == "mixto":
-        esperar_bgsave(r)
-    if modo.startswith("aof") or modo == "mixto":
-        # Iniciar un BGREWRITEAOF para consolidar ficheros.
-        start = time.time()
-        while r.info("persistence").get("aof_rewrite_in_progress", 0) == 1:
-            if time.time() - start > 30:
-                print("WARNING: timeout esperando fin de AOF rewrite previo")
-                break
-            time.sleep(0.1)
-        r.bgrewriteaof()
-        start = time.time()
-        while r.info("persistence").get("aof_rewrite_in_progress", 0) == 1:
-            if time.time() - start > 30:
-                print("WARNING: timeout esperando nuevo AOF rewrite")
-                break
-            time.sleep(0.1)
-
-    mem = r.info("memory")
-    stats = r.info("stats")
-    evicted_keys = stats.get("evicted_keys", 0)
-
-    # Tamaño RDB
-    rdb_path = os.path.join(redis_dir, "dump.rdb")
-    rdb_bytes = os.path.getsize(rdb_path) if os.path.exists(rdb_path) else 0
-
-    # Tamaño AOF (archivos modulares incluidos)
-    aof_bytes = 0
-    main_aof = os.path.join(redis_dir, "appendonly.aof")
-    if os.path.exists(main_aof):
-        aof_bytes += os.path.getsize(main_aof)
-    append_dir = os.path.join(redis_dir, "appendonlydir")
-    if os.path.isdir(append_dir):
-        for fname in os.listdir(append_dir):
-            if fname.startswith("appendonly.aof"):
-                aof_bytes += os.path.getsize(os.path.join(append_dir, fname))
-
-    return {
-        "evicted_keys": evicted_keys,
-        "rdb_bytes": rdb_bytes,
-        "aof_bytes": aof_bytes,
-    }
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from comun import conexion, perfilado
+from comun.histograma import Histograma
+from comun.instrumentacion import (columnas_keyspace, columnas_muestreo, contadores_keyspace,
+                                   fraccion, iniciar_muestreo, medir_metricas, ruta_serie)
+from comun.resultados import escribir_fila
 
+import indices
+from consumidores import GRUPO, EstadoConsumo, crear_grupo, lanzar_consumidores
+from ingesta import chunks_cache, preparar_cache, producir_pipeline, resolver_archivos
+from retencion import APLICACIONES, ESTRATEGIAS, MonitorRetencion, Retencion
 
 def guardar_csv(path: str, datos: dict, modo: str, politica: str, dataset: int,
-                p50: float, p99: float, thr: float):
-    header = [
-        "fecha", "modo", "politica", "dataset", "lat_p50_ms", "lat_p99_ms",
-        "throughput", "rdb_bytes", "aof_bytes", "evicted_keys",
-    ]
-    existe = os.path.isfile(path)
-    with open(path, "a", newline="") as f:
-        w = csv.writer(f)
-        if not existe:
-            w.writerow(header)
-        w.writerow([
-            datetime.now().isoformat(), modo, politica, dataset,
-            f"{p50:.3f}", f"{p99:.3f}", f"{thr:.1f}",
-            datos["rdb_bytes"], datos["aof_bytes"], datos["evicted_keys"],
-        ])
+                hist: Histograma, thr: float, extra: dict = None):
+    fila = {
+        "fecha": datetime.now().isoformat(), "modo": modo, "politica": politica,
+        "dataset": dataset, **hist.columnas_csv("lat"),
+        "throughput": f"{thr:.1f}", "rdb_bytes": datos["rdb_size"],
+        "aof_bytes": datos["aof_size"], "evicted_keys": datos["evicted_keys"],
+    }
+    fila.update(extra or {})
+    escribir_fila(path, fila)
+
+
+def producir_serial(r: Redis, archivos: list, cantidad: int, hist: Histograma = None,
+                    tablas: list = None, ids: indices.IdsPorFecha = None,
+                    retencion: Retencion = None, duracion: float = 0):
+    """Ingesta original en un solo hilo: gunzip, json.loads y XADD de a un
+    evento. `cantidad` cuenta eventos válidos enviados a Redis, como el cupo
+    de la ingesta en pipeline (<= 0 lee todo). Con `ids` cada
+    evento es un pipeline con el XADD (id derivado de created_at) y los índices.
+    Con `retencion` el XADD lleva el recorte inline; con `duracion` (solo con
+    la cache) la pasada se repite durante esos segundos.
+    Devuelve (histograma de latencias, eventos cargados, duración)."""
+    if cantidad <= 0:
+        cantidad = float("inf")
+    hist = hist if hist is not None else Histograma()
+    cargados = 0
+    enviados = 0
+    inicio = time.time()
+
+    if tablas is not None:
+        # Eventos ya proyectados desde la cache columnar: solo queda el XADD
+        for chunk in chunks_cache(tablas, cantidad, duracion=duracion):
+            for user, tipo, ts in chunk:
+                t0 = time.perf_counter_ns()
+                try:
+                    if ids is None:
+                        indices.encolar(r, user, tipo, ts, None, retencion)
+                    else:
+                        pipe = r.pipeline(transaction=False)
+                        indices.encolar(pipe, user, tipo, ts, ids, retencion)
+                        pipe.execute()
+                except RedisError:
+                    continue
+                hist.registrar(time.perf_counter_ns() - t0)
+                cargados += 1
+                if cargados % 100000 == 0:
+                    print(f"Cargados {cargados} eventos... ({time.time() - inicio:.1f}s)")
+        return hist, cargados, time.time() - inicio
+
+    for archivo_gz in archivos:
+        with gzip.open(archivo_gz, "rt") as f:
+            for linea in f:
+                if enviados >= cantidad:
+                    break
+                try:
+                    evt = json.loads(linea)
+                    user = evt.get("actor", {}).get("login")
+                    tipo = evt.get("type")
+                    ts   = evt.get("created_at")
+                    if not (user and tipo and ts):
+                        continue
+
+                    enviados += 1
+                    t0 = time.perf_counter_ns()
+                    if ids is None:
+                        indices.encolar(r, user, tipo, ts, None, retencion)
+                    else:
+                        pipe = r.pipeline(transaction=False)
+                        indices.encolar(pipe, user, tipo, ts, ids, retencion)
+                        pipe.execute()
+                    hist.registrar(time.perf_counter_ns() - t0)
+                    cargados += 1
+                    if cargados % 100000 == 0:
+                        elapsed = time.time() - inicio
+                        print(f"Cargados {cargados} eventos... ({elapsed:.1f}s)")
+                except (ValueError, RedisError):
+                    continue
+
+
+    return hist, cargados, time.time() - inicio
+
 
 def main():
-    if len(sys.argv) != 7:
-        print("Uso: python3 test_stream_metrics.py <archivo_gz> <modo> "
-              "<politica> <cantidad_eventos> <redis_dir> <out_csv>")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(
+        description="Benchmark de inserciones (y lectura con consumer groups) "
+                    "en un Stream de Redis")
+    parser.add_argument("archivo_gz",
+                        help="archivo .json.gz de GH Archive, directorio con archivos "
+                             "horarios o patrón glob")
+    parser.add_argument("modo", help="modo de persistencia (rdb, aof_everysec, aof_always, mixto)")
+    parser.add_argument("politica", help="política de memoria")
+    parser.add_argument("cantidad_eventos", type=int,
+                        help="cantidad de eventos a insertar (0 = todos los archivos)")
+    parser.add_argument("redis_dir", help="directorio de persistencia de Redis")
+    parser.add_argument("out_csv", help="CSV de resultados")
+    parser.add_argument("--consumidores", type=int, default=0,
+                        help="consumidores del consumer group leyendo mientras se inserta "
+                             "(0 = solo inserción)")
+    parser.add_argument("--count", type=int, default=100, help="COUNT de cada XREADGROUP")
+    parser.add_argument("--lote-ack", type=int, default=100, help="entradas por XACK")
+    parser.add_argument("--min-idle-ms", type=int, default=1000,
+                        help="idle mínimo para reclamar pendientes con XAUTOCLAIM")
+    parser.add_argument("--consumidor-caido", action="store_true",
+                        help="agrega un consumidor que lee un lote y se cae sin ack")
+    parser.add_argument("--decodificadores", type=int, default=0,
+                        help="procesos que descomprimen y parsean en paralelo; con la "
+                             "cache columnar solo se usan para generarla "
+                             "(0 = ingesta serial original)")
+    parser.add_argument("--escritores", type=int, default=2,
+                        help="hilos escritores con pipelines de XADD")
+    parser.add_argument("--lote-xadd", type=int, default=100,
+                        help="XADDs por pipeline (la latencia se mide por pipeline)")
+    parser.add_argument("--sin-cache", action="store_true",
+                        help="parsea los .json.gz en cada corrida en lugar de usar la "
+                             "cache columnar de eventos")
+    parser.add_argument("--indexar", action="store_true",
+                        help="ids de entrada derivados de created_at e índices por usuario, "
+                             "minuto y tipo actualizados en la ingesta")
+    parser.add_argument("--consultas", type=int, default=0,
+                        help="(con --indexar) repeticiones de cada consulta indexada; los "
+                             "resultados van a resultados_consultas.csv (0 = no medir)")
+    parser.add_argument("--consultas-scan", type=int, default=3,
+                        help="repeticiones de las consultas que recorren el stream entero")
+    parser.add_argument("--ventana-min", type=int, default=10,
+                        help="minutos de la ventana de las consultas por tiempo")
+    retencion = parser.add_argument_group("retención del stream (retencion.py)")
+    retencion.add_argument("--retencion", choices=ESTRATEGIAS, default=None,
+                           help="maxlen: últimas N entradas; minid: ventana de created_at; "
+                                "ninguna: sin recorte, solo la serie de memoria/XLEN/RDB/AOF "
+                                "(por defecto no se muestrea)")
+    retencion.add_argument("--retencion-limite", type=int, default=100_000,
+                           help="(maxlen) entradas que se conservan")
+    retencion.add_argument("--retencion-ventana-min", type=float, default=60,
+                           help="(minid) minutos de created_at que se conservan")
+    retencion.add_argument("--retencion-exacta", action="store_true",
+                           help="recorte exacto (=) en lugar de aproximado (~)")
+    retencion.add_argument("--retencion-aplicacion", choices=APLICACIONES, default="inline",
+                           help="inline: en cada XADD; periodica: XTRIM desde un hilo")
+    retencion.add_argument("--retencion-cada-s", type=float, default=1.0,
+                           help="segundos entre XTRIM periódicos y entre muestras de la serie")
+    retencion.add_argument("--duracion-min", type=float, default=0,
+                           help="ingesta sostenida: repite la pasada de cantidad_eventos "
+                                "(con created_at corrido) durante estos minutos; usa la cache")
+    conexion.agregar_argumentos(parser)
+    perfilado.agregar_argumentos(parser)
+    parser.add_argument("--sin-rewrite-aof", action="store_true",
+                        help="no consolida el AOF con BGREWRITEAOF al final (el orquestador "
+                             "lo usa para medir la recuperación con el AOF sin reescribir)")
+    parser.add_argument("--intervalo-info", type=float, default=0.1,
+                        help="segundos entre muestras de INFO en segundo plano (0 desactiva)")
+    args = parser.parse_args()
 
-    archivo_gz, modo, politica, cantidad, redis_dir, out_csv = sys.argv[1:]
-    cantidad = int(cantidad)
+    archivo_gz, modo, politica = args.archivo_gz, args.modo, args.politica
+    cantidad, redis_dir, out_csv = args.cantidad_eventos, args.redis_dir, args.out_csv
 
-    if not os.path.isfile(archivo_gz):
+    archivos = resolver_archivos(archivo_gz)
+    if not archivos:
         print("ERROR: archivo .gz inexistente:", archivo_gz)
         sys.exit(1)
     if not os.path.isdir(redis_dir):
         print("ERROR: redis_dir no es un directorio válido:", redis_dir)
         sys.exit(1)
+    if args.duracion_min > 0 and args.sin_cache:
+        print("ERROR: --duracion-min repite la pasada desde la cache de eventos (sin --sin-cache)")
+        sys.exit(1)
+    if args.retencion in ("maxlen", "minid") and args.consumidores > 0:
+        # El objetivo de los consumidores son los eventos cargados: con recorte
+        # las entradas borradas antes de leerlas no llegan nunca
+        print("ERROR: --retencion con recorte no se puede combinar con --consumidores")
+        sys.exit(1)
+    sostenida_s = args.duracion_min * 60
 
-    r = Redis(host="localhost", port=6380, decode_responses=True)
+    tablas = None
+    if not args.sin_cache:
+        t0 = time.time()
+        tablas = preparar_cache(archivos, args.decodificadores or os.cpu_count() or 1, cantidad)
+        print(f"Cache de eventos lista en {time.time() - t0:.2f}s "
+              f"({sum(len(t) for t in tablas)} eventos en {len(tablas)} archivos)")
+
+    r = conexion.conectar(conexion.opciones(args))
+    print(f"Conexión: {conexion.describir(r)}")
 
     # Limpiar stream existente.
     r.delete("user_activity_stream")
+    indices.limpiar(r)
+    ids = indices.IdsPorFecha() if args.indexar else None
+    ret = None
+    if args.retencion:
+        # MINID recorta por id: sin --indexar los ids por fecha los pone la retención
+        ret = Retencion(args.retencion, args.retencion_limite, args.retencion_ventana_min,
+                        args.retencion_exacta, args.retencion_aplicacion, args.retencion_cada_s,
+                        indices.IdsPorFecha() if args.retencion == "minid" and ids is None
+                        else None)
+        print(f"Retención: {ret.describir()}")
+        if ids is not None and args.consultas > 0:
+            print("Con retención los índices cuentan también los eventos recortados: "
+                  "las consultas no van a coincidir con el recorrido del stream.")
+    # Con ids por fecha (--indexar o los de MINID) el id no es el reloj del XADD
+    ids_explicitos = ids is not None or (ret is not None and ret.ids is not None)
+    if ids_explicitos and args.decodificadores > 0:
+        # producir_pipeline fuerza el orden; acá solo se avisa y se anota en el CSV
+        args.escritores = 1
+        if args.sin_cache:
+            args.decodificadores = 1
+        print("Con ids por fecha los ids explícitos van en orden: se usa un solo escritor"
+              + (" y un solo decodificador." if args.sin_cache else "."))
+    muestreador = iniciar_muestreo(r, out_csv, args.intervalo_info,
+                                   "stream", modo, politica, cantidad)
+    perfil = perfilado.iniciar_perfilado(r, out_csv, args.perfilar, args.cprofile,
+                                         args.tracemalloc, "stream", modo, politica, cantidad)
+    monitor = None
+    if ret is not None:
+        monitor = MonitorRetencion(r, ret, redis_dir, ruta_serie(
+            out_csv, "stream", "retencion", modo, politica, cantidad))
+        monitor.start()
+    ks_inicial = contadores_keyspace(r)
 
-    latencias = []
-    cargados = 0
-    inicio = time.time()
+    if args.consumidores > 0:
+        crear_grupo(r)
+        estado = EstadoConsumo()
+        hilos, res_consumo = lanzar_consumidores(
+            r, args.consumidores, estado, count=args.count, lote_ack=args.lote_ack,
+            min_idle_ms=args.min_idle_ms, con_caido=args.consumidor_caido,
+            medir_lag=not ids_explicitos)
+        t_consumo = time.time()
 
-    with gzip.open(archivo_gz, "rt") as f:
-        for i, linea in enumerate(f):
-            if i >= cantidad:
-                break
-            try:
-                evt = json.loads(linea)
-                user = evt.get("actor", {}).get("login")
-                tipo = evt.get("type")
-                ts   = evt.get("created_at")
-                if not (user and tipo and ts):
-                    continue
+    if args.decodificadores > 0:
+        print(f"Ingesta en pipeline: {len(archivos)} archivos, "
+              f"{args.decodificadores} decodificadores, {args.escritores} escritores, "
+              f"lote XADD = {args.lote_xadd}")
+        hist, cargados, duracion = producir_pipeline(
+            r, archivos, cantidad, decodificadores=args.decodificadores,
+            escritores=args.escritores, lote_xadd=args.lote_xadd, tablas=tablas, ids=ids,
+            retencion=ret, duracion=sostenida_s)
+    else:
+        # Los escritores del pipeline combinan sus histogramas al final; solo la
+        # ingesta serial se puede observar en vivo.
+        hist = Histograma()
+        if muestreador:
+            muestreador.observar(hist)
+        hist, cargados, duracion = producir_serial(r, archivos, cantidad, hist, tablas, ids,
+                                                   ret, sostenida_s)
+    if monitor:
+        # La serie cubre solo la ingesta: el BGSAVE/BGREWRITEAOF final no es estado estacionario
+        monitor.detener()
 
-                t0 = time.time()
-                r.xadd("user_activity_stream", {
-                    "user": user,
-                    "type": tipo,
-                    "timestamp": ts,
-                })
-                latencias.append(time.time() - t0)
-                cargados += 1
-                if cargados % 100000 == 0:
-                    elapsed = time.time() - inicio
-                    print(f"Cargados {cargados} eventos... ({elapsed:.1f}s)")
-            except (ValueError, RedisError):
-                continue
-
-    duracion = time.time() - inicio
     if cargados == 0:
         print("No se cargó ningún evento.")
         sys.exit(1)
 
     # Cálculo de métricas de latencia y throughput
-    ms = sorted(l * 1000 for l in latencias)
-    p50 = ms[len(ms)//2]
-    p99 = ms[int(len(ms)*0.99)] if len(ms) > 1 else p50
     throughput = cargados / duracion
 
     print(f"\nInserción terminada: {cargados} eventos en {duracion:.2f}s")
-    print(f"p50 = {p50:.3f} ms | p99 = {p99:.3f} ms | thr = {throughput:.1f} op/s")
+    print(f"{hist} | thr = {throughput:.1f} op/s")
+
+    extra = {
+        "archivos": len(archivos),
+        "decodificadores": args.decodificadores,
+        "escritores": args.escritores if args.decodificadores > 0 else 1,
+        "lote_xadd": args.lote_xadd if args.decodificadores > 0 else 1,
+        "consumidores": args.consumidores,
+        "cache": "no" if args.sin_cache else "si",
+        "indexado": "si" if ids else "no",
+        "aof_rewrite": "no" if args.sin_rewrite_aof else "si",
+        "duracion_min": args.duracion_min or "",
+        **conexion.columnas(r),
+    }
+    if monitor:
+        extra.update(monitor.columnas())
+        print(f"Retención: meseta de memoria {extra['memoria_meseta']} B "
+              f"(máx {extra['memoria_max']}), XLEN máx {extra['xlen_max']}, "
+              f"RDB máx {extra['rdb_max_bytes']} B, AOF máx {extra['aof_max_bytes']} B"
+              + (f" | XTRIM {monitor.hist}" if ret.aplicacion == "periodica" else ""))
+        if ret.ids is not None:
+            extra["ids_corridos"] = ret.ids.corridos
+    if ids is not None:
+        extra["indice_bytes"] = indices.memoria(r)
+        extra["ids_corridos"] = ids.corridos
+        print(f"Índices: {extra['indice_bytes']} bytes | "
+              f"{ids.corridos} eventos fuera de orden corridos al último ms")
+    if args.consumidores > 0:
+        estado.objetivo = cargados
+        estado.esperar(hilos)
+        lags = Histograma()
+        for res in res_consumo:
+            lags.combinar(res["lags"])
+        dt_consumo = (estado.t_ultimo_ack or time.time()) - t_consumo
+        thr_consumo = estado.confirmados / dt_consumo if dt_consumo > 0 else 0
+        reclamados = sum(res["reclamados"] for res in res_consumo)
+        pendientes = r.xpending("user_activity_stream", GRUPO)["pending"]
+        print(f"Consumo: {estado.confirmados} ack | "
+              + ("lag no medido (ids por fecha)" if ids_explicitos else f"lag {lags}")
+              + f" | thr = {thr_consumo:.1f} op/s | "
+              f"reclamados = {reclamados} | pendientes = {pendientes}")
+        extra.update({
+            "consume_throughput": f"{thr_consumo:.1f}",
+            **{col: "" if ids_explicitos else valor
+               for col, valor in lags.columnas_csv("lag").items()},
+            "reclamados": reclamados, "pendientes_final": pendientes,
+        })
+
+    # El stream es una sola clave: si se desaloja se pierde entero y los XADD
+    # siguientes lo recrean, así que lo que sobrevive es lo que queda en XLEN.
+    sobreviven = min(r.xlen("user_activity_stream"), cargados)
+    extra.update(columnas_keyspace(ks_inicial, contadores_keyspace(r)))
+    if ret is not None and ret.estrategia != "ninguna":
+        # Con retención las entradas que faltan son las recortadas a propósito
+        print(f"Retención: quedan {sobreviven}/{cargados} eventos en el stream")
+        extra.update({"retenidos": sobreviven, "sobrevive_eventos": "",
+                      "useful_throughput": f"{throughput:.1f}"})
+    else:
+        if sobreviven < cargados:
+            print(f"Desalojos: quedan {sobreviven}/{cargados} eventos en el stream")
+        extra.update({
+            "sobrevive_eventos": fraccion(sobreviven, cargados),
+            "useful_throughput": f"{sobreviven / duracion:.1f}",
+        })
 
     # Métricas de persistencia / memoria
-    mets = medir_metricas(r, redis_dir, modo)
+    if muestreador:
+        muestreador.fase("persistencia")
+    if perfil:
+        perfil.fase("persistencia")
+    mets = medir_metricas(r, redis_dir, modo, not args.sin_rewrite_aof)
+    if muestreador:
+        muestreador.detener()
+    if perfil:
+        perfil.terminar()
+    extra.update({"memory_used": mets["memory_used"], **columnas_muestreo(muestreador)})
 
     # Persistir resultados
-    guardar_csv(out_csv, mets, modo, politica, cantidad, p50, p99, throughput)
+    guardar_csv(out_csv, mets, modo, politica, cantidad, hist, throughput, extra)
     print("Resultados añadidos en", out_csv)
 
+    if ids is not None and args.consultas > 0:
+        print("=== Consultas: índices vs recorrido completo ===")
+        out_consultas = os.path.join(os.path.dirname(os.path.abspath(out_csv)),
+                                     "resultados_consultas.csv")
+        # Las consultas comparan campos como str: sin decodificar van por un cliente de control
+        rc = r if args.decodificar == "si" else conexion.control(r)
+        for fila in indices.medir_consultas(rc, args.consultas, args.consultas_scan,
+                                            args.ventana_min):
+            escribir_fila(out_consultas, {
+                "fecha": datetime.now().isoformat(), "modo": modo, "politica": politica,
+                "dataset": cantidad, "eventos": cargados, "consulta": fila["consulta"],
+                "metodo": fila["metodo"], "repeticiones": fila["hist"].total,
+                **fila["hist"].columnas_csv("lat"),
+                "resultado": fila["resultado"], "coincide": fila["coincide"],
+            })
+        print("Consultas añadidas en", out_consultas)
+
 
 if __name__ == "__main__":
     main()